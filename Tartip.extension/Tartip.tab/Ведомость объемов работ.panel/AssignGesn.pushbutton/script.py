@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 """Определение ГЭСН для стен по таблице соответствий."""
+import datetime
 import os
 import sys
 from collections import OrderedDict
@@ -15,7 +16,8 @@ if BASE_DIR not in sys.path:
 if LIB_DIR not in sys.path:
     sys.path.append(LIB_DIR)
 
-from lib import config, gesn_rules, spec_keys_cache  # noqa: E402
+from lib import config, gesn_report, gesn_rules, spec_keys_cache  # noqa: E402
+from tartip import gesn_storage, html_report, records, results_window, shared_params, transactions, worksharing, xlsx_writer  # noqa: E402
 
 # Имена используемых параметров
 PARAM_REINFORCEMENT = u"Армирование"
@@ -26,6 +28,34 @@ STAGE_LABEL = (PARAM_STAGE or u"Стадия").lower()
 # Параметры для вывода результата: сначала приоритетный, затем совместимый резервный
 PARAM_GESN_OUTPUT = [u"ACBD_ГЭСН", u"Шифр ГЭСН"]
 
+# Параметры модели, которые читаются/пишутся по имени; GUID общих параметров
+# разрешаются один раз на запуск (см. main)
+LOOKUP_PARAMS = PARAM_GESN_OUTPUT + [PARAM_REINFORCEMENT, PARAM_BRICK_SIZE, PARAM_STAGE, PARAM_STAGE_ALT]
+_PARAMS = None
+
+# Результат обработки одной стены (для отчёта, окна результатов и XLSX)
+WallEntry = records.record_type(
+    "WallEntry",
+    ("id", "cat", "type", "family", "message", "matched",
+     "quantity_text", "multiplier_text", "gesn_text", "gesn_items"),
+    defaults={"matched": False, "quantity_text": u"", "multiplier_text": u"",
+              "gesn_text": u"", "gesn_items": []},
+)
+
+# Колонки окна результатов
+RESULT_COLUMNS = [
+    html_report.Column(u"ID", "id", False),
+    html_report.Column(u"Результат", "text", True),
+    html_report.Column(u"Категория", "text", True),
+    html_report.Column(u"Семейство", "text", True),
+    html_report.Column(u"Тип", "text", True),
+    html_report.Column(u"Кол-во/Объём", "text", False),
+    html_report.Column(u"Кратность ед.изм. ГЭСН", "text", False),
+    html_report.Column(u"Шифр ГЭСН", "text", True),
+    html_report.Column(u"Причина", "text", True),
+    html_report.Column(u"Подробности", "text", False),
+]
+
 # Внутренние системные параметры
 PARAM_UNCONNECTED_HEIGHT = DB.BuiltInParameter.WALL_USER_HEIGHT_PARAM
 PARAM_WIDTH = DB.BuiltInParameter.WALL_ATTR_WIDTH_PARAM
@@ -112,8 +142,16 @@ def _normalize_stage(value):
     return aliases.get(norm, norm)
 
 
+def _lookup_param(element, param_name):
+    """Параметр по GUID общего параметра, при его отсутствии — по имени."""
+
+    if _PARAMS is not None:
+        return _PARAMS.get(element, param_name)
+    return element.LookupParameter(param_name)
+
+
 def _get_parameter_value(element, param_name):
-    param = element.LookupParameter(param_name)
+    param = _lookup_param(element, param_name)
     if not param:
         return None
     if param.StorageType == DB.StorageType.Integer:
@@ -160,12 +198,22 @@ def _get_writable_param(element, names):
     """Возвращает первый доступный параметр из списка имен."""
 
     for name in names:
-        param = element.LookupParameter(name)
+        param = _lookup_param(element, name)
         if param and not param.IsReadOnly:
             return param
     return None
 
 
+def _write_miss(param, reason):
+    """Записывает причину отсутствия ГЭСН (или очищает поле — CLEAR_CODE_WHEN_MISS).
+
+    Структурированный результат прошлого запуска удаляется: он больше не верен.
+    """
+
+    gesn_storage.clear(param.Element)
+    return param.Set(u"" if config.CLEAR_CODE_WHEN_MISS else reason)
+
+
 def _resolve_type_info(wall):
     """Получает тип стены и гарантирует ненулевые имена семейства и типа."""
 
@@ -677,40 +725,33 @@ def _format_input_details(
 def _process_wall(wall, rules):
     """Обработка одной стены и запись результата/причины в параметр."""
 
-    entry = {
-        "id": getattr(getattr(wall, "Id", None), "IntegerValue", None),
-        "cat": _t(getattr(getattr(wall, "Category", None), "Name", u"")),
-        "type": None,
-        "family": None,
-        "message": None,
-        "matched": False,
-        "quantity_text": u"",
-        "multiplier_text": u"",
-        "gesn_text": u"",
-    }
+    entry = WallEntry(
+        id=getattr(getattr(wall, "Id", None), "IntegerValue", None),
+        cat=_t(getattr(getattr(wall, "Category", None), "Name", u"")),
+    )
 
     target_param = _get_writable_param(wall, PARAM_GESN_OUTPUT)
 
     if not target_param:
         # Даже причину записать некуда
-        entry["message"] = u"Нет доступного параметра для записи"
+        entry.message = u"Нет доступного параметра для записи"
         return False, False, entry
 
     wall_type, family_name, type_name = _resolve_type_info(wall)
-    entry["type"] = type_name
-    entry["family"] = family_name
+    entry.type = type_name
+    entry.family = family_name
 
     if wall_type is None:
         reason = u"Не удалось определить тип стены"
-        entry["message"] = reason
-        return target_param.Set(reason), False, entry
+        entry.message = reason
+        return _write_miss(target_param, reason), False, entry
 
     thickness_mm, thickness_found = _get_thickness_mm(wall_type)
     height_mm, height_found = _get_height_mm(wall)
 
-    reinf_param = wall.LookupParameter(PARAM_REINFORCEMENT)
+    reinf_param = _lookup_param(wall, PARAM_REINFORCEMENT)
     reinforcement_text = _normalize_bool_text(_get_parameter_value(wall, PARAM_REINFORCEMENT)) if reinf_param else u""
-    brick_param = wall.LookupParameter(PARAM_BRICK_SIZE)
+    brick_param = _lookup_param(wall, PARAM_BRICK_SIZE)
     brick_size = _normalize_brick_size(_get_parameter_value(wall, PARAM_BRICK_SIZE)) if brick_param else u""
     stage_text, stage_found = _get_stage_value(wall)
 
@@ -732,14 +773,14 @@ def _process_wall(wall, rules):
     if not thickness_found:
         reason = u"Не удалось определить толщину типа"
         full_reason = u"{0} | {1}".format(reason, input_details)
-        entry["message"] = full_reason
-        return target_param.Set(full_reason), False, entry
+        entry.message = full_reason
+        return _write_miss(target_param, full_reason), False, entry
 
     if not height_found:
         reason = u"Не удалось определить высоту стены"
         full_reason = u"{0} | {1}".format(reason, input_details)
-        entry["message"] = full_reason
-        return target_param.Set(full_reason), False, entry
+        entry.message = full_reason
+        return _write_miss(target_param, full_reason), False, entry
 
     matched_rules = _match_rules(
         rules,
@@ -758,8 +799,8 @@ def _process_wall(wall, rules):
             rules,
             wall=wall,
             wall_type=wall_type,
-            family_name=entry["family"],
-            type_name=entry["type"],
+            family_name=entry.family,
+            type_name=entry.type,
             thickness_mm=thickness_mm,
             height_mm=height_mm,
             stage_text=stage_text,
@@ -772,8 +813,8 @@ def _process_wall(wall, rules):
             brick_found=bool(brick_param),
         )
         full_reason = u"{0} | {1}".format(reason, input_details)
-        entry["message"] = full_reason
-        return target_param.Set(full_reason), False, entry
+        entry.message = full_reason
+        return _write_miss(target_param, full_reason), False, entry
 
     def _rule_specificity(rule):
         score = 0
@@ -833,14 +874,15 @@ def _process_wall(wall, rules):
                 "volume_value": volume_value,
                 "unit_label": unit_label or u"",
                 "multiplier": rule.multiplier or 1.0,
+                "rule_id": rule.rule_id,
             }
         )
 
     if not fragments_for_param:
         reason = last_volume_issue or u"Не удалось вычислить объём"
         full_reason = u"{0} | {1}".format(reason, input_details)
-        entry["message"] = full_reason
-        return target_param.Set(full_reason), False, entry
+        entry.message = full_reason
+        return _write_miss(target_param, full_reason), False, entry
 
     unique_fragments = []
     seen_fragments = set()
@@ -900,7 +942,7 @@ def _process_wall(wall, rules):
                     item.get("unit_label") or u"",
                 )
             )
-    entry["quantity_text"] = u"; ".join(qty_parts)
+    entry.quantity_text = u"; ".join(qty_parts)
 
     mult_parts = []
     seen_mult = set()
@@ -915,11 +957,26 @@ def _process_wall(wall, rules):
             continue
         seen_mult.add(mult_str)
         mult_parts.append(mult_str)
-    entry["multiplier_text"] = u"; ".join(mult_parts)
-    entry["gesn_text"] = u"; ".join(unique_fragments)
-
-    entry["matched"] = True
-    entry["message"] = u"{0} | {1}".format(u"; ".join(unique_reports), input_details)
+    entry.multiplier_text = u"; ".join(mult_parts)
+    entry.gesn_text = u"; ".join(unique_fragments)
+    gesn_items = []
+    stored_items = []
+    seen_codes = set()
+    for item in unique_items:
+        multiplier = item.get("multiplier") or 1.0
+        key = (item.get("gesn_code"), round((item.get("volume_value") or 0.0) / multiplier, 6))
+        if key in seen_codes:
+            continue
+        seen_codes.add(key)
+        gesn_items.append(key)
+        stored_items.append(gesn_storage.GesnItem(
+            key[0], key[1], item.get("unit_label"), multiplier, item.get("rule_id")))
+    entry.gesn_items = gesn_items
+
+    entry.matched = True
+    entry.message = u"{0} | {1}".format(u"; ".join(unique_reports), input_details)
+    # Рядом со строкой — те же числа без текстового формата (для ВОР и смет)
+    gesn_storage.write(wall, stored_items, gesn_storage.fingerprint(input_details, entry.quantity_text))
     return target_param.Set(u"; ".join(unique_fragments)), True, entry
 
 
@@ -1063,7 +1120,7 @@ def _get_stage_value(wall):
     """Возвращает нормализованный текст стадии и флаг, что параметр найден."""
 
     for name in (PARAM_STAGE, PARAM_STAGE_ALT, u"Phase Created"):
-        stage_param = wall.LookupParameter(name)
+        stage_param = _lookup_param(wall, name)
         if stage_param:
             stage_value = _normalize_stage(_get_parameter_value(wall, name))
             return stage_value, True
@@ -1111,6 +1168,7 @@ def _prepare_rules():
 
 
 def main():
+    global _PARAMS
     out = script.get_output()
 
     scope_choice = _ask_scope_choice()
@@ -1134,23 +1192,45 @@ def main():
     processed = 0
     updated = 0
     matched = 0
-    entries = []
-
-    with revit.Transaction(u"ТАРТИП: определить ГЭСН"):
-        for wall in elements:
-            ok, has_match, entry = _process_wall(wall, rules)
-            entries.append(entry)
-            if ok:
-                processed += 1
-                if has_match:
-                    matched += 1
-                    updated += 1
-                elif config.CLEAR_CODE_WHEN_MISS and not entry.get("matched"):
-                    param = _get_writable_param(wall, PARAM_GESN_OUTPUT)
-                    if param:
-                        param.Set(u"")
-            else:
-                out.print_html(u"Не удалось обновить стену: {0}".format(_t(wall)))
+    entries = records.RecordStore(WallEntry, spill_limit=config.RESULT_SPILL_LIMIT)
+
+    _PARAMS = shared_params.ParameterIndex(revit.doc, LOOKUP_PARAMS)
+    if len(_PARAMS.missing_bindings(PARAM_GESN_OUTPUT)) == len(PARAM_GESN_OUTPUT):
+        if not forms.alert(
+            shared_params.format_missing(PARAM_GESN_OUTPUT),
+            sub_msg=u"Шифр ГЭСН некуда записать. Продолжить?",
+            yes=True,
+            no=True,
+        ):
+            return
+
+    # Стены, занятые другими пользователями, в запись не попадают
+    checkout = worksharing.checkout(revit.doc, elements)
+    if checkout.excluded:
+        elements = [w for w in elements if checkout.is_editable(w.Id.IntegerValue)]
+
+    def _apply(wall):
+        ok, has_match, entry = _process_wall(wall, rules)
+        return wall, ok, has_match, entry
+
+    run = transactions.run_chunked(revit.doc, elements, _apply, u"ТАРТИП: определить ГЭСН")
+    if run.cancelled:
+        forms.alert(u"Определение ГЭСН прервано пользователем. Изменения модели отменены.")
+        return
+
+    for wall, ok, has_match, entry in run.results:
+        entries.append(entry)
+        if ok:
+            processed += 1
+            if has_match:
+                matched += 1
+                updated += 1
+        else:
+            out.print_html(u"Не удалось обновить стену: {0}".format(_t(wall)))
+    for wall, error in run.failed:
+        out.print_html(u"Не удалось обновить стену: {0} ({1})".format(_h(wall), _h(error)))
+    # записи уже в хранилище (возможно, выгружены на диск) — ссылки из run не нужны
+    run.results = []
 
     not_matched = processed - matched
     summary_text = u"Обработано стен: {0}. Обновлено ГЭСН: {1}. Без подходящей записи: {2}.".format(
@@ -1165,98 +1245,135 @@ def main():
     except Exception:
         pass
 
+    if checkout.excluded:
+        summary_text += u" Исключено (занято в совместной работе): {0}.".format(len(checkout.excluded))
     out.print_html(u"<p><b>{0}</b></p>".format(_h(summary_text)))
 
-    css = (
-        u"<style>table.acbd{border-collapse:collapse;width:100%;margin:6px 0;color:#222;}"
-        u"table.acbd th,table.acbd td{border:1px solid #d0d0d0;padding:4px 6px;}"
-        u"table.acbd thead th{background:#e6e6e6;color:#101010;position:sticky;top:0;}</style>"
-    )
+    def _link(element_id):
+        return out.linkify(DB.ElementId(element_id), u"{}".format(element_id))
 
-    def _render_group(title, headers, rows, empty_message):
-        out.print_html(u"<h3>{0}</h3>".format(_h(title)))
-        if not rows:
-            out.print_html(u"<p>{0}</p>".format(_h(empty_message)))
-            return
-        table_html = [u"<table class='acbd'>", u"<thead><tr>"]
-        for h in headers:
-            table_html.append(u"<th>{0}</th>".format(_h(h)))
-        table_html.append(u"</tr></thead><tbody>")
-        for r in rows:
-            table_html.append(
-                u"<tr>{0}</tr>".format(
-                    u"".join(u"<td>{0}</td>".format(c) for c in r)
-                )
-            )
-        table_html.append(u"</tbody></table>")
-        out.print_html(u"".join(table_html))
-
-    entries_with = [e for e in entries if e.get("matched")]
-    entries_without = [e for e in entries if not e.get("matched")]
-
-    rows_with = []
-    for entry in entries_with:
-        link = (
-            out.linkify(DB.ElementId(entry["id"]), u"{}".format(entry["id"]))
-            if entry.get("id") is not None
-            else u""
+    out.print_html(gesn_report.render_summary(entries))
+    if config.REPORT_DETAILS_WINDOW:
+        out.print_html(u"<p>Подробности по стенам — в окне результатов.</p>")
+    else:
+        # страницы читаются из хранилища по одной — записи не копируются в списки
+        for chunk in _render_detail_pages(entries, _link):
+            out.print_html(chunk)
+    worksharing.print_excluded(out, checkout)
+
+    # Выгрузка тех же результатов в XLSX — без повторного сопоставления
+    save_path = forms.save_file(
+        file_ext="xlsx",
+        default_name=u"ГЭСН_стены_{:%Y%m%d_%H%M}.xlsx".format(datetime.datetime.now()),
+        title=u"Сохранить результаты ГЭСН в XLSX",
+    )
+    if save_path:
+        try:
+            _export_xlsx(save_path, entries)
+            out.print_html(u"<p><b>XLSX сохранён:</b> {0}</p>".format(_h(save_path)))
+        except Exception as exc:
+            out.print_html(u"<p><b>Ошибка записи XLSX:</b> {0}</p>".format(_h(exc)))
+
+    if config.REPORT_DETAILS_WINDOW:
+        results_window.show_results(u"ТАРТИП: определение ГЭСН", RESULT_COLUMNS,
+                                    _result_rows(entries), uidoc=revit.uidoc)
+    entries.close()
+
+
+def _result_rows(entries):
+    for entry in entries:
+        matched = entry.matched
+        yield (
+            entry.id,
+            u"ГЭСН определён" if matched else u"ГЭСН не определён",
+            entry.cat,
+            entry.family,
+            entry.type,
+            entry.quantity_text,
+            entry.multiplier_text,
+            u"; ".join(code for code, _ in entry.gesn_items or ()),
+            None if matched else gesn_report.reason_key(entry.message),
+            entry.message,
         )
-        rows_with.append(
+
+
+def _export_xlsx(path, entries):
+    """Листы: результаты по стенам, свод по шифрам ГЭСН и по причинам отсутствия."""
+
+    with xlsx_writer.XlsxWriter(path, title=u"ГЭСН: стены") as book:
+        walls = book.add_sheet(
+            u"Стены",
             [
-                link,
-                _h(entry.get("cat") or u""),
-                _h(entry.get("family") or u""),
-                _h(entry.get("type") or u""),
-                _h(entry.get("quantity_text") or u""),
-                _h(entry.get("multiplier_text") or u""),
-                _h(entry.get("gesn_text") or u""),
-            ]
+                (u"ID", "int"),
+                (u"Категория", "text"),
+                (u"Семейство", "text"),
+                (u"Тип", "text"),
+                (u"Результат", "text"),
+                (u"Кол-во/Объём", "text"),
+                (u"Кратность ед.изм. ГЭСН", "text"),
+                (u"Шифр ГЭСН", "text"),
+                (u"Причина", "text"),
+                (u"Подробности", "text"),
+            ],
+            widths=[10, 14, 28, 36, 18, 30, 12, 40, 40, 80],
         )
-
-    rows_without = []
-    for entry in entries_without:
-        link = (
-            out.linkify(DB.ElementId(entry["id"]), u"{}".format(entry["id"]))
-            if entry.get("id") is not None
-            else u""
+        for entry in entries:
+            matched = entry.matched
+            walls.write_row([
+                entry.id,
+                entry.cat,
+                entry.family,
+                entry.type,
+                u"ГЭСН определён" if matched else u"ГЭСН не определён",
+                entry.quantity_text,
+                entry.multiplier_text,
+                # фрагменты с объёмом — как в параметре модели
+                entry.gesn_text,
+                None if matched else gesn_report.reason_key(entry.message),
+                entry.message,
+            ])
+
+        by_code, by_reason = gesn_report.summarize(entries)
+
+        codes = book.add_sheet(
+            u"Свод по шифрам",
+            [(u"Шифр ГЭСН", "text"), (u"Стен", "int"), (u"Объём для ГЭСН", "decimal")],
+            widths=[24, 10, 18],
         )
-        rows_without.append(
-            [
-                link,
-                _h(entry.get("cat") or u""),
-                _h(entry.get("family") or u""),
-                _h(entry.get("type") or u""),
-                _h(entry.get("message") or u""),
-            ]
+        for code in sorted(by_code):
+            count, volume = by_code[code]
+            codes.write_row([code, count, volume])
+
+        reasons = book.add_sheet(
+            u"Причины",
+            [(u"Причина", "text"), (u"Стен", "int")],
+            widths=[80, 10],
         )
-
-    out.print_html(css)
-    _render_group(
-        title=u"ГЭСН определён",
-        headers=[
-            u"ID",
-            u"Категория",
-            u"Семейство",
-            u"Тип",
-            u"Кол-во/Объём",
-            u"Кратность ед.изм. ГЭСН",
-            u"Шифр ГЭСН",
-        ],
-        rows=rows_with,
-        empty_message=u"Нет элементов с определённым шифром ГЭСН.",
-    )
-    _render_group(
-        title=u"ГЭСН не определён",
-        headers=[
-            u"ID",
-            u"Категория",
-            u"Семейство",
-            u"Тип",
-            u"Результат",
-        ],
-        rows=rows_without,
-        empty_message=u"Все элементы получили шифр ГЭСН.",
-    )
+        for reason, count in sorted(by_reason.items(), key=lambda kv: (-kv[1], kv[0])):
+            reasons.write_row([reason, count])
+
+
+def _render_detail_pages(entries, link):
+    # проходы по хранилищу: счётчик для заголовков, затем записи с шифром и без него
+    with_count = sum(1 for e in entries if e.matched)
+    for chunk in gesn_report.render_pages(
+        u"ГЭСН определён",
+        (e for e in entries if e.matched),
+        with_count,
+        gesn_report.MATCHED_COLUMNS,
+        link,
+        u"Нет элементов с определённым шифром ГЭСН.",
+    ):
+        yield chunk
+    for chunk in gesn_report.render_pages(
+        u"ГЭСН не определён",
+        (e for e in entries if not e.matched),
+        len(entries) - with_count,
+        gesn_report.MISSED_COLUMNS,
+        link,
+        u"Все элементы получили шифр ГЭСН.",
+    ):
+        yield chunk
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""ВОР по всем выгрузкам ИМОКС папки: файл за файлом без ручного запуска макроса.
+
+Выгрузки обрабатываются пулом потоков (``lib.vor_batch``); ВОР каждой,
+сводка ``ВОР_сводка.xlsx`` и журнал ``vor_batch.log`` пишутся в подпапку
+«ВОР» выбранной папки. Пакет выполняется в фоне (``tartip.background``):
+Revit не ждёт обработки, о готовности сообщает уведомление, щелчок по
+которому открывает сводку.
+"""
+import os
+import sys
+
+from pyrevit import forms, script
+
+THIS_DIR = os.path.dirname(__file__)
+BASE_DIR = os.path.dirname(THIS_DIR)
+LIB_DIR = os.path.join(BASE_DIR, "lib")
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from lib import vor_batch, vor_engine  # noqa: E402
+from tartip import background  # noqa: E402
+
+OUT_SUBDIR = u"ВОР"
+
+out = script.get_output()
+
+
+def _t(value):
+    try:
+        return unicode(value)  # type: ignore[name-defined]
+    except Exception:
+        try:
+            return str(value)
+        except Exception:
+            return u""
+
+
+def _h(value):
+    if value is None:
+        return u""
+    return _t(value).replace(u"&", u"&amp;").replace(u"<", u"&lt;").replace(u">", u"&gt;")
+
+
+def main():
+    folder = forms.pick_folder(title=u"Папка с выгрузками ИМОКС")
+    if not folder:
+        return
+    try:
+        sources = vor_batch.find_sources(folder)
+    except vor_engine.VorError as exc:
+        forms.alert(_t(exc), exitscript=True)
+    out_dir = os.path.join(folder, OUT_SUBDIR)
+    out.print_html(u"<p><b>Выгрузок: {0}.</b> Результат: {1}</p>".format(len(sources), _h(out_dir)))
+
+    summary = os.path.join(out_dir, vor_batch.SUMMARY_NAME)
+    background.run(lambda: vor_batch.run_batch(sources, out_dir), u"ТАРТИП: пакетная ВОР",
+                   u"Сводка сохранена: {0}".format(summary), result_path=summary)
+    out.print_html(u"<p><b>ВОР формируется в фоне</b> — по готовности появится уведомление. "
+                   u"Итог по каждой выгрузке — в сводке (лист «Файлы») и в {0}.</p>".format(
+                       _h(vor_batch.LOG_NAME)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""ВОР напрямую из модели: свод по (шифр ГЭСН, стадия, диапазон площади) в XLSX.
+
+Элементы читаются один раз: результат AssignGesn берётся из расширенного
+хранилища (``tartip.gesn_storage``), стадия — из стадий возведения/сноса,
+диапазон площади — по правилам ``lib.vor_rules``. Группы накапливаются в
+словаре за один проход, без выгрузки ИМОКС и макроса ``MakeSubtotals.bas``.
+"""
+import datetime
+import os
+import sys
+from collections import OrderedDict
+
+from pyrevit import revit, DB, forms, script
+
+THIS_DIR = os.path.dirname(__file__)
+BASE_DIR = os.path.dirname(THIS_DIR)
+LIB_DIR = os.path.join(BASE_DIR, "lib")
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from lib import config, vor_rules  # noqa: E402
+from tartip import gesn_storage, records, transactions, xlsx_writer  # noqa: E402
+
+# Категории ВОР; остальные добавляются по мере поддержки в AssignGesn
+VOR_CATEGORIES = [DB.BuiltInCategory.OST_Walls]
+# Строковый результат AssignGesn — для моделей, обработанных до структурированного хранилища
+PARAM_GESN_TEXT = [u"ACBD_ГЭСН", u"Шифр ГЭСН"]
+NO_PHASE = u"None"
+
+# Суммируемые меры группы: (поле, заголовок в XLSX, признак New_Count)
+MEASURES = (
+    ("count", u"New_Count", True),
+    ("quantity", u"Объём для ГЭСН", False),
+    ("volume", u"Volume", False),
+    ("area", u"Area", False),
+    ("length", u"Length", False),
+)
+
+# Строка ВОР: один шифр ГЭСН одного элемента
+VorRow = records.record_type("VorRow", (
+    "id", "code", "stage", "bucket", "type_name", "category",
+    "phase_demolished", "phase_created", "unit",
+    "count", "quantity", "volume", "area", "length",
+))
+
+out = script.get_output()
+
+
+def _t(value):
+    try:
+        return unicode(value)  # type: ignore[name-defined]
+    except Exception:
+        try:
+            return str(value)
+        except Exception:
+            return u""
+
+
+def _h(value):
+    if value is None:
+        return u""
+    return _t(value).replace(u"&", u"&amp;").replace(u"<", u"&lt;").replace(u">", u"&gt;")
+
+
+class VorGroup(object):
+    """Накопитель группы (шифр, стадия, корзина)."""
+
+    __slots__ = ("code", "stage", "bucket", "units", "types", "sums", "has", "nonzero")
+
+    def __init__(self, code, stage, bucket):
+        self.code = code
+        self.stage = stage
+        self.bucket = bucket
+        self.units = OrderedDict()
+        self.types = OrderedDict()
+        self.sums = [0.0] * len(MEASURES)
+        self.has = [False] * len(MEASURES)
+        self.nonzero = [False] * len(MEASURES)
+
+    def add(self, row):
+        if row.unit:
+            self.units[row.unit] = True
+        if row.type_name:
+            self.types[row.type_name] = True
+        for index, (field, _, _) in enumerate(MEASURES):
+            value = getattr(row, field)
+            if value is None:
+                continue
+            self.sums[index] += value
+            self.has[index] = True
+            if abs(value) > 5e-12:
+                self.nonzero[index] = True
+
+    def totals(self):
+        return [
+            vor_rules.total_value(self.sums[i], self.has[i], self.nonzero[i], is_count)
+            for i, (_, _, is_count) in enumerate(MEASURES)
+        ]
+
+    def sort_key(self):
+        return (self.stage, self.code.lower(), self.bucket)
+
+
+# ---- чтение модели ----
+_names = {}
+
+
+def _element_name(doc, element_id, empty=u""):
+    if element_id is None or element_id == DB.ElementId.InvalidElementId:
+        return empty
+    key = element_id.IntegerValue
+    name = _names.get(key)
+    if name is None:
+        try:
+            name = _t(doc.GetElement(element_id).Name)
+        except Exception:
+            name = empty
+        _names[key] = name
+    return name
+
+
+def _metric(element, bip, unit_type):
+    try:
+        param = element.get_Parameter(bip)
+        if param is None or not param.HasValue:
+            return None
+        return DB.UnitUtils.ConvertFromInternalUnits(param.AsDouble(), unit_type)
+    except Exception:
+        return None
+
+
+def _gesn_items(element):
+    """[(шифр, объём для ГЭСН, единица)] — из хранилища, иначе из строки параметра."""
+
+    stored = gesn_storage.read(element)
+    if stored is not None:
+        return [(item.code, item.quantity, item.unit) for item in stored.items]
+    for name in PARAM_GESN_TEXT:
+        param = element.LookupParameter(name)
+        if param is None or not param.HasValue:
+            continue
+        items = vor_rules.parse_gesn_text(param.AsString())
+        if items:
+            return [(code, quantity, None) for code, quantity in items]
+    return []
+
+
+def _read_element(doc, element):
+    """Строки ВОР элемента и причина пропуска (None, если строки есть)."""
+
+    type_name = _element_name(doc, element.GetTypeId()) or _t(getattr(element, "Name", u""))
+    if not type_name.strip():
+        return [], u"Пустое имя типа"
+    phase_created = _element_name(doc, getattr(element, "CreatedPhaseId", None))
+    phase_demolished = _element_name(doc, getattr(element, "DemolishedPhaseId", None), NO_PHASE)
+    stage = vor_rules.stage_code(phase_demolished, phase_created)
+    if not stage:
+        return [], u"Стадии вне ВОР: {0} / {1}".format(phase_demolished, phase_created)
+    items = _gesn_items(element)
+    if not items:
+        return [], u"Нет результата ГЭСН (запустите «Определить ГЭСН»)"
+
+    area = _metric(element, DB.BuiltInParameter.HOST_AREA_COMPUTED, DB.UnitTypeId.SquareMeters)
+    volume = _metric(element, DB.BuiltInParameter.HOST_VOLUME_COMPUTED, DB.UnitTypeId.CubicMeters)
+    length = _metric(element, DB.BuiltInParameter.CURVE_ELEM_LENGTH, DB.UnitTypeId.Meters)
+    bucket = vor_rules.bucket_for(type_name, {u"Area : Double": area, u"Volume : Double": volume,
+                                               u"Length : Double": length})
+    category = _t(getattr(getattr(element, "Category", None), "Name", u""))
+    rows = [
+        VorRow(element.Id.IntegerValue, code, stage, bucket, type_name, category,
+               phase_demolished, phase_created, unit, 1, quantity, volume, area, length)
+        for code, quantity, unit in items
+    ]
+    return rows, None
+
+
+def _collect(doc):
+    elements = []
+    for category in VOR_CATEGORIES:
+        elements.extend(DB.FilteredElementCollector(doc).OfCategory(category).WhereElementIsNotElementType())
+    return elements
+
+
+# ---- XLSX ----
+def _number_style(value, is_count=False):
+    return "int" if vor_rules.number_format(value, is_count) == vor_rules.FMT_INT else "decimal"
+
+
+def _write_workbook(path, groups, rows):
+    with xlsx_writer.XlsxWriter(path, title=u"ВОР") as book:
+        columns = [(u"Итого", "text"), (u"Шифр ГЭСН", "text"), (u"Стадия", "text"), (u"Ед. изм.", "text")]
+        columns.extend((caption, "decimal") for _, caption, _ in MEASURES)
+        columns.append((u"Типы", "text"))
+        sheet = book.add_sheet(u"ВОР", columns, widths=[60, 18, 20, 8, 11, 16, 12, 12, 12, 60])
+        for group in groups:
+            totals = group.totals()
+            values = [vor_rules.itogo_caption(group.code, group.stage, group.bucket), group.code,
+                      vor_rules.STAGE_NAMES.get(group.stage, u""), u"; ".join(group.units)]
+            styles = [None] * len(values)
+            for (_, _, is_count), value in zip(MEASURES, totals):
+                values.append(value)
+                styles.append(_number_style(value, is_count) if value is not None else None)
+            values.append(u";".join(group.types))
+            sheet.write_row(values, styles=styles)
+
+        details = book.add_sheet(u"Элементы", [
+            (u"ID", "int"), (u"Шифр ГЭСН", "text"), (u"Стадия", "text"), (u"Диапазон", "text"),
+            (u"Type Name", "text"), (u"Category", "text"), (u"Phase Demolished", "text"),
+            (u"Phase Created", "text"), (u"Ед. изм.", "text"), (u"Объём для ГЭСН", "decimal"),
+            (u"Volume", "decimal"), (u"Area", "decimal"), (u"Length", "decimal"),
+        ], widths=[10, 18, 20, 16, 40, 16, 16, 20, 8, 16, 12, 12, 12])
+        for row in rows:
+            details.write_row([
+                row.id, row.code, vor_rules.STAGE_NAMES.get(row.stage, u""),
+                vor_rules.bucket_label(row.bucket).strip(), row.type_name, row.category,
+                row.phase_demolished, row.phase_created, row.unit,
+                row.quantity, row.volume, row.area, row.length,
+            ])
+
+
+def main():
+    doc = revit.doc
+    elements = _collect(doc)
+    if not elements:
+        forms.alert(u"В модели нет элементов для ВОР.", exitscript=True)
+
+    rows = records.RecordStore(VorRow, spill_limit=config.RESULT_SPILL_LIMIT)
+    groups = {}
+    skipped = OrderedDict()
+
+    def _visit(element):
+        element_rows, reason = _read_element(doc, element)
+        if reason:
+            skipped[reason] = skipped.get(reason, 0) + 1
+            return False
+        for row in element_rows:
+            key = (row.code, row.stage, row.bucket)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = VorGroup(row.code, row.stage, row.bucket)
+            group.add(row)
+            rows.append(row)
+        return True
+
+    run = transactions.run_with_progress(elements, _visit, u"ТАРТИП: ВОР из модели")
+    if run.cancelled:
+        rows.close()
+        forms.alert(u"Формирование ВОР прервано пользователем.", exitscript=True)
+    selected = sum(1 for ok in run.results if ok)
+    ordered = sorted(groups.values(), key=VorGroup.sort_key)
+
+    out.print_html(u"<p><b>Отобрано элементов: {0}. Групп «Итого»: {1}. Пропущено: {2}.</b></p>".format(
+        selected, len(ordered), len(elements) - selected))
+    for reason, count in sorted(skipped.items(), key=lambda kv: -kv[1]):
+        out.print_html(u"<p>{0}: {1}</p>".format(_h(reason), count))
+    for element, error in run.failed:
+        out.print_html(u"<p>Ошибка чтения {0}: {1}</p>".format(_h(element.Id.IntegerValue), _h(error)))
+
+    path = forms.save_file(
+        file_ext="xlsx",
+        default_name=u"ВОР_{:%Y%m%d_%H%M}.xlsx".format(datetime.datetime.now()),
+        title=u"Сохранить ВОР в XLSX",
+    )
+    if path:
+        try:
+            _write_workbook(path, ordered, rows)
+            out.print_html(u"<p><b>ВОР сохранена:</b> {0}</p>".format(_h(path)))
+        except Exception as exc:
+            out.print_html(u"<p><b>Ошибка записи XLSX:</b> {0}</p>".format(_h(exc)))
+    rows.close()
+
+
+if __name__ == "__main__":
+    main()
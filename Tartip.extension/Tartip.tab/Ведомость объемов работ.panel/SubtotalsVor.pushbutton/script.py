@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""ВОР по выгрузке ИМОКС: промежуточные итоги без макроса ``MakeSubtotals.bas``.
+
+Выгрузка читается из XLSX или CSV, итоги считает ``lib.vor_engine``,
+результат пишется новой книгой за один проход (``lib.vor_xlsx``) — без
+вставки и удаления строк в Excel. Выгрузки больше
+``config.VOR_EXTERNAL_FILE_MB`` обрабатываются во внешней памяти
+(``lib.vor_external``). Готовую ВОР можно обновить по новой выгрузке:
+пересчитываются только группы с изменёнными строками (``lib.vor_delta``).
+"""
+import os
+import sys
+from collections import OrderedDict
+
+from pyrevit import forms, script
+
+THIS_DIR = os.path.dirname(__file__)
+BASE_DIR = os.path.dirname(THIS_DIR)
+LIB_DIR = os.path.join(BASE_DIR, "lib")
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from lib import config, vor_delta, vor_engine, vor_external, vor_xlsx  # noqa: E402
+
+out = script.get_output()
+
+
+def _t(value):
+    try:
+        return unicode(value)  # type: ignore[name-defined]
+    except Exception:
+        try:
+            return str(value)
+        except Exception:
+            return u""
+
+
+def _h(value):
+    if value is None:
+        return u""
+    return _t(value).replace(u"&", u"&amp;").replace(u"<", u"&lt;").replace(u">", u"&gt;")
+
+
+def _ask_target(source, file_ext=u"xlsx"):
+    root, _ = os.path.splitext(source)
+    return forms.save_file(
+        file_ext=file_ext,
+        default_name=u"{0}_ВОР.{1}".format(os.path.basename(root), file_ext),
+        init_dir=os.path.dirname(source),
+        title=u"Сохранить ВОР",
+    )
+
+
+def _print_summary(result, path):
+    out.print_html(u"<p><b>Отобрано строк: {0}. Групп «Итого»: {1}, из них обновлено: {2}.</b></p>".format(
+        result.selected, result.groups, result.updated))
+    if result.new_count_inserted:
+        out.print_html(u"<p>Добавлена колонка New_Count : Double.</p>")
+    out.print_html(u"<p><b>ВОР сохранена:</b> {0}</p>".format(_h(path)))
+
+
+def _run_in_memory(source):
+    try:
+        rows = vor_external.iter_table_rows(source)
+        headers = [_t(h) if h is not None else u"" for h in next(rows, None) or []]
+        table = vor_engine.make_subtotals(headers, list(rows), config.VOR_DECIMAL_SEP)
+    except vor_engine.VorError as exc:
+        forms.alert(_t(exc), exitscript=True)
+
+    path = _ask_target(source)
+    if not path:
+        return
+    try:
+        vor_xlsx.write_table(path, table)
+    except Exception as exc:
+        out.print_html(u"<p><b>Ошибка записи XLSX:</b> {0}</p>".format(_h(exc)))
+        return
+    _print_summary(table, path)
+
+
+def _run_external(source):
+    """Большая выгрузка: потоковая обработка с бюджетом памяти ``config.VOR_RUN_ROWS``."""
+
+    path = _ask_target(source, u"csv" if source.lower().endswith(u".csv") else u"xlsx")
+    if not path:
+        return
+    try:
+        result = vor_external.subtotal_file(source, path)
+    except vor_engine.VorError as exc:
+        forms.alert(_t(exc), exitscript=True)
+    _print_summary(result, path)
+
+
+def _run_delta(source):
+    """Обновление готовой ВОР: строки по ID, пересчёт только затронутых групп."""
+
+    vor_path = forms.pick_file(
+        files_filter=u"ВОР (*.xlsx;*.csv)|*.xlsx;*.csv",
+        init_dir=os.path.dirname(source),
+        title=u"Готовая ВОР для обновления",
+    )
+    if not vor_path:
+        return
+    ext = os.path.splitext(vor_path)[1]
+    path = forms.save_file(
+        file_ext=ext.lstrip(u"."),
+        default_name=os.path.basename(vor_path),
+        init_dir=os.path.dirname(vor_path),
+        title=u"Сохранить обновлённую ВОР",
+    )
+    if not path:
+        return
+    try:
+        result = vor_delta.update_file(vor_path, source, path)
+    except vor_engine.VorError as exc:
+        forms.alert(_t(exc), exitscript=True)
+    out.print_html(u"<p><b>Добавлено строк: {0}, удалено: {1}, изменено: {2}.</b></p>".format(
+        result.added, result.removed, result.changed))
+    out.print_html(u"<p>Пересчитано групп: {0} из {1}; удалено групп: {2}.</p>".format(
+        result.touched, result.groups, result.dropped))
+    out.print_html(u"<p><b>ВОР сохранена:</b> {0}</p>".format(_h(path)))
+
+
+def _ask_mode():
+    options = OrderedDict()
+    options[u"Новая ВОР"] = "new"
+    options[u"Обновить готовую ВОР (изменения по ID)"] = "delta"
+    choice = forms.CommandSwitchWindow.show(
+        options,
+        message=u"ВОР по выгрузке ИМОКС",
+        width=500,
+        height=200,
+    )
+    if not choice:
+        return None
+    return options.get(choice, choice)
+
+
+def main():
+    source = forms.pick_file(
+        files_filter=u"Выгрузка ИМОКС (*.xlsx;*.csv)|*.xlsx;*.csv",
+        title=u"Выгрузка ИМОКС для ВОР",
+    )
+    if not source:
+        return
+    mode = _ask_mode()
+    if mode is None:
+        return
+    if mode == "delta":
+        _run_delta(source)
+        return
+    size_mb = os.path.getsize(source) / 1048576.0
+    if size_mb > config.VOR_EXTERNAL_FILE_MB:
+        _run_external(source)
+    else:
+        _run_in_memory(source)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,19 @@
 from __future__ import absolute_import
 
 from . import config  # noqa: F401
+from . import gesn_report  # noqa: F401
 from . import gesn_rules  # noqa: F401
 from . import spec_keys_cache  # noqa: F401
+from . import vor_engine  # noqa: F401
+from . import vor_rules  # noqa: F401
+from . import vor_xlsx  # noqa: F401
 
 __all__ = [
     "config",
+    "gesn_report",
     "gesn_rules",
     "spec_keys_cache",
+    "vor_engine",
+    "vor_rules",
+    "vor_xlsx",
 ]
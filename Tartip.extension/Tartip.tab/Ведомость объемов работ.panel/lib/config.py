@@ -18,6 +18,24 @@ DEFAULT_VOLUME_PARAM = u"Площадь"
 # Поведение при отсутствии правил: если True, параметр будет очищен.
 CLEAR_CODE_WHEN_MISS = False
 
+# Сколько строк детализации выводить на одной странице отчёта.
+REPORT_PAGE_SIZE = 500
+# Подробности по стенам: False — страницами в окне вывода (REPORT_PAGE_SIZE строк);
+# True — в окне результатов (таблица с выбором в модели), в окне вывода только сводка.
+REPORT_DETAILS_WINDOW = False
+# Сколько записей результата держать в памяти; остальное выгружается во временный JSONL.
+RESULT_SPILL_LIMIT = 50000
+
+# Десятичный разделитель в текстовых числах выгрузки ИМОКС и в токенах «Итого» ВОР.
+VOR_DECIMAL_SEP = u","
+# Разделитель колонок CSV, в который пишется ВОР.
+VOR_CSV_DELIMITER = u";"
+# Бюджет памяти ВОР во внешней памяти: строк выгрузки в одном прогоне сортировки
+# и в буфере одной группы; остальное — во временных JSONL.
+VOR_RUN_ROWS = 200000
+# Выгрузки больше этого размера (МБ) обрабатываются во внешней памяти.
+VOR_EXTERNAL_FILE_MB = 40
+
 # Путь к файлу Excel рядом с расширением.
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 EXCEL_PATH = os.path.join(BASE_DIR, EXCEL_FILE_NAME)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""HTML-отчёт по результатам определения ГЭСН для окна вывода pyRevit.
+
+Сначала выводится компактная сводка (количество стен по шифрам ГЭСН и по
+причинам отсутствия шифра), затем — поэлементная детализация страницами
+по ``config.REPORT_PAGE_SIZE`` строк. Каждая страница — свёрнутый блок
+``<details>``, который окно вывода не раскладывает, пока его не раскроют.
+Выравнивание задаётся классами CSS, а не стилями каждой ячейки.
+
+Модуль не зависит от Revit API: ссылки на элементы строит переданная
+функция ``link(element_id)``.
+"""
+from __future__ import absolute_import
+
+import itertools
+import re
+from collections import OrderedDict
+
+from . import config
+
+try:
+    text_type = unicode  # noqa: F821 - IronPython 2.7
+except NameError:
+    text_type = str
+
+REPORT_CSS = (
+    u"<style>"
+    u"table.acbd{border-collapse:collapse;width:100%;margin:6px 0;color:#222;}"
+    u"table.acbd th,table.acbd td{border:1px solid #d0d0d0;padding:4px 6px;}"
+    u"table.acbd thead th{background:#e6e6e6;color:#101010;position:sticky;top:0;}"
+    u"table.acbd td.n{text-align:right;white-space:nowrap;}"
+    u"table.acbd td.id{text-align:right;width:1%;white-space:nowrap;}"
+    u"table.acbd.sum{width:auto;min-width:50%;}"
+    u"details.pg{margin:4px 0;}details.pg>summary{cursor:pointer;color:#1a4f8b;}"
+    u"</style>"
+)
+
+# Заголовки детализации: (заголовок, класс ячейки, ключ записи)
+MATCHED_COLUMNS = (
+    (u"ID", u"id", "id"),
+    (u"Категория", u"", "cat"),
+    (u"Семейство", u"", "family"),
+    (u"Тип", u"", "type"),
+    (u"Кол-во/Объём", u"", "quantity_text"),
+    (u"Кратность ед.изм. ГЭСН", u"n", "multiplier_text"),
+    (u"Шифр ГЭСН", u"", "gesn_text"),
+)
+MISSED_COLUMNS = (
+    (u"ID", u"id", "id"),
+    (u"Категория", u"", "cat"),
+    (u"Семейство", u"", "family"),
+    (u"Тип", u"", "type"),
+    (u"Результат", u"", "message"),
+)
+
+_NUMBER_RE = re.compile(u"\\s*-?\\d+(?:[.,]\\d+)?")
+
+
+def _t(value):
+    if value is None:
+        return u""
+    if isinstance(value, text_type):
+        return value
+    try:
+        return text_type(value)
+    except Exception:
+        return u""
+
+
+def _h(value):
+    return (
+        _t(value)
+        .replace(u"&", u"&amp;")
+        .replace(u"<", u"&lt;")
+        .replace(u">", u"&gt;")
+        .replace(u'"', u"&quot;")
+    )
+
+
+def _fmt_qty(value):
+    return u"{0:,.3f}".format(value or 0.0).replace(u",", u" ").replace(u".", u",")
+
+
+def reason_key(message):
+    """Сводит текст причины к группе: без входных данных, префикса «Совпало» и чисел."""
+
+    text = _t(message).split(u" | ", 1)[0].strip()
+    if text.startswith(u"Совпало:") and u". " in text:
+        text = text.split(u". ", 1)[1]
+    head, _, rest = text.partition(u" (")
+    if head == u"Нет записей в БД" and rest and u":" in rest:
+        labels = []
+        for clause in rest.rstrip(u")").split(u"; "):
+            label = _NUMBER_RE.split(clause.split(u":", 1)[0], 1)[0].strip()
+            if label and label not in labels:
+                labels.append(label)
+        return u"Нет записей в БД — не совпало: {0}".format(u", ".join(labels))
+    return _NUMBER_RE.sub(u"", head).strip() or u"(причина не указана)"
+
+
+def summarize(entries):
+    """Сводка: {шифр: [стен, объём для ГЭСН]} и {причина: стен}."""
+
+    by_code = OrderedDict()
+    by_reason = OrderedDict()
+    for entry in entries:
+        if entry.get("matched"):
+            for code, volume in entry.get("gesn_items") or ():
+                bucket = by_code.setdefault(code, [0, 0.0])
+                bucket[0] += 1
+                bucket[1] += volume or 0.0
+        else:
+            key = reason_key(entry.get("message"))
+            by_reason[key] = by_reason.get(key, 0) + 1
+    return by_code, by_reason
+
+
+def _summary_table(headers, rows):
+    html = [u"<table class='acbd sum'><thead><tr>"]
+    html.extend(u"<th>{0}</th>".format(_h(h)) for h in headers)
+    html.append(u"</tr></thead><tbody>")
+    for row in rows:
+        html.append(u"<tr><td>{0}</td>{1}</tr>".format(
+            _h(row[0]), u"".join(u"<td class='n'>{0}</td>".format(c) for c in row[1:])))
+    html.append(u"</tbody></table>")
+    return u"".join(html)
+
+
+def render_summary(entries):
+    """HTML сводки по шифрам ГЭСН и причинам отсутствия шифра."""
+
+    by_code, by_reason = summarize(entries)
+    html = [REPORT_CSS]
+    if by_code:
+        rows = sorted(by_code.items(), key=lambda kv: (-kv[1][0], kv[0]))
+        html.append(u"<h3>Сводка по шифрам ГЭСН</h3>")
+        html.append(_summary_table(
+            (u"Шифр ГЭСН", u"Стен", u"Объём для ГЭСН"),
+            [(code, count, _fmt_qty(volume)) for code, (count, volume) in rows],
+        ))
+    if by_reason:
+        rows = sorted(by_reason.items(), key=lambda kv: (-kv[1], kv[0]))
+        html.append(u"<h3>Сводка по причинам отсутствия ГЭСН</h3>")
+        html.append(_summary_table((u"Причина", u"Стен"), rows))
+    return u"".join(html)
+
+
+def _row(entry, columns, link):
+    cells = []
+    for _, css, key in columns:
+        value = entry.get(key)
+        if key == "id":
+            text = link(value) if value is not None else u""
+        else:
+            text = _h(value)
+        cells.append(u"<td class='{0}'>{1}</td>".format(css, text) if css else u"<td>{0}</td>".format(text))
+    return u"<tr>{0}</tr>".format(u"".join(cells))
+
+
+def render_pages(title, entries, total, columns, link, empty_message, page_size=None):
+    """Детализация группы: HTML-фрагменты по одному на страницу (генератор).
+
+    ``entries`` — итерируемое из ``total`` записей; читается по странице,
+    целиком в памяти не держится. ``link(element_id)`` возвращает HTML
+    ссылки на элемент. Фрагменты выводятся отдельными вызовами
+    ``print_html``.
+    """
+
+    size = max(1, int(page_size or config.REPORT_PAGE_SIZE))
+    header = u"<h3>{0}: {1}</h3>".format(_h(title), total)
+    if not total:
+        yield header + u"<p>{0}</p>".format(_h(empty_message))
+        return
+    yield header
+
+    head = u"<table class='acbd'><thead><tr>{0}</tr></thead><tbody>".format(
+        u"".join(u"<th>{0}</th>".format(_h(name)) for name, _, _ in columns))
+    entries = iter(entries)
+    start = 0
+    while start < total:
+        page = list(itertools.islice(entries, size))
+        if not page:
+            break
+        html = [u"<details class='pg'><summary>Элементы {0}–{1} из {2}</summary>".format(
+            start + 1, start + len(page), total), head]
+        html.extend(_row(entry, columns, link) for entry in page)
+        html.append(u"</tbody></table></details>")
+        yield u"".join(html)
+        start += len(page)
@@ -28,6 +28,7 @@ GesnRule = namedtuple(
         "height_label",
         "volume_label",
         "extra_filters",
+        "rule_id",
     ],
 )
 
@@ -244,7 +245,7 @@ def _first_number(raw_value, fallback=None):
     return fallback
 
 
-def _load_shared_strings(zip_file):
+def load_shared_strings(zip_file):
     """Чтение sharedStrings.xml в словарь индексов."""
     try:
         with zip_file.open("xl/sharedStrings.xml") as data:
@@ -259,7 +260,8 @@ def _load_shared_strings(zip_file):
     ]
 
 
-def _column_index(cell_ref):
+def column_index(cell_ref):
+    """Индекс колонки (с нуля) по ссылке ячейки: A1 -> 0, AA7 -> 26."""
     match = re.match(r"([A-Z]+)([0-9]+)", cell_ref)
     if not match:
         return 0
@@ -274,7 +276,7 @@ def _normalize_sheet_name(name):
     return (_as_text(name) or u"").replace(" ", "").replace("_", "").lower()
 
 
-def _get_sheet_entries(zip_file):
+def get_sheet_entries(zip_file):
     """Получение списка всех листов с путями к файлам worksheet.
 
     При отсутствии рабочей таблицы связей пытаемся использовать стандартные
@@ -337,7 +339,7 @@ def _get_sheet_entries(zip_file):
     return entries, available_names
 
 
-def _order_sheets(entries, preferred_name):
+def order_sheets(entries, preferred_name):
     """Возвращает листы в порядке: сначала совпадающие с предпочтительным именем."""
 
     if not preferred_name:
@@ -365,7 +367,7 @@ def _read_sheet_rows(zip_file, sheet_path, shared_strings):
     for row in tree.getroot().iterfind("s:sheetData/s:row", namespace):
         cells = []
         for cell in row.iterfind("s:c", namespace):
-            idx = _column_index(cell.get("r", "A1"))
+            idx = column_index(cell.get("r", "A1"))
             while len(cells) <= idx:
                 cells.append(None)
 
@@ -397,7 +399,7 @@ def _load_all_sheets_as_rows(excel_path, sheet_name):
     """Чтение всех листов XLSX без внешних зависимостей."""
 
     with zipfile.ZipFile(excel_path, "r") as zf:
-        entries, available = _get_sheet_entries(zf)
+        entries, available = get_sheet_entries(zf)
         if not entries:
             raise ValueError(
                 u"В файле правил нет доступных листов. Найдены имена: {0}".format(
@@ -405,8 +407,8 @@ def _load_all_sheets_as_rows(excel_path, sheet_name):
                 )
             )
 
-        ordered_entries = _order_sheets(entries, sheet_name)
-        shared_strings = _load_shared_strings(zf)
+        ordered_entries = order_sheets(entries, sheet_name)
+        shared_strings = load_shared_strings(zf)
 
         sheets_rows = []
         for name, path in ordered_entries:
@@ -493,7 +495,7 @@ def load_rules_from_excel(path=None, sheet_name=None):
             ):
                 extra_headers.append(key)
 
-        for row in rows[1:]:
+        for row_number, row in enumerate(rows[1:], 2):
             gesn_code = _as_text(get_cell(row, u"Шифр ГЭСН"))
             if not gesn_code:
                 continue
@@ -594,6 +596,8 @@ def load_rules_from_excel(path=None, sheet_name=None):
                 height_label=height_label,
                 volume_label=volume_label,
                 extra_filters=extra_filters,
+                # «лист!строка» — по нему результат в модели связывается с записью БД
+                rule_id=u"{0}!{1}".format(sheet_name, row_number),
             )
             rules.append(rule)
 
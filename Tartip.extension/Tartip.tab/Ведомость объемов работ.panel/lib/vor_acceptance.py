@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""Приёмочные проверки движка ВОР: случаи T01–T21 из ``ВОР/TEST_PLAN.md``.
+
+Каждый случай собирает маленькую таблицу ИМОКС в памяти, обрабатывает её
+``vor_engine.make_subtotals`` и сверяет результат с ожидаемым по
+тест-плану (фильтр, корзины на границах 10/50, пустые суммы, округление и
+прилипание, форматы, «один токен → число», защита ``new_*``, повторный
+запуск, структура, счётчики). Excel и Revit не нужны.
+
+Запуск из папки панели (общий пакет ``tartip`` — в ``PYTHONPATH``)::
+
+    PYTHONPATH=../../lib python -m lib.vor_acceptance
+    PYTHONPATH=../../lib python -m lib.vor_acceptance T08 T15
+
+Код выхода 1 — хотя бы один случай не прошёл.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import sys
+import traceback
+
+from . import vor_engine, vor_rules
+
+DEM = (u"Демонтаж", u"Существующие")
+NEW = (u"None", u"Новая конструкция")
+
+HEADERS = [
+    u"ID",
+    u"Type Name : String",
+    u"Category : String",
+    u"Phase Demolished : String",
+    u"Phase Created : String",
+    u"Area : Double",
+    u"Volume : Double",
+    u"Thickness : Double",
+    u"Comments : String",
+    u"new_comment",
+]
+
+SPECIAL = vor_rules.SPECIAL_TYPE
+# T08–T12: площадь -> корзина (TEST_PLAN.md §6)
+BUCKET_CASES = (
+    (9.9999994, 1),
+    (10.0, 0),
+    (10.0000003, 0),
+    (30.0, 2),
+    (49.9999996, 0),
+    (50.0, 0),
+    (50.0000003, 0),
+    (69.0, 3),
+)
+
+
+def _row(row_id, type_name, stage=NEW, area=None, volume=None, thickness=None, category=u"Стены", new=None):
+    return [row_id, type_name, category, stage[0], stage[1], area, volume, thickness, None, new]
+
+
+def _check(condition, message, *args):
+    if not condition:
+        raise AssertionError(message.format(*args))
+
+
+def _cell(table, row, header):
+    return row.values[vor_engine.find_header(table.headers, header)]
+
+
+def _itogo(table):
+    """Строки «Итого» по подписи."""
+
+    return dict((row.values[vor_engine.find_header(table.headers, vor_engine.REQ_TYPE)], row)
+                for row in table.rows if row.itogo)
+
+
+def _caption(name, stage, bucket=0):
+    return vor_rules.itogo_caption(name, vor_rules.STAGE_NEW if stage is NEW else vor_rules.STAGE_DEMOLISH, bucket)
+
+
+def _data_ids(table):
+    return [_cell(table, row, u"ID") for row in table.rows if not row.itogo]
+
+
+# ---- случаи ----
+def check_t01():
+    """Нет обязательной колонки — ошибка с перечнем недостающих."""
+
+    headers = [u"ID", u"Type Name : String", u"Area : Double"]
+    try:
+        vor_engine.make_subtotals(headers, [[1, u"Тип", 1.0]])
+    except vor_engine.VorError as exc:
+        text = u"{0}".format(exc)
+        _check(vor_engine.REQ_DEMOLISHED in text and vor_engine.REQ_CREATED in text,
+               u"в ошибке нет недостающих колонок: {0}", text)
+        return
+    raise AssertionError(u"таблица без колонок стадий обработана без ошибки")
+
+
+def check_t02():
+    """Заголовки с лишними пробелами, табами, NBSP и двоеточием без пробелов."""
+
+    headers = [u"ID", u"Type  Name:String", u"Phase Demolished :String", u"Phase\tCreated: String",
+               u" Area:   Double ", u"Volume : Double"]
+    table = vor_engine.make_subtotals(headers, [[1, u"Тип", u"None", u"Новая конструкция", 2.5, 0.5]])
+    _check(table.selected == 1 and table.groups == 1, u"отобрано {0}, групп {1}", table.selected, table.groups)
+    row = _itogo(table)[_caption(u"Тип", NEW)]
+    _check(_cell(table, row, u"Area : Double") == 2.5, u"площадь не просуммирована")
+
+
+def check_t03():
+    """Строки с пустым именем типа удаляются."""
+
+    rows = [_row(1, u"Тип"), _row(2, None), _row(3, u""), _row(4, u"   ")]
+    table = vor_engine.make_subtotals(HEADERS, rows)
+    _check(_data_ids(table) == [1], u"строки данных: {0}", _data_ids(table))
+
+
+def check_t04():
+    """Остаются только (Демонтаж, Существующие) и (None, Новая конструкция)."""
+
+    rows = [
+        _row(1, u"Тип", DEM),
+        _row(2, u"Тип", NEW),
+        _row(3, u"Тип", (u" демонтаж ", u"СУЩЕСТВУЮЩИЕ")),
+        _row(4, u"Тип", (u"Снос", u"Новая конструкция")),
+        _row(5, u"Тип", (u"None", u"Существующие")),
+        _row(6, u"Тип", (u"Демонтаж", u"Новая конструкция")),
+        _row(7, u"Тип", (None, u"Новая конструкция")),
+    ]
+    table = vor_engine.make_subtotals(HEADERS, rows)
+    _check(sorted(_data_ids(table)) == [1, 2, 3], u"строки данных: {0}", sorted(_data_ids(table)))
+
+
+def check_t05():
+    """New_Count : Double создаётся перед Volume : Double, в данных — 1."""
+
+    table = vor_engine.make_subtotals(HEADERS, [_row(1, u"Тип"), _row(2, u"Тип")])
+    col = vor_engine.find_header(table.headers, vor_engine.COL_NEW_COUNT)
+    _check(table.new_count_inserted, u"New_Count не отмечен как вставленный")
+    _check(col >= 0 and table.headers[col + 1] == vor_engine.COL_VOLUME, u"New_Count не перед Volume: {0}",
+           table.headers)
+    _check(all(row.values[col] == 1 for row in table.rows if not row.itogo), u"New_Count в данных не 1")
+    _check(_cell(table, _itogo(table)[_caption(u"Тип", NEW)], vor_engine.COL_NEW_COUNT) == 2,
+           u"New_Count в «Итого» не 2")
+
+
+def check_t06():
+    """Видимы whitelist и new_*, прочие скрыты."""
+
+    table = vor_engine.make_subtotals(HEADERS, [_row(1, u"Тип")])
+    hidden = [header for header, visible in zip(table.headers, table.visible) if not visible]
+    _check(hidden == [u"Comments : String"], u"скрыты: {0}", hidden)
+
+
+def check_t07():
+    """Сортировка Stage → Name → Bucket; «Итого» над строками своей группы."""
+
+    rows = [
+        _row(1, u"Б_тип", NEW, area=1.0),
+        _row(2, u"В_тип", DEM, area=2.0),
+        _row(3, u"А_тип", DEM, area=3.0),
+        _row(4, u"б_тип", NEW, area=4.0),
+    ]
+    table = vor_engine.make_subtotals(HEADERS, rows)
+    col_type = vor_engine.find_header(table.headers, vor_engine.REQ_TYPE)
+    captions = [row.values[col_type] for row in table.rows if row.itogo]
+    expected = [_caption(u"А_тип", DEM), _caption(u"В_тип", DEM), _caption(u"Б_тип", NEW)]
+    _check(captions == expected, u"порядок «Итого»: {0}", captions)
+    _check(table.rows[0].itogo, u"первая строка — не «Итого»")
+    current = None
+    for row in table.rows:
+        if row.itogo:
+            current = vor_engine.parse_itogo(row.values[col_type])
+            continue
+        name = row.values[col_type].strip().lower()
+        stage = vor_rules.stage_code(_cell(table, row, vor_engine.REQ_DEMOLISHED),
+                                     _cell(table, row, vor_engine.REQ_CREATED))
+        _check(current is not None and (current[0].lower(), current[1]) == (name, stage),
+               u"строка {0} не под своим «Итого»", _cell(table, row, u"ID"))
+
+
+def check_t08_t12():
+    """Корзины площади спец-типа строги на границах 10/50 (±EPS — без корзины)."""
+
+    rule = vor_rules.BUCKETS.rule_for(SPECIAL.lower())
+    for area, bucket in BUCKET_CASES:
+        _check(rule.bucket(area) == bucket, u"Area={0!r}: корзина {1}, ожидалась {2}",
+               area, rule.bucket(area), bucket)
+
+    rows = [_row(index + 1, SPECIAL, NEW, area=area) for index, (area, _) in enumerate(BUCKET_CASES)]
+    table = vor_engine.make_subtotals(HEADERS, rows)
+    itogo = _itogo(table)
+    counts = {}
+    for _, bucket in BUCKET_CASES:
+        counts[bucket] = counts.get(bucket, 0) + 1
+    for bucket, count in counts.items():
+        caption = _caption(SPECIAL, NEW, bucket)
+        _check(caption in itogo, u"нет «Итого» {0}", caption)
+        _check(_cell(table, itogo[caption], vor_engine.COL_NEW_COUNT) == count,
+               u"{0}: строк {1}, ожидалось {2}", caption, _cell(table, itogo[caption], vor_engine.COL_NEW_COUNT),
+               count)
+        _check(vor_engine.parse_itogo(caption)[2] == bucket, u"подпись {0} не разбирается в корзину {1}",
+               caption, bucket)
+    _check(len(itogo) == len(counts), u"лишние «Итого»: {0}", sorted(itogo))
+    _check(_caption(SPECIAL, NEW, 0).endswith(u"[Новая конструкция]"), u"у корзины 0 есть метка")
+
+
+def check_t13():
+    """Суммируются только разрешённые *: Double; прочие колонки — уникальное объединение."""
+
+    rows = [
+        _row(1, u"Тип", area=1.5, volume=0.25, thickness=200, category=u"Стены"),
+        _row(2, u"Тип", area=2.25, volume=0.5, thickness=200, category=u"стены"),
+        _row(3, u"Тип", area=1.0, volume=0.125, thickness=250, category=u"Перегородки"),
+    ]
+    table = vor_engine.make_subtotals(HEADERS, rows)
+    row = _itogo(table)[_caption(u"Тип", NEW)]
+    _check(_cell(table, row, u"Area : Double") == 4.75, u"Area: {0!r}", _cell(table, row, u"Area : Double"))
+    _check(_cell(table, row, u"Volume : Double") == 0.875, u"Volume: {0!r}", _cell(table, row, u"Volume : Double"))
+    _check(_cell(table, row, u"Thickness : Double") == u"200;250", u"Thickness: {0!r}",
+           _cell(table, row, u"Thickness : Double"))
+    _check(_cell(table, row, u"Category : String") == u"Стены;Перегородки", u"Category: {0!r}",
+           _cell(table, row, u"Category : String"))
+    _check(_cell(table, row, u"ID") == u"1;2;3", u"ID: {0!r}", _cell(table, row, u"ID"))
+
+
+def check_t14():
+    """Все значения суммируемой колонки пусты или 0 — ячейка «Итого» пустая, без формата."""
+
+    table = vor_engine.make_subtotals(HEADERS, [_row(1, u"Тип", area=0.0), _row(2, u"Тип", area=None)])
+    row = _itogo(table)[_caption(u"Тип", NEW)]
+    col = vor_engine.find_header(table.headers, u"Area : Double")
+    _check(row.values[col] is None and row.formats[col] is None, u"Area: {0!r} ({1!r})",
+           row.values[col], row.formats[col])
+    col = vor_engine.find_header(table.headers, u"Volume : Double")
+    _check(row.values[col] is None, u"Volume: {0!r}", row.values[col])
+
+
+def check_t15():
+    """7 знаков и прилипание: 39,9999999999 → 40; 130,0000002 → 130; 0,7500000 → 0,75."""
+
+    rows = [
+        _row(1, u"А", area=39.9999999999),
+        _row(2, u"Б", area=u"130,0000002"),
+        _row(3, u"В", area=u"0,7500000"),
+    ]
+    table = vor_engine.make_subtotals(HEADERS, rows)
+    itogo = _itogo(table)
+    for name, expected in ((u"А", 40.0), (u"Б", 130.0), (u"В", 0.75)):
+        value = _cell(table, itogo[_caption(name, NEW)], u"Area : Double")
+        _check(value == expected, u"{0}: {1!r}, ожидалось {2!r}", name, value, expected)
+    _check(vor_rules.number_token(39.9999999999) == u"40", u"токен 39,9999999999")
+    _check(vor_rules.number_token(130.0000002) == u"130", u"токен 130,0000002")
+
+
+def check_t16():
+    """Форматы: целые и New_Count — «0», дробные — «0.#######»; токены без хвостов в обеих локалях."""
+
+    table = vor_engine.make_subtotals(HEADERS, [_row(1, u"А", area=40.0000001), _row(2, u"Б", area=0.75)])
+    itogo = _itogo(table)
+    col = vor_engine.find_header(table.headers, u"Area : Double")
+    col_count = vor_engine.find_header(table.headers, vor_engine.COL_NEW_COUNT)
+    _check(itogo[_caption(u"А", NEW)].formats[col] == vor_rules.FMT_INT, u"формат целого")
+    _check(itogo[_caption(u"Б", NEW)].formats[col] == vor_rules.FMT_DECIMAL, u"формат дробного")
+    _check(itogo[_caption(u"Б", NEW)].formats[col_count] == vor_rules.FMT_INT, u"формат New_Count")
+    for sep in (u",", u"."):
+        token = vor_rules.number_token(0.7500000, sep)
+        _check(token == u"0{0}75".format(sep), u"токен 0,75 с «{0}»: {1!r}", sep, token)
+        _check(vor_rules.number_token(40.0, sep) == u"40", u"токен 40 с «{0}»", sep)
+
+    # разделитель «.»: текст с точкой — число
+    table = vor_engine.make_subtotals(HEADERS, [_row(1, u"А", area=u"0.75")], u".")
+    value = _cell(table, _itogo(table)[_caption(u"А", NEW)], u"Area : Double")
+    _check(value == 0.75, u"Area с разделителем «.»: {0!r}", value)
+
+
+def check_t17():
+    """Несуммируемый *: Double: один токен → число, несколько → текст."""
+
+    rows = [
+        _row(1, u"А", thickness=40),
+        _row(2, u"А", thickness=u"40"),
+        _row(3, u"А", thickness=u"40,0"),
+        _row(4, u"Б", thickness=40),
+        _row(5, u"Б", thickness=45),
+    ]
+    table = vor_engine.make_subtotals(HEADERS, rows)
+    itogo = _itogo(table)
+    single = itogo[_caption(u"А", NEW)]
+    col = vor_engine.find_header(table.headers, u"Thickness : Double")
+    _check(single.values[col] == 40 and isinstance(single.values[col], float), u"40;40;40: {0!r}",
+           single.values[col])
+    _check(single.formats[col] == vor_rules.FMT_INT, u"формат одного токена: {0!r}", single.formats[col])
+    several = itogo[_caption(u"Б", NEW)]
+    _check(several.values[col] == u"40;45" and several.formats[col] == vor_engine.FMT_TEXT, u"40;45: {0!r}",
+           several.values[col])
+
+
+def check_t18():
+    """new_* не перезаписываются ни в данных, ни в существующих «Итого»."""
+
+    rows = [_row(1, u"Тип", area=1.0, new=u"первая"), _row(2, u"Тип", area=2.0, new=u"вторая")]
+    first = vor_engine.make_subtotals(HEADERS, rows)
+    col = vor_engine.find_header(first.headers, u"new_comment")
+    data = [row.values[col] for row in first.rows if not row.itogo]
+    _check(data == [u"первая", u"вторая"], u"new_comment в данных: {0}", data)
+    caption = _caption(u"Тип", NEW)
+    _check(_itogo(first)[caption].values[col] is None, u"new_comment заполнен в новом «Итого»")
+
+    sheet = [list(row.values) for row in first.rows]
+    for values in sheet:
+        if vor_rules.is_itogo(values[vor_engine.find_header(first.headers, vor_engine.REQ_TYPE)]):
+            values[col] = u"проверено"
+    second = vor_engine.make_subtotals(first.headers, sheet)
+    _check(_itogo(second)[caption].values[col] == u"проверено", u"new_comment «Итого» перезаписан")
+    data = [row.values[col] for row in second.rows if not row.itogo]
+    _check(data == [u"первая", u"вторая"], u"new_comment в данных после повторного запуска: {0}", data)
+
+
+def check_t19():
+    """Повторный запуск обновляет «Итого» на месте и не добавляет строк."""
+
+    rows = [
+        _row(1, u"А", area=1.0),
+        _row(2, u"Б", DEM, area=2.0),
+        _row(3, SPECIAL, area=5.0),
+        _row(4, SPECIAL, area=60.0),
+    ]
+    first = vor_engine.make_subtotals(HEADERS, rows)
+    sheet = [list(row.values) for row in first.rows]
+    second = vor_engine.make_subtotals(first.headers, sheet)
+    _check([row.values for row in second.rows] == [row.values for row in first.rows], u"повторный запуск изменил ВОР")
+    _check(second.updated == second.groups == first.groups, u"обновлено {0} из {1}", second.updated, second.groups)
+    _check(not second.new_count_inserted, u"New_Count вставлен повторно")
+
+    # данные изменились между запусками: те же строки, новые суммы
+    col_id = vor_engine.find_header(first.headers, u"ID")
+    col_area = vor_engine.find_header(first.headers, u"Area : Double")
+    for values in sheet:
+        if values[col_id] == 1:
+            values[col_area] = 7.5
+    third = vor_engine.make_subtotals(first.headers, sheet)
+    _check(len(third.rows) == len(first.rows), u"строк {0}, было {1}", len(third.rows), len(first.rows))
+    value = _cell(third, _itogo(third)[_caption(u"А", NEW)], u"Area : Double")
+    _check(value == 7.5, u"«Итого» не обновлён: {0!r}", value)
+
+
+def check_t20():
+    """Структура: «Итого» на уровне 0, данные группы под ним — на уровне 1."""
+
+    rows = [_row(1, u"А", area=1.0), _row(2, u"А", area=2.0), _row(3, u"Б", DEM, area=3.0)]
+    table = vor_engine.make_subtotals(HEADERS, rows)
+    levels = [(row.itogo, row.level) for row in table.rows]
+    expected = [(True, 0), (False, 1), (True, 0), (False, 1), (False, 1)]
+    _check(levels == expected, u"уровни: {0}", levels)
+
+
+def check_t21():
+    """Счётчики: отобрано строк N и групп G — как по данным."""
+
+    rows = [
+        _row(1, u"А"),
+        _row(2, u"а"),
+        _row(3, u"А", DEM),
+        _row(4, u""),
+        _row(5, u"Б", (u"Снос", u"Новая конструкция")),
+        _row(6, SPECIAL, area=5.0),
+        _row(7, SPECIAL, area=20.0),
+    ]
+    table = vor_engine.make_subtotals(HEADERS, rows)
+    _check(table.selected == 5, u"отобрано {0}, ожидалось 5", table.selected)
+    _check(table.groups == 4, u"групп {0}, ожидалось 4", table.groups)
+    _check(len(_itogo(table)) == table.groups, u"«Итого» {0}, групп {1}", len(_itogo(table)), table.groups)
+
+
+CASES = (
+    ("T01", check_t01),
+    ("T02", check_t02),
+    ("T03", check_t03),
+    ("T04", check_t04),
+    ("T05", check_t05),
+    ("T06", check_t06),
+    ("T07", check_t07),
+    ("T08-T12", check_t08_t12),
+    ("T13", check_t13),
+    ("T14", check_t14),
+    ("T15", check_t15),
+    ("T16", check_t16),
+    ("T17", check_t17),
+    ("T18", check_t18),
+    ("T19", check_t19),
+    ("T20", check_t20),
+    ("T21", check_t21),
+)
+
+
+def _case_ids(case_id):
+    """«T08-T12» -> {T08, ..., T12}."""
+
+    first, _, last = case_id.partition(u"-")
+    if not last:
+        return set([first])
+    return set(u"T{0:02d}".format(number) for number in range(int(first[1:]), int(last[1:]) + 1))
+
+
+def run(names=None):
+    """[(ID, описание, текст ошибки или None), ...] по случаям ``names`` (по умолчанию — все)."""
+
+    wanted = set(name.upper() for name in names or ())
+    results = []
+    for case_id, check in CASES:
+        if wanted and not wanted & _case_ids(case_id):
+            continue
+        title = check.__doc__ or u""
+        if not isinstance(title, type(u"")):  # Python 2: docstring — байты
+            title = title.decode("utf-8")
+        title = title.strip().splitlines()[0]
+        try:
+            check()
+            error = None
+        except AssertionError as exc:
+            error = u"{0}".format(exc)
+        except Exception:
+            error = traceback.format_exc()
+        results.append((case_id, title, error))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u"Приёмочные проверки ВОР (TEST_PLAN.md T01–T21)")
+    parser.add_argument("cases", nargs="*", help=u"ID случаев (по умолчанию все), например T08 T15")
+    args = parser.parse_args(argv)
+
+    results = run(args.cases)
+    if not results:
+        print(u"Нет случаев: {0}".format(u" ".join(args.cases)), file=sys.stderr)
+        return 2
+    failed = 0
+    for case_id, title, error in results:
+        if error is None:
+            print(u"{0:8} ok    {1}".format(case_id, title))
+        else:
+            failed += 1
+            print(u"{0:8} FAIL  {1}\n         {2}".format(case_id, title, error))
+    print(u"Пройдено: {0} из {1}".format(len(results) - failed, len(results)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
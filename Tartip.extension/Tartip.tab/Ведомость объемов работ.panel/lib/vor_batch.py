@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""Пакетная ВОР: выгрузки ИМОКС всех разделов проекта за один запуск.
+
+Выгрузки (папка или маска файлов) обрабатываются пулом исполнителей тем же
+конвейером, что и одна выгрузка (``vor_external.subtotal_file``); ВОР
+каждой — в папке результата под именем ``<выгрузка>_ВОР.xlsx`` (``.csv``).
+Исполнитель загружает правила (``config``, ``vor_rules.BUCKETS``) один раз и
+обрабатывает файлы по очереди; ошибка в одном файле не прерывает остальные.
+
+В папку результата пишутся также:
+
+* ``ВОР_сводка.xlsx`` — лист «Файлы» (счётчики и время по каждой выгрузке)
+  и лист «Итого по проекту»: «Итого» групп, сложенные по всем выгрузкам по
+  ключу (стадия, имя, корзина);
+* ``vor_batch.log`` — журнал запусков (дописывается): строка на выгрузку со
+  временем обработки.
+
+Исполнители — процессы (``multiprocessing``); в IronPython и если пул
+процессов не создаётся — потоки (GIL в IronPython нет, файлы обрабатываются
+параллельно). Память — до ``run_rows`` строк выгрузки на исполнитель.
+
+Запуск вне Revit (общий пакет ``tartip`` — в ``PYTHONPATH``)::
+
+    python -m lib.vor_batch "D:/Проект/Выгрузки/*.xlsx" D:/Проект/ВОР --workers 4
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import datetime
+import glob
+import io
+import os
+import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+if sys.platform == "cli":
+    # в IronPython пакет может импортироваться, но Pool() не работает
+    multiprocessing = None
+else:
+    try:
+        import multiprocessing
+    except ImportError:
+        multiprocessing = None
+
+from tartip import records, xlsx_writer
+
+from . import config, vor_engine, vor_external, vor_rules
+
+SUMMARY_NAME = u"ВОР_сводка.xlsx"
+LOG_NAME = u"vor_batch.log"
+TARGET_SUFFIX = u"_ВОР"
+SOURCE_EXTENSIONS = (u".xlsx", u".csv")
+
+FileResult = records.record_type("FileResult", (
+    "source", "target", "error", "selected", "groups", "updated", "rows_written", "spilled", "seconds", "totals",
+), defaults={"selected": 0, "groups": 0, "updated": 0, "rows_written": 0, "spilled": 0, "seconds": 0.0,
+             "totals": []})
+
+
+def default_workers():
+    """Ядер процессора: ``multiprocessing`` или .NET в IronPython."""
+
+    try:
+        if multiprocessing is not None:
+            return multiprocessing.cpu_count()
+        import System  # noqa: E402 - IronPython
+        return int(System.Environment.ProcessorCount)
+    except Exception:
+        return 1
+
+
+def find_sources(pattern):
+    """Выгрузки по папке (все ``.xlsx``/``.csv``) или маске; результаты ВОР и «~$» пропускаются."""
+
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)
+                 if os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS]
+    else:
+        paths = glob.glob(pattern)
+    sources = []
+    for path in sorted(paths):
+        name = os.path.basename(path)
+        stem = os.path.splitext(name)[0]
+        if name.startswith(u"~$") or name == SUMMARY_NAME or stem.endswith(TARGET_SUFFIX):
+            continue
+        if os.path.isfile(path):
+            sources.append(path)
+    if not sources:
+        raise vor_engine.VorError(u"Выгрузки не найдены: {0}".format(pattern))
+    return sources
+
+
+def target_for(source, out_dir, file_ext=None):
+    """``<папка результата>/<выгрузка>_ВОР.<xlsx|csv>``; по умолчанию — формат выгрузки."""
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    file_ext = file_ext or (u"csv" if vor_external.is_csv(source) else u"xlsx")
+    return os.path.join(out_dir, u"{0}{1}.{2}".format(stem, TARGET_SUFFIX, file_ext.lstrip(u".")))
+
+
+def _process_file(task):
+    """Одна выгрузка в исполнителе; возвращает поля ``FileResult`` списком (передаётся между процессами)."""
+
+    index, source, target, run_rows, decimal_sep, delimiter = task
+    started = time.time()
+    try:
+        result = vor_external.subtotal_file(source, target, run_rows, decimal_sep, None, delimiter, keep_totals=True)
+    except Exception as exc:  # ошибка файла не прерывает пакет
+        record = FileResult(source, target, u"{0}".format(exc) or exc.__class__.__name__)
+        if os.path.exists(target):
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+    else:
+        record = FileResult(source, target, None, result.selected, result.groups, result.updated,
+                            result.rows_written, result.spilled, 0.0, _group_totals(result))
+    record.seconds = time.time() - started
+    return index, record.to_list()
+
+
+def _group_totals(result):
+    """[(ключ группы, подпись «Итого», [значения колонок ``vor_rules.SUM_COLS``]), ...]."""
+
+    col_type = vor_engine.find_header(result.headers, vor_engine.REQ_TYPE)
+    cols = [vor_engine.find_header(result.headers, name) for name in vor_rules.SUM_COLS]
+    return [(key, values[col_type], [values[c] if c >= 0 else None for c in cols])
+            for key, values in result.totals]
+
+
+def _run_threads(tasks, workers, done):
+    """Пул потоков: задачи из очереди, результаты — в главный поток по мере готовности."""
+
+    pending = queue.Queue()
+    finished = queue.Queue()
+    for task in tasks:
+        pending.put(task)
+
+    def _worker():
+        while True:
+            try:
+                task = pending.get_nowait()
+            except queue.Empty:
+                return
+            finished.put(_process_file(task))
+
+    threads = [threading.Thread(target=_worker, name=u"tartip-vor-batch") for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for _ in tasks:
+        done(*finished.get())
+    for thread in threads:
+        thread.join()
+
+
+def _process_pool(workers):
+    """Пул процессов или None, если ``multiprocessing`` недоступен или пул не создаётся."""
+
+    if multiprocessing is None:
+        return None
+    try:
+        return multiprocessing.Pool(workers)
+    except Exception:
+        return None
+
+
+def _run_tasks(tasks, workers, done):
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            done(*_process_file(task))
+        return
+    pool = _process_pool(workers)
+    if pool is None:
+        _run_threads(tasks, workers, done)
+        return
+    try:
+        for index, fields in pool.imap_unordered(_process_file, tasks):
+            done(index, fields)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class ProjectTotals(object):
+    """«Итого» групп всех выгрузок, сложенные по ключу (стадия, имя, корзина)."""
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, source, totals):
+        name = os.path.basename(source)
+        for key, caption, values in totals:
+            key = tuple(key)
+            entry = self.groups.get(key)
+            if entry is None:
+                entry = self.groups[key] = [caption, [], [0.0] * len(values), [False] * len(values)]
+            entry[1].append(name)
+            sums, has = entry[2], entry[3]
+            for index, value in enumerate(values):
+                if isinstance(value, (int, float)):
+                    sums[index] += value
+                    has[index] = True
+
+    def rows(self):
+        """(подпись, стадия, выгрузки, суммы) в порядке Stage → Name → Bucket."""
+
+        for key in sorted(self.groups):
+            caption, files, sums, has = self.groups[key]
+            values = [vor_rules.snap(vor_rules.round_n(total, 7)) if has[i] else None for i, total in enumerate(sums)]
+            yield caption, key[0], files, values
+
+
+def write_summary(path, results, totals):
+    """``ВОР_сводка.xlsx``: лист «Файлы» и лист «Итого по проекту»."""
+
+    with xlsx_writer.XlsxWriter(path, title=u"Сводка ВОР") as book:
+        files = book.add_sheet(u"Файлы", [
+            (u"Выгрузка", "text"), (u"ВОР", "text"), (u"Отобрано строк", "int"), (u"Групп", "int"),
+            (u"Обновлено", "int"), (u"Строк ВОР", "int"), (u"На диске", "int"), (u"Время, с", "qty"),
+            (u"Ошибка", "text"),
+        ], widths=[40, 40, 14, 10, 10, 12, 10, 10, 60])
+        for item in results:
+            files.write_row([
+                os.path.basename(item.source), os.path.basename(item.target) if not item.error else u"",
+                item.selected, item.groups, item.updated, item.rows_written, item.spilled,
+                round(item.seconds, 3), item.error or u"",
+            ])
+
+        columns = [(u"Итого", "text"), (u"Стадия", "text"), (u"Выгрузок", "int")]
+        columns.extend((name, "decimal") for name in vor_rules.SUM_COLS)
+        columns.append((u"Выгрузки", "text"))
+        project = book.add_sheet(u"Итого по проекту", columns,
+                                 widths=[60, 20, 10] + [14] * len(vor_rules.SUM_COLS) + [60])
+        count_index = vor_rules.SUM_COLS.index(vor_engine.COL_NEW_COUNT)
+        for caption, stage, names, values in totals.rows():
+            styles = [None, None, None]
+            for index, value in enumerate(values):
+                is_count = index == count_index
+                fmt = vor_rules.number_format(value, is_count) if value is not None else None
+                styles.append("int" if fmt == vor_rules.FMT_INT else "decimal" if fmt else None)
+            project.write_row([caption, vor_rules.STAGE_NAMES.get(stage, u""), len(names)] + values
+                              + [u"; ".join(names)], styles=styles + [None])
+
+
+def append_log(path, results, workers, seconds):
+    """Дописывает запуск в журнал: заголовок и строка на выгрузку (табуляция)."""
+
+    stamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    failed = sum(1 for item in results if item.error)
+    with io.open(path, "a", encoding="utf-8") as stream:
+        stream.write(u"# {0}\tвыгрузок: {1}, с ошибкой: {2}, исполнителей: {3}, всего {4:.1f} с\n".format(
+            stamp, len(results), failed, workers, seconds))
+        for item in results:
+            stream.write(u"\t".join([
+                stamp, u"ошибка" if item.error else u"ok", u"{0:.3f}".format(item.seconds),
+                u"{0}".format(item.selected), u"{0}".format(item.groups), u"{0}".format(item.rows_written),
+                item.source, item.error or u"",
+            ]) + u"\n")
+
+
+def run_batch(sources, out_dir, workers=None, run_rows=None, decimal_sep=None, delimiter=None, file_ext=None,
+              progress=None):
+    """Обрабатывает выгрузки ``sources``, пишет ВОР, сводку и журнал в ``out_dir``.
+
+    ``progress(FileResult)`` вызывается в текущем потоке по мере готовности
+    файлов. Возвращает ``FileResult`` в порядке ``sources``.
+    """
+
+    started = time.time()
+    workers = max(1, int(workers or default_workers()))
+    run_rows = int(run_rows or config.VOR_RUN_ROWS)
+    decimal_sep = decimal_sep or config.VOR_DECIMAL_SEP
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    tasks = [(index, source, target_for(source, out_dir, file_ext), run_rows, decimal_sep, delimiter)
+             for index, source in enumerate(sources)]
+    results = [None] * len(tasks)
+
+    def _done(index, fields):
+        results[index] = FileResult(*fields)
+        if progress is not None:
+            progress(results[index])
+
+    _run_tasks(tasks, workers, _done)
+
+    totals = ProjectTotals()
+    for item in results:
+        if not item.error:
+            totals.add(item.source, item.totals)
+    write_summary(os.path.join(out_dir, SUMMARY_NAME), results, totals)
+    append_log(os.path.join(out_dir, LOG_NAME), results, workers, time.time() - started)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u"ВОР по всем выгрузкам ИМОКС папки или маски")
+    parser.add_argument("sources", help=u"папка с выгрузками или маска (*.xlsx, *.csv)")
+    parser.add_argument("out_dir", help=u"папка результата")
+    parser.add_argument("--workers", type=int, default=0, help=u"исполнителей (0 — по числу ядер)")
+    parser.add_argument("--run-rows", type=int, default=config.VOR_RUN_ROWS,
+                        help=u"строк выгрузки в памяти исполнителя (по умолчанию %(default)s)")
+    parser.add_argument("--format", choices=("xlsx", "csv"), default=None,
+                        help=u"формат ВОР (по умолчанию — как у выгрузки)")
+    parser.add_argument("--decimal-sep", default=config.VOR_DECIMAL_SEP)
+    args = parser.parse_args(argv)
+
+    try:
+        sources = find_sources(args.sources)
+    except vor_engine.VorError as exc:
+        print(u"{0}".format(exc), file=sys.stderr)
+        return 2
+
+    def _progress(item):
+        if item.error:
+            print(u"ОШИБКА {0}: {1}".format(item.source, item.error), file=sys.stderr)
+        else:
+            print(u"{0}: отобрано {1}, групп {2}, строк {3}; {4:.1f} с".format(
+                os.path.basename(item.source), item.selected, item.groups, item.rows_written, item.seconds))
+
+    started = time.time()
+    results = run_batch(sources, args.out_dir, args.workers, args.run_rows, args.decimal_sep,
+                        file_ext=args.format, progress=_progress)
+    failed = sum(1 for item in results if item.error)
+    print(u"Выгрузок: {0}, с ошибкой: {1}; сводка: {2}; {3:.1f} с".format(
+        len(results), failed, os.path.join(args.out_dir, SUMMARY_NAME), time.time() - started))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,731 @@
+# -*- coding: utf-8 -*-
+"""Замеры движка ВОР вне Revit.
+
+Запуск из папки панели (общий пакет ``tartip`` — в ``PYTHONPATH``)::
+
+    PYTHONPATH=../../lib python -m lib.vor_bench
+
+Сценарии:
+
+* ``tokens`` — одна группа из N элементов (по умолчанию 5000): уникальное
+  объединение ID, категорий и ширин. Сравнивает порт ``AddUniqueText``
+  (строка + ``InStr`` на каждую вставку) с ``vor_engine.TokenSet``;
+  результаты обязаны совпадать символ в символ.
+* ``rerun`` — повторный запуск по уже обработанной таблице (по умолчанию
+  50 000 строк): «Итого» обновляются на месте, результат обязан совпасть
+  с первым запуском, время — сопоставимо с первым (линейно).
+* ``parallel`` — ``vor_parallel`` с 1 и N процессами против
+  ``vor_external`` на сгенерированной выгрузке (по умолчанию 100 000
+  строк, CSV): время, ускорение, пиковая память главного процесса;
+  результаты обязаны совпасть байт в байт.
+* ``suite`` — набор P01 (``ВОР/TEST_PLAN.md`` §8) на сгенерированных
+  выгрузках ИМОКС 1k/10k/100k/1M строк: время по этапам (чтение, фильтр,
+  ключ, сортировка, агрегация, запись) и пиковая память; результат — в
+  JSON, сравнение с прошлым JSON (базой) выявляет регрессии::
+
+      PYTHONPATH=../../lib python -m lib.vor_bench suite --baseline vor_baseline.json --save
+      PYTHONPATH=../../lib python -m lib.vor_bench suite --sizes 1m --no-memory
+
+  Выгрузки генерируются один раз (``generate_export``, фиксированное
+  зерно) и сохраняются в ``--data-dir``.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import bisect
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2, IronPython
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:  # Windows, IronPython
+    resource = None
+
+from tartip import xlsx_writer
+
+from . import config, vor_engine, vor_external, vor_rules, vor_xlsx
+
+SEP = u";"
+
+
+def add_unique_text(existing, value, sep=SEP):
+    """Порт ``AddUniqueText`` из ``MakeSubtotals.bas`` — эталон для сравнения."""
+
+    value = (value or u"").strip()
+    if not value:
+        return existing
+    if not existing:
+        return value
+    if (sep + value + sep).lower() in (sep + existing + sep).lower():
+        return existing
+    return existing + sep + value
+
+
+def single_group_rows(count):
+    """Строки одной группы: уникальные ID, две категории, четыре ширины."""
+
+    rows = []
+    for index in range(count):
+        rows.append([
+            100000 + index,
+            u"Стена_200",
+            u"Стены" if index % 7 else u"стены",
+            u"None",
+            u"Новая конструкция",
+            (200, 250, 200.00000001, 300)[index % 4],
+            1.5,
+        ])
+    return rows
+
+
+SINGLE_GROUP_HEADERS = [
+    u"ID",
+    u"Type Name : String",
+    u"Category : String",
+    u"Phase Demolished : String",
+    u"Phase Created : String",
+    u"Width : Double",
+    u"Volume : Double",
+]
+
+
+EXPORT_HEADERS = [
+    u"ID",
+    u"Type Name : String",
+    u"Category : String",
+    u"Phase Demolished : String",
+    u"Phase Created : String",
+    u"Area : Double",
+    u"Volume : Double",
+    u"Thickness : Double",
+    u"new_note",
+]
+
+_STAGES = ((u"Демонтаж", u"Существующие"), (u"None", u"Новая конструкция"), (u"Снос", u"Новая конструкция"))
+
+
+def export_rows(count, types=3000, seed=1):
+    """Синтетическая выгрузка: ``types`` типов, три пары стадий (одна вне ВОР)."""
+
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        demolished, created = _STAGES[rng.randint(0, 9) // 4]
+        rows.append([
+            index + 1,
+            u"Тип_{0}".format(rng.randint(1, types)),
+            u"Стены",
+            demolished,
+            created,
+            round(rng.uniform(0.5, 80.0), 3),
+            round(rng.uniform(0.01, 5.0), 4),
+            rng.choice((100, 120, 200, 250)),
+            None,
+        ])
+    return rows
+
+
+def _timed(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.time()
+        result = func()
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_tokens(count=5000, repeat=3):
+    """Одна группа из ``count`` элементов: строковый накопитель против TokenSet."""
+
+    rows = single_group_rows(count)
+    columns = (0, 2, 5)
+
+    def by_string():
+        joined = []
+        for col in columns:
+            existing = u""
+            for row in rows:
+                existing = add_unique_text(existing, vor_engine.text_token(row[col]))
+            joined.append(existing)
+        return joined
+
+    def by_token_set():
+        joined = []
+        cache = vor_engine.TokenCache()
+        for col in columns:
+            tokens = vor_engine.TokenSet()
+            for row in rows:
+                tokens.add(*cache.get(row[col]))
+            joined.append(tokens.join())
+        return joined
+
+    string_time, expected = _timed(by_string, repeat)
+    set_time, actual = _timed(by_token_set, repeat)
+    if expected != actual:
+        raise AssertionError(u"TokenSet расходится с AddUniqueText")
+    engine_time, table = _timed(lambda: vor_engine.make_subtotals(SINGLE_GROUP_HEADERS, rows), repeat)
+    itogo = [row for row in table.rows if row.itogo]
+    return {
+        "rows": count,
+        "add_unique_text_s": string_time,
+        "token_set_s": set_time,
+        "make_subtotals_s": engine_time,
+        "groups": table.groups,
+        "id_tokens": len(itogo[0].values[0].split(SEP)) if itogo else 0,
+    }
+
+
+def bench_rerun(count=50000, repeat=1):
+    """Первый запуск и повторный по его результату; проверка идемпотентности."""
+
+    rows = export_rows(count)
+    first_time, first = _timed(lambda: vor_engine.make_subtotals(EXPORT_HEADERS, rows), repeat)
+    sheet = [list(row.values) for row in first.rows]
+    rerun_time, second = _timed(lambda: vor_engine.make_subtotals(first.headers, sheet), repeat)
+    if [row.values for row in second.rows] != [row.values for row in first.rows] or \
+            [row.level for row in second.rows] != [row.level for row in first.rows]:
+        raise AssertionError(u"Повторный запуск изменил ВОР")
+    return {
+        "rows": count,
+        "first_s": first_time,
+        "rerun_s": rerun_time,
+        "groups": second.groups,
+        "updated": second.updated,
+    }
+
+
+def _print_tokens(result):
+    print(u"tokens: {rows} строк в одной группе, ID в «Итого»: {id_tokens}".format(**result))
+    print(u"  AddUniqueText : {0:8.3f} с".format(result["add_unique_text_s"]))
+    print(u"  TokenSet      : {0:8.3f} с".format(result["token_set_s"]))
+    print(u"  make_subtotals: {0:8.3f} с".format(result["make_subtotals_s"]))
+
+
+def _print_rerun(result):
+    print(u"rerun: {rows} строк, групп {groups}, обновлено «Итого» {updated}".format(**result))
+    print(u"  первый запуск : {0:8.3f} с".format(result["first_s"]))
+    print(u"  повторный     : {0:8.3f} с".format(result["rerun_s"]))
+
+
+# ---- набор P01: генератор выгрузок ИМОКС и замеры по этапам ----
+SIZES = (("1k", 1000), ("10k", 10000), ("100k", 100000), ("1m", 1000000))
+DEFAULT_SIZES = ("1k", "10k", "100k")
+STAGES = ("read", "filter", "key", "sort", "aggregate", "write")
+# Ориентир P01 (TEST_PLAN.md §8): ≈10k строк — не дольше 25 с; регрессия — медленнее базы на 20%
+P01_SIZE = "10k"
+P01_SLA_S = 25.0
+REGRESSION_RATIO = 1.2
+# Регрессия — ещё и не меньше, чем на столько секунд (шум таймера и системы)
+REGRESSION_MIN_S = 0.05
+# Выше — без сверки с make_subtotals (память на вторую копию таблицы)
+CHECK_ROWS = 100000
+
+REALISTIC_HEADERS = [
+    u"ID",
+    u"Type Name : String",
+    u"Category : String",
+    u"Phase Demolished : String",
+    u"Phase Created : String",
+    u"Area : Double",
+    u"Volume : Double",
+    u"Length : Double",
+    u"Width : Double",
+    u"Height : Double",
+    u"Thickness : Double",
+    u"Perimeter : Double",
+    u"Unconnected Height : Double",
+    u"Comments : String",
+    u"new_note",
+]
+
+# Семейства типов: категория, доля строк, число типов, шаблон имени, материалы, толщины (мм)
+_FAMILIES = (
+    (u"Стены", 40, 400, u"(стена)_{0}_толщ={1}мм_{2}",
+     (u"кирпич", u"газобетон", u"бетон", u"гкл"), (80, 120, 200, 250, 380)),
+    (u"Перекрытия", 10, 60, u"(перекрытие)_{0}_толщ={1}мм_{2}", (u"монолит", u"пустотка"), (160, 200, 220)),
+    (u"Потолки", 15, 80, u"(потолок)_{0}.отм.3м_толщ={1}мм_{2}", (u"гкл", u"армстронг", u"натяжной"), (5, 12, 25)),
+    (u"Полы", 15, 120, u"(пол)_{0}_толщ={1}мм_{2}", (u"стяжка", u"ламинат", u"плитка"), (10, 40, 70)),
+    (u"Двери", 10, 150, u"(дверь)_{0}_{1}x2100_{2}", (u"мдф", u"металл", u"пвх"), (700, 800, 900)),
+    (u"Окна", 10, 150, u"(окно)_{0}_{1}x1500_{2}", (u"пвх", u"алюминий"), (600, 900, 1200, 1500)),
+)
+# Пары стадий и доли: две пары ВОР и пары вне ВОР; часть — с NBSP и другим регистром
+_STAGE_PAIRS = (
+    ((u"Демонтаж", u"Существующие"), 35),
+    ((u"None", u"Новая конструкция"), 48),
+    ((u"None", u"Существующие"), 10),
+    ((u"Демонтаж", u"Новая конструкция"), 4),
+    ((u" демонтаж\u00A0", u"СУЩЕСТВУЮЩИЕ"), 1),
+    ((u"None", u"Новая\u00A0конструкция"), 2),
+)
+SPECIAL_SHARE = 0.03
+EMPTY_TYPE_SHARE = 0.01
+TEXT_NUMBER_SHARE = 0.05
+
+
+def _weighted(items):
+    """(значения, накопленные веса) для выбора через ``bisect``."""
+
+    values, cumulative, total = [], [], 0.0
+    for value, weight in items:
+        total += weight
+        values.append(value)
+        cumulative.append(total)
+    return values, cumulative
+
+
+def _pick(rng, table):
+    values, cumulative = table
+    return values[bisect.bisect_right(cumulative, rng.random() * cumulative[-1])]
+
+
+def _choice(rng, items):
+    """``rng.choice`` только через ``random()``: одна выгрузка в Python 2 и 3 при одном зерне."""
+
+    return items[int(rng.random() * len(items))]
+
+
+def _family_types(family, rng):
+    """Имена типов семейства с весами Ципфа: немногие типы — на большинство строк."""
+
+    category, _, count, template, materials, sizes = family
+    names = []
+    for index in range(count):
+        name = template.format(_choice(rng, materials), _choice(rng, sizes), index + 1)
+        names.append(((name, category), 1.0 / (index + 1)))
+    return _weighted(names)
+
+
+def _special_area(rng):
+    """Площадь спец-типа: треть — равномерно, остальное — у границ корзин 10/50 (в т.ч. ±EPS)."""
+
+    roll = rng.random()
+    if roll < 0.35:
+        return vor_rules.round_n(rng.uniform(0.5, 80.0), 3)
+    bound = 10.0 if roll < 0.7 else 50.0
+    kind = _choice(rng, (0, 1, 2, 3))
+    if kind == 0:
+        return bound
+    if kind == 1:
+        return bound + rng.uniform(-vor_rules.EPS, vor_rules.EPS)
+    if kind == 2:
+        return bound + _choice(rng, (-1, 1)) * rng.uniform(vor_rules.EPS * 1.01, 1e-5)
+    return vor_rules.round_n(bound + rng.uniform(-0.05, 0.05), 3)
+
+
+def _metrics(category, type_name, rng):
+    """Area, Volume, Length, Width, Height, Thickness, Perimeter, Unconnected Height по категории."""
+
+    if category in (u"Двери", u"Окна"):
+        width = float(type_name.split(u"_")[2].split(u"x")[0])
+        return None, None, None, width, 2100.0 if category == u"Двери" else 1500.0, None, None, None
+    thickness = float(type_name.split(u"толщ=")[1].split(u"мм")[0])
+    area = vor_rules.round_n(rng.lognormvariate(2.5, 0.8), 3)
+    volume = vor_rules.round_n(area * thickness / 1000.0, 4)
+    if category == u"Стены":
+        height = _choice(rng, (2.7, 3.0, 3.3))
+        return area, volume, vor_rules.round_n(area / height, 3), None, None, thickness, None, height
+    return area, volume, None, None, None, thickness, vor_rules.round_n(4 * area ** 0.5, 3), None
+
+
+def generate_export(count, seed=1):
+    """Выгрузка ИМОКС из ``count`` строк по ``REALISTIC_HEADERS``; одинакова при одном ``seed``.
+
+    Типы — по семействам с распределением Ципфа, спец-тип
+    (``vor_rules.SPECIAL_TYPE``) — ``SPECIAL_SHARE`` строк с площадями у
+    границ корзин, пары стадий — ``_STAGE_PAIRS``, часть чисел — текстом с
+    запятой, часть имён типов — пустые.
+    """
+
+    rng = random.Random(seed)
+    families = _weighted((family, family[1]) for family in _FAMILIES)
+    types = dict((family[0], _family_types(family, rng)) for family in _FAMILIES)
+    stages = _weighted(_STAGE_PAIRS)
+    rows = []
+    for index in range(count):
+        demolished, created = _pick(rng, stages)
+        roll = rng.random()
+        if roll < SPECIAL_SHARE:
+            type_name, category = vor_rules.SPECIAL_TYPE, u"Потолки"
+            area = _special_area(rng)
+            metrics = [area, vor_rules.round_n(area * 0.005, 4), None, None, None, 5.0,
+                       vor_rules.round_n(4 * area ** 0.5, 3), None]
+        else:
+            family = _pick(rng, families)
+            type_name, category = _pick(rng, types[family[0]])
+            metrics = list(_metrics(category, type_name, rng))
+            if roll < SPECIAL_SHARE + EMPTY_TYPE_SHARE:
+                type_name = u""
+        if rng.random() < TEXT_NUMBER_SHARE:
+            # repr, как в CSV: текст одинаков в Python 2 и 3
+            metrics = [vor_external.csv_text(value, u",") if isinstance(value, float) else value
+                       for value in metrics]
+        rows.append([index + 1000001, type_name, category, demolished, created] + metrics + [
+            u"секция {0}".format(1 + int(rng.random() * 12)) if rng.random() < 0.3 else None,
+            None,
+        ])
+    return rows
+
+
+def export_path(data_dir, label, seed, file_ext=u"xlsx"):
+    return os.path.join(data_dir, u"imoks_{0}_s{1}.{2}".format(label, seed, file_ext))
+
+
+def write_export(path, headers, rows):
+    """Сохраняет выгрузку в XLSX (как из ИМОКС) или CSV по расширению."""
+
+    if vor_external.is_csv(path):
+        table = (vor_engine.VorRow(row) for row in rows)
+        vor_external.write_csv(path, headers, table, config.VOR_DECIMAL_SEP, config.VOR_CSV_DELIMITER)
+        return
+    with xlsx_writer.XlsxWriter(path, title=u"Выгрузка ИМОКС") as book:
+        sheet = book.add_sheet(u"Выгрузка", [(header, "text") for header in headers])
+        for row in rows:
+            sheet.write_row(row)
+
+
+def _peak_reset():
+    if tracemalloc is not None and hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+
+def _peak_mb():
+    if tracemalloc is None or not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()[1] / 1048576.0
+
+
+def staged_pipeline(source, target, decimal_sep=None, on_stage=None):
+    """``make_subtotals`` по этапам ``STAGES`` на общих методах движка.
+
+    ``on_stage(имя)`` вызывается после каждого этапа. Возвращает
+    ``VorTable``.
+    """
+
+    decimal_sep = decimal_sep or config.VOR_DECIMAL_SEP
+    mark = on_stage or (lambda name: None)
+    rows = vor_external.iter_table_rows(source)
+    headers = [u"{0}".format(h) if h is not None else u"" for h in next(rows, None) or []]
+    rows = list(rows)
+    mark("read")
+
+    layout = vor_engine.Layout(headers, decimal_sep)
+    selected_rows = [item for item in (layout.select(source_row) for source_row in rows) if item is not None]
+    mark("filter")
+
+    prepared = []
+    itogo_index = {}
+    selected = 0
+    for item in selected_rows:
+        entry = layout.key(item)
+        stage, name_key, bucket, itogo, values = entry
+        if itogo:
+            itogo_index.setdefault((name_key, stage, bucket), values)
+        else:
+            selected += 1
+        prepared.append(entry)
+    mark("key")
+
+    prepared.sort(key=vor_engine.sort_key)
+    mark("sort")
+
+    table = vor_engine.build_table(layout, prepared, itogo_index, selected)
+    mark("aggregate")
+
+    vor_xlsx.write_table(target, table)
+    mark("write")
+    return table
+
+
+def _measure(source, target, trace):
+    """Один прогон: {этап: с}, {этап: пик МБ}, таблица."""
+
+    times = {}
+    peaks = {}
+    state = {"last": time.time()}
+
+    def _stage(name):
+        now = time.time()
+        times[name] = now - state["last"]
+        peak = _peak_mb()
+        if peak is not None:
+            peaks[name] = peak
+            _peak_reset()
+        state["last"] = time.time()
+
+    if trace:
+        tracemalloc.start()
+    try:
+        state["last"] = time.time()
+        table = staged_pipeline(source, target, on_stage=_stage)
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return times, peaks, table
+
+
+def _check(source, table):
+    """Сверка поэтапного конвейера с ``make_subtotals`` (значения и структура)."""
+
+    rows = vor_external.iter_table_rows(source)
+    headers = [u"{0}".format(h) if h is not None else u"" for h in next(rows)]
+    expected = vor_engine.make_subtotals(headers, rows, config.VOR_DECIMAL_SEP)
+    if [row.values for row in expected.rows] != [row.values for row in table.rows] or \
+            [row.level for row in expected.rows] != [row.level for row in table.rows]:
+        raise AssertionError(u"Поэтапный конвейер расходится с make_subtotals")
+
+
+def bench_size(label, count, data_dir, seed=1, repeat=1, trace=True, file_ext=u"xlsx"):
+    """Замер одного размера: лучшее время из ``repeat`` по этапам, затем прогон с ``tracemalloc``."""
+
+    source = export_path(data_dir, label, seed, file_ext)
+    if not os.path.exists(source):
+        started = time.time()
+        write_export(source, REALISTIC_HEADERS, generate_export(count, seed))
+        print(u"  {0}: выгрузка сгенерирована за {1:.1f} с".format(label, time.time() - started))
+    target = os.path.join(data_dir, u"vor_{0}.xlsx".format(label))
+
+    best = None
+    table = None
+    for _ in range(repeat):
+        times, _, table = _measure(source, target, trace=False)
+        best = times if best is None else dict((name, min(best[name], times[name])) for name in STAGES)
+    if count <= CHECK_ROWS:
+        _check(source, table)
+    peaks = {}
+    if trace and tracemalloc is not None:
+        _, peaks, _ = _measure(source, target, trace=True)
+    result = {
+        "rows": count,
+        "selected": table.selected,
+        "groups": table.groups,
+        "output_rows": len(table.rows),
+        "source_mb": round(os.path.getsize(source) / 1048576.0, 2),
+        "stages_s": dict((name, round(best[name], 4)) for name in STAGES),
+        "total_s": round(sum(best.values()), 4),
+        "peak_mb": round(max(peaks.values()), 1) if peaks else None,
+        "stage_peak_mb": dict((name, round(value, 1)) for name, value in peaks.items()) or None,
+    }
+    if resource is not None:
+        # ru_maxrss: КБ в Linux, байты в macOS; максимум процесса за всё время
+        scale = 1.0 if sys.platform == "darwin" else 1024.0
+        result["process_maxrss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1048576.0, 1)
+    return result
+
+
+def run_suite(sizes=DEFAULT_SIZES, data_dir=None, seed=1, repeat=1, trace=True, file_ext=u"xlsx"):
+    """Набор P01 по размерам ``sizes`` (метки ``SIZES``); результат — словарь для JSON."""
+
+    counts = dict(SIZES)
+    unknown = [label for label in sizes if label not in counts]
+    if unknown:
+        raise ValueError(u"Неизвестные размеры: {0}; допустимы {1}".format(
+            u", ".join(unknown), u", ".join(label for label, _ in SIZES)))
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), u"tartip_vor_bench")
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    results = {}
+    for label in sizes:
+        results[label] = bench_size(label, counts[label], data_dir, seed, repeat, trace, file_ext)
+        _print_size(label, results[label])
+    return {
+        "meta": {
+            "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "format": file_ext,
+        },
+        "sizes": results,
+    }
+
+
+def comparable(current, baseline):
+    meta = baseline.get("meta", {})
+    if (meta.get("python") or u"").split(u".")[0] != current["meta"]["python"].split(u".")[0]:
+        return False
+    return all(meta.get(field) == current["meta"][field] for field in ("format", "implementation"))
+
+
+def compare(current, baseline, ratio=REGRESSION_RATIO):
+    """Регрессии относительно базы: [(размер, этап, было, стало), ...] — медленнее в ``ratio`` раз.
+
+    Замедление меньше ``REGRESSION_MIN_S`` не считается (шум); база другого
+    формата выгрузки, другой реализации или версии Python не сравнивается.
+    """
+
+    slower = []
+    if not comparable(current, baseline):
+        return slower
+    for label, result in sorted(current["sizes"].items()):
+        base = baseline["sizes"].get(label)
+        if not base or base.get("rows") != result["rows"]:
+            continue
+        pairs = [(name, base["stages_s"].get(name), result["stages_s"][name]) for name in STAGES]
+        pairs.append(("total", base.get("total_s"), result["total_s"]))
+        for name, before, after in pairs:
+            if before is None:
+                continue
+            if after > before * ratio and after - before >= REGRESSION_MIN_S:
+                slower.append((label, name, before, after))
+    return slower
+
+
+def _print_size(label, result):
+    stages = u", ".join(u"{0} {1:.2f}".format(name, result["stages_s"][name]) for name in STAGES)
+    peak = u"; пик {0} МБ".format(result["peak_mb"]) if result["peak_mb"] is not None else u""
+    print(u"{0}: {1} строк, групп {2}; {3} с ({4}){5}".format(
+        label, result["rows"], result["groups"], result["total_s"], stages, peak))
+
+
+def suite_main(argv):
+    parser = argparse.ArgumentParser(prog="vor_bench suite", description=u"Набор P01 движка ВОР")
+    parser.add_argument("--sizes", default=u",".join(DEFAULT_SIZES),
+                        help=u"размеры через запятую: 1k,10k,100k,1m (по умолчанию %(default)s)")
+    parser.add_argument("--data-dir", default=None, help=u"папка сгенерированных выгрузок (по умолчанию — temp)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help=u"повторов; берётся лучшее время")
+    parser.add_argument("--format", choices=("xlsx", "csv"), default="xlsx", help=u"формат выгрузки")
+    parser.add_argument("--no-memory", action="store_true", help=u"без прогона с tracemalloc")
+    parser.add_argument("--out", default=None, help=u"JSON результата (по умолчанию — в --baseline при --save)")
+    parser.add_argument("--baseline", default=None, help=u"JSON базы для сравнения")
+    parser.add_argument("--save", action="store_true", help=u"записать результат как новую базу")
+    args = parser.parse_args(argv)
+
+    sizes = [label.strip().lower() for label in args.sizes.split(u",") if label.strip()]
+    current = run_suite(sizes, args.data_dir, args.seed, args.repeat, not args.no_memory, args.format)
+
+    status = 0
+    p01 = current["sizes"].get(P01_SIZE)
+    if p01 is not None and p01["total_s"] > P01_SLA_S:
+        print(u"P01: {0} с > {1} с (SLA)".format(p01["total_s"], P01_SLA_S))
+        status = 1
+    if args.baseline and os.path.exists(args.baseline):
+        with io.open(args.baseline, "r", encoding="utf-8") as stream:
+            baseline = json.load(stream)
+        if not comparable(current, baseline):
+            print(u"База {0} снята на другом формате выгрузки или Python — сравнение пропущено".format(
+                args.baseline))
+        slower = compare(current, baseline)
+        for label, name, before, after in slower:
+            print(u"РЕГРЕССИЯ {0} {1}: {2:.3f} -> {3:.3f} с".format(label, name, before, after))
+        if slower:
+            status = 1
+        elif not args.save and comparable(current, baseline):
+            print(u"Регрессий относительно {0} нет".format(args.baseline))
+
+    out = args.out or (args.baseline if args.save else None)
+    if out:
+        text = json.dumps(current, ensure_ascii=False, indent=2, sort_keys=True, separators=(",", ": "))
+        with io.open(out, "w", encoding="utf-8") as stream:
+            stream.write(text if isinstance(text, type(u"")) else text.decode("utf-8"))
+        print(u"Результат: {0}".format(out))
+    return status
+
+
+# ---- параллельная агрегация: 1 процесс против N ----
+def _peak_of(func):
+    """Пик памяти главного процесса (МБ) за вызов ``func`` или None без ``tracemalloc``."""
+
+    if tracemalloc is None or tracemalloc.is_tracing():
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return _peak_mb()
+    finally:
+        tracemalloc.stop()
+
+
+def _same_bytes(first, second):
+    with io.open(first, "rb") as a, io.open(second, "rb") as b:
+        return a.read() == b.read()
+
+
+def bench_parallel(count=100000, workers=None, seed=1):
+    """``vor_external`` (один процесс, внешняя память) против ``vor_parallel`` с 1 и ``workers`` процессами."""
+
+    from . import vor_parallel
+
+    workers = max(2, int(workers or vor_parallel.default_workers()))
+    data_dir = tempfile.mkdtemp(prefix=u"vor_parallel_")
+    source = os.path.join(data_dir, u"imoks.csv")
+    write_export(source, REALISTIC_HEADERS, generate_export(count, seed))
+    runs = (
+        ("external", lambda target: vor_external.subtotal_file(source, target)),
+        ("parallel_1", lambda target: vor_parallel.subtotal_file(source, target, 1)),
+        ("parallel_n", lambda target: vor_parallel.subtotal_file(source, target, workers)),
+    )
+    result = {"rows": count, "workers": workers, "cpu": vor_parallel.default_workers()}
+    try:
+        targets = []
+        for name, func in runs:
+            target = os.path.join(data_dir, u"vor_{0}.csv".format(name))
+            # время — без tracemalloc (он замедляет в разы), память — отдельным прогоном
+            result[name + "_s"] = _timed(lambda: func(target), 1)[0]
+            result[name + "_peak_mb"] = _peak_of(lambda: func(target))
+            targets.append(target)
+        for target in targets[1:]:
+            if not _same_bytes(targets[0], target):
+                raise AssertionError(u"{0} расходится с vor_external".format(os.path.basename(target)))
+    finally:
+        for name in os.listdir(data_dir):
+            os.remove(os.path.join(data_dir, name))
+        os.rmdir(data_dir)
+    result["speedup"] = result["parallel_1_s"] / result["parallel_n_s"] if result["parallel_n_s"] else None
+    return result
+
+
+def _print_parallel(result):
+    print(u"parallel: {rows} строк, процессов {workers} (ядер {cpu}); результаты совпадают".format(**result))
+    for name, caption in (("external", u"vor_external   "), ("parallel_1", u"процессов: 1   "),
+                          ("parallel_n", u"процессов: {0}".format(result["workers"]).ljust(15))):
+        peak = result[name + "_peak_mb"]
+        print(u"  {0}: {1:8.3f} с{2}".format(
+            caption, result[name + "_s"], u", пик {0:.1f} МБ".format(peak) if peak is not None else u""))
+    print(u"  ускорение N/1   : {0:8.2f}x".format(result["speedup"]))
+
+
+SCENARIOS = {
+    "tokens": (bench_tokens, _print_tokens),
+    "rerun": (bench_rerun, _print_rerun),
+    "parallel": (bench_parallel, _print_parallel),
+}
+
+
+def main(argv=None):
+    """``vor_bench [сценарий [строк]]`` или ``vor_bench suite [параметры]``; без сценария — все, кроме suite."""
+
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] == "suite":
+        return suite_main(argv[1:])
+    parser = argparse.ArgumentParser(description=u"Замеры движка ВОР",
+                                     epilog=u"suite [параметры] — набор P01 (suite --help)")
+    parser.add_argument("scenario", nargs="?", choices=sorted(SCENARIOS),
+                        help=u"сценарий (по умолчанию все)")
+    parser.add_argument("count", nargs="?", type=int, help=u"строк (элементов) вместо значения сценария")
+    args = parser.parse_args(argv)
+
+    for name in [args.scenario] if args.scenario else sorted(SCENARIOS):
+        bench, report = SCENARIOS[name]
+        report(bench(args.count) if args.count is not None else bench())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
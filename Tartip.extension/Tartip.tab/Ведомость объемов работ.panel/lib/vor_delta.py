@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""Инкрементальная ВОР: новая выгрузка ИМОКС применяется к готовой ВОР.
+
+Строки данных сопоставляются по ``ID``. Новая выгрузка сравнивается со
+строками готовой ВОР: добавленные, удалённые и изменённые строки (в том
+числе сменившие группу) помечают затронутые группы (имя, стадия, корзина).
+Пересчитываются только они — их «Итого» обновляются на месте
+(``vor_external.group_rows``, колонки ``new_*`` сохраняются); остальные
+группы переносятся в результат как есть, без агрегации. Группа, из которой
+ушли все строки, удаляется вместе со своим «Итого».
+
+Строки затронутой группы идут в порядке новой выгрузки, поэтому её «Итого»
+совпадает с полной пересборкой. Чтение обоих файлов и запись результата
+линейны; агрегация — только по затронутым группам.
+
+Колонки выгрузки сопоставляются с колонками ВОР по заголовку; колонки ВОР,
+которых нет в выгрузке (ручные пометки), у изменённых строк сохраняются.
+
+Запуск вне Revit (общий пакет ``tartip`` — в ``PYTHONPATH``)::
+
+    python -m lib.vor_delta vor.xlsx export_new.xlsx vor_new.xlsx
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import sys
+import time
+
+from . import config, vor_engine, vor_external, vor_rules
+
+COL_ID = u"ID"
+
+
+class DeltaResult(vor_external.ExternalResult):
+    """Счётчики ``ExternalResult`` и сведения об изменениях."""
+
+    def __init__(self, layout):
+        super(DeltaResult, self).__init__(layout)
+        self.added = 0
+        self.removed = 0
+        self.changed = 0
+        self.touched = 0
+        self.dropped = 0
+
+
+def _id_key(value, decimal_sep):
+    number = vor_engine.as_number(value, decimal_sep)
+    if number is not None and vor_rules.is_integerish(number):
+        return u"{0}".format(int(round(number)))
+    return u"{0}".format(value if value is not None else u"").strip()
+
+
+def _cell_key(value, decimal_sep):
+    """Значение для сравнения: числа (в т.ч. текстом с запятой) — float, текст — без пробелов по краям."""
+
+    if value is None:
+        return None
+    number = vor_engine.as_number(value, decimal_sep)
+    if number is not None:
+        return number
+    return u"{0}".format(value).strip() or None
+
+
+def _same_cells(values, old_values, columns, decimal_sep):
+    for c in columns:
+        new, old = values[c], old_values[c]
+        # обычно значения равны и без приведения (XLSX — XLSX); CSV — текст против числа ВОР
+        if new != old and _cell_key(new, decimal_sep) != _cell_key(old, decimal_sep):
+            return False
+    return True
+
+
+def _column_map(vor_headers, export_headers):
+    """Индекс колонки выгрузки для каждой колонки ВОР (-1 — нет в выгрузке)."""
+
+    col_map = [vor_engine.find_header(export_headers, header) for header in vor_headers]
+    used = set(col_map)
+    extra = [header for index, header in enumerate(export_headers) if header and index not in used]
+    if extra:
+        raise vor_engine.VorError(
+            u"В выгрузке есть колонки, которых нет в ВОР: {0}. Постройте ВОР заново".format(u", ".join(extra)))
+    return col_map
+
+
+def _itogo_formats(layout, values):
+    """Форматы ячеек «Итого» по значениям — как у ``Layout.itogo_row``, без пересчёта группы."""
+
+    formats = [None] * layout.width
+    col_count = layout.col_count
+    for c in layout.sum_cols:
+        value = values[c]
+        if isinstance(value, (int, float)):
+            formats[c] = vor_rules.number_format(value, c == col_count)
+    for c in layout.text_cols:
+        value = values[c]
+        if isinstance(value, (int, float)):
+            formats[c] = vor_rules.number_format(value)
+        elif value is not None and u"{0}".format(value) != u"":
+            formats[c] = vor_engine.FMT_TEXT
+    formats[layout.col_type] = vor_engine.FMT_TEXT
+    return formats
+
+
+def _read_vor(layout, rows, col_id):
+    """Блоки ВОР по ключу группы (записи ``RunEntry`` в порядке листа) и {ID: (ключ, значения)}."""
+
+    blocks = {}
+    by_id = {}
+    decimal_sep = layout.decimal_sep
+    for seq, source in enumerate(rows):
+        entry = layout.prepare(source)
+        if entry is None:
+            continue
+        stage, name_key, bucket, itogo, values = entry
+        key = (stage, name_key, bucket)
+        blocks.setdefault(key, []).append(vor_external.RunEntry(stage, name_key, bucket, seq, itogo, values))
+        if itogo:
+            continue
+        row_id = _id_key(values[col_id], decimal_sep)
+        if not row_id:
+            raise vor_engine.VorError(u"В ВОР строка данных без ID (строка {0})".format(seq + 2))
+        if row_id in by_id:
+            raise vor_engine.VorError(u"В ВОР повторяется ID {0}".format(row_id))
+        by_id[row_id] = (key, values)
+    return blocks, by_id
+
+
+def _diff(layout, rows, col_map, col_id, by_id, result):
+    """Строки новой выгрузки по ключу группы (в порядке выгрузки) и множество затронутых ключей."""
+
+    decimal_sep = layout.decimal_sep
+    compared = [c for c in range(layout.width) if col_map[c] >= 0]
+    kept = [c for c in range(layout.width) if col_map[c] < 0 and c != layout.col_count]
+    new_rows = {}
+    touched = set()
+    seen = set()
+    for seq, source in enumerate(rows):
+        mapped = [source[i] if 0 <= i < len(source) else None for i in col_map]
+        entry = layout.prepare(mapped)
+        if entry is None or entry[3]:
+            continue
+        stage, name_key, bucket, _, values = entry
+        key = (stage, name_key, bucket)
+        row_id = _id_key(values[col_id], decimal_sep)
+        if not row_id:
+            raise vor_engine.VorError(u"В выгрузке строка без ID (строка {0})".format(seq + 2))
+        if row_id in seen:
+            raise vor_engine.VorError(u"В выгрузке повторяется ID {0}".format(row_id))
+        seen.add(row_id)
+        result.selected += 1
+        old = by_id.get(row_id)
+        if old is None:
+            result.added += 1
+            touched.add(key)
+        else:
+            old_key, old_values = old
+            for c in kept:
+                values[c] = old_values[c]
+            if old_key != key or not _same_cells(values, old_values, compared, decimal_sep):
+                result.changed += 1
+                touched.add(key)
+                touched.add(old_key)
+        new_rows.setdefault(key, []).append(vor_external.RunEntry(stage, name_key, bucket, seq, False, values))
+    for row_id, (key, _) in by_id.items():
+        if row_id not in seen:
+            result.removed += 1
+            touched.add(key)
+    return new_rows, touched
+
+
+def _kept_block(layout, entries, result):
+    """Строки незатронутой группы как в ВОР; форматы «Итого» — по значениям."""
+
+    level = 0
+    has_data = False
+    for index, entry in enumerate(entries):
+        if entry.itogo:
+            row = vor_engine.VorRow(entry.values, itogo=True)
+            row.formats = _itogo_formats(layout, entry.values)
+            # данные — на уровне 1 под «Итого» группы, после других «Итого» — на уровне 0
+            level = 1 if index == 0 else 0
+            yield row
+            continue
+        has_data = True
+        row = vor_engine.VorRow(entry.values)
+        row.level = level
+        yield row
+    if has_data:
+        result.groups += 1
+
+
+def _iter_output(layout, blocks, new_rows, touched, result):
+    for key in sorted(set(blocks) | set(new_rows)):
+        if key not in touched:
+            for row in _kept_block(layout, blocks[key], result):
+                yield row
+            continue
+        data = new_rows.get(key)
+        if not data:
+            result.dropped += 1
+            continue
+        result.touched += 1
+        # «Итого» группы — первое в блоке; прочие «Итого» блока — под данными
+        itogo = [entry for entry in blocks.get(key, ()) if entry.itogo]
+        entries = itogo[:1] + data + itogo[1:]
+        for row in vor_external.group_rows(layout, key, entries, 0, result):
+            yield row
+
+
+def update_file(vor_path, export_path, target, decimal_sep=None, sheet_name=None, delimiter=None):
+    """Применяет выгрузку ``export_path`` к ВОР ``vor_path`` и пишет результат в ``target``.
+
+    ``target`` может совпадать с ``vor_path``: ВОР прочитана целиком до
+    записи. Возвращает ``DeltaResult``.
+    """
+
+    decimal_sep = decimal_sep or config.VOR_DECIMAL_SEP
+    vor_rows = vor_external.iter_table_rows(vor_path, sheet_name, delimiter)
+    vor_headers = next(vor_rows, None)
+    if not vor_headers:
+        raise vor_engine.VorError(u"ВОР пуста: нет строки заголовков")
+    layout = vor_engine.Layout([u"{0}".format(h) if h is not None else u"" for h in vor_headers], decimal_sep)
+    col_id = vor_engine.find_header(layout.headers, COL_ID)
+    if col_id < 0:
+        raise vor_engine.VorError(u"В ВОР нет колонки ID: инкрементальное обновление невозможно")
+    if layout.inserted:
+        raise vor_engine.VorError(u"В файле нет колонки New_Count: это выгрузка, а не готовая ВОР")
+    result = DeltaResult(layout)
+
+    blocks, by_id = _read_vor(layout, vor_rows, col_id)
+
+    export_rows = vor_external.iter_table_rows(export_path, None, delimiter)
+    export_headers = next(export_rows, None)
+    if not export_headers:
+        raise vor_engine.VorError(u"Выгрузка пуста: нет строки заголовков")
+    col_map = _column_map(layout.headers, [u"{0}".format(h) if h is not None else u"" for h in export_headers])
+    if col_map[col_id] < 0:
+        raise vor_engine.VorError(u"В выгрузке нет колонки ID")
+    new_rows, touched = _diff(layout, export_rows, col_map, col_id, by_id, result)
+
+    rows = list(_iter_output(layout, blocks, new_rows, touched, result))
+    vor_external.check_xlsx_size(target, len(rows))
+    vor_external.write_output(target, layout, rows, result, decimal_sep, delimiter)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u"Обновление готовой ВОР по новой выгрузке ИМОКС (по ID)")
+    parser.add_argument("vor", help=u"готовая ВОР (XLSX или CSV)")
+    parser.add_argument("export", help=u"новая выгрузка (XLSX или CSV)")
+    parser.add_argument("target", help=u"результат (может совпадать с ВОР)")
+    parser.add_argument("--sheet", default=None, help=u"лист ВОР (по умолчанию первый)")
+    parser.add_argument("--decimal-sep", default=config.VOR_DECIMAL_SEP)
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    try:
+        result = update_file(args.vor, args.export, args.target, args.decimal_sep, args.sheet)
+    except vor_engine.VorError as exc:
+        print(u"{0}".format(exc), file=sys.stderr)
+        return 2
+    print(u"Добавлено: {0}, удалено: {1}, изменено: {2}; пересчитано групп: {3} из {4}, удалено групп: {5}; "
+          u"строк записано: {6}; {7:.1f} с".format(
+              result.added, result.removed, result.changed, result.touched, result.groups, result.dropped,
+              result.rows_written, time.time() - started))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
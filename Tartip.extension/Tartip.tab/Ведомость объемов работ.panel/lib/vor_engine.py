@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+"""Промежуточные итоги ВОР по таблице ИМОКС — порт ``MakeSubtotals_Configurable``.
+
+Алгоритм — ``ВОР/REPLICATION_GUIDE.md`` §3.2: нормализация заголовков,
+фильтр пар стадий, корзины (``vor_rules.BUCKET_RULES``), сортировка Stage → Name → Bucket,
+агрегация (сумма / уникальное объединение через «;»), округление до 7 знаков
+с прилипанием к целому, строки «Итого» над группами и структура (Outline).
+
+Макрос ищет группу линейным перебором ключей (O(строк × групп)) и пишет в
+лист по ячейке; здесь строки обрабатываются в памяти, группы — словарём по
+ключу (имя, стадия, корзина). Модуль не зависит от Revit и Excel: на вход
+заголовки и строки-списки, на выход ``VorTable`` для записи в любой формат.
+"""
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+from . import vor_rules
+from .vor_rules import norm_header
+
+REQ_TYPE = u"Type Name : String"
+REQ_DEMOLISHED = u"Phase Demolished : String"
+REQ_CREATED = u"Phase Created : String"
+COL_VOLUME = u"Volume : Double"
+COL_NEW_COUNT = u"New_Count : Double"
+
+FMT_TEXT = u"@"
+
+_NEW_COUNT_KEY = norm_header(COL_NEW_COUNT)
+_SUM_KEYS = frozenset(norm_header(name) for name in vor_rules.SUM_COLS)
+_KEEP_KEYS = frozenset(norm_header(name) for name in vor_rules.KEEP_COLS)
+
+
+class VorError(ValueError):
+    """Таблица не подходит для обработки (нет обязательных колонок)."""
+
+
+class VorRow(object):
+    """Строка результата: значения, форматы ячеек, признак «Итого», уровень структуры."""
+
+    __slots__ = ("values", "formats", "itogo", "level")
+
+    def __init__(self, values, itogo=False):
+        self.values = values
+        self.formats = [None] * len(values)
+        self.itogo = itogo
+        self.level = 0
+
+
+class VorTable(object):
+    """Результат обработки.
+
+    ``rows`` — строки в порядке вывода («Итого» над своими данными),
+    ``visible`` — видимость колонок, ``selected`` — отобрано строк данных,
+    ``groups`` — сформировано/обновлено «Итого», ``updated`` — из них
+    обновлено существующих (повторный запуск).
+    """
+
+    def __init__(self, headers, rows, visible, selected, groups, new_count_inserted, updated=0):
+        self.headers = headers
+        self.rows = rows
+        self.visible = visible
+        self.selected = selected
+        self.groups = groups
+        self.new_count_inserted = new_count_inserted
+        self.updated = updated
+
+
+# ---- заголовки ----
+def find_header(headers, name):
+    """Индекс колонки по NormHeader или -1."""
+
+    target = norm_header(name)
+    for index, header in enumerate(headers):
+        if norm_header(header) == target:
+            return index
+    return -1
+
+
+def is_double_header(header):
+    return norm_header(header).endswith(u" : double")
+
+
+def is_protected_header(header):
+    """new_* не перезаписываются (кроме служебного New_Count)."""
+
+    key = norm_header(header)
+    return key.startswith(u"new_") and key != _NEW_COUNT_KEY
+
+
+def column_visibility(headers):
+    """Whitelist + все new_*; остальные скрыты."""
+
+    visible = []
+    for header in headers:
+        key = norm_header(header)
+        visible.append(key.startswith(u"new_") or key in _KEEP_KEYS)
+    return visible
+
+
+# ---- значения ----
+def as_number(value, decimal_sep=u","):
+    """Число ячейки (как IsNumeric + CDbl) или None."""
+
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        text = u"{0}".format(value).strip()
+    except Exception:
+        return None
+    if not text:
+        return None
+    if decimal_sep != u".":
+        text = text.replace(decimal_sep, u".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def text_token(value, decimal_sep=u","):
+    """NumToTextTokenRounded: число -> токен с 7 знаками, иначе trim-текст."""
+
+    number = as_number(value, decimal_sep)
+    if number is not None:
+        return vor_rules.number_token(number, decimal_sep)
+    return u"{0}".format(value).strip()
+
+
+def parse_itogo(caption):
+    """(имя, стадия 0/1/2, корзина) из подписи «Итого»."""
+
+    text = (caption or u"").strip()
+    if text.startswith(vor_rules.ITOGO_PREFIX):
+        text = text[len(vor_rules.ITOGO_PREFIX):].strip()
+    stage = 0
+    pos = text.find(u"[")
+    if pos >= 0:
+        name = text[:pos].strip()
+        tag = text[pos + 1:].lower().replace(u"]", u"")
+        if u"демонтаж" in tag:
+            stage = vor_rules.STAGE_DEMOLISH
+        elif u"новая конструкция" in tag:
+            stage = vor_rules.STAGE_NEW
+    else:
+        name = text
+    return name, stage, vor_rules.BUCKETS.parse_label(name, caption)
+
+
+class TokenSet(object):
+    """Упорядоченное множество токенов колонки группы — замена ``AddUniqueText``.
+
+    Макрос дописывает токен к строке через «;», каждый раз просматривая всю
+    строку (квадратично на тысячах ID). Здесь уникальность без учёта
+    регистра проверяется словарём, порядок — первого появления, строка
+    собирается один раз при записи «Итого». Для единственного токена
+    хранится его число, чтобы не разбирать токен повторно.
+    """
+
+    __slots__ = ("_tokens", "_number")
+
+    def __init__(self):
+        self._tokens = OrderedDict()
+        self._number = None
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def add(self, token, number=None):
+        """Добавляет токен; ``number`` — его число, если токен числовой."""
+
+        if not token:
+            return
+        key = token.lower()
+        if key in self._tokens:
+            return
+        self._tokens[key] = token
+        self._number = number if len(self._tokens) == 1 else None
+
+    def join(self, sep=u";"):
+        return sep.join(self._tokens.values())
+
+    def single_number(self):
+        """Число единственного числового токена или None (правило «один токен → число»)."""
+
+        return self._number
+
+
+class TokenCache(object):
+    """Кэш NumToTextTokenRounded: значение ячейки -> (токен, число).
+
+    Одинаковые значения (толщины, категории) повторяются тысячи раз — токен
+    вычисляется один раз. Уникальные значения (ID) не раздувают кэш сверх
+    ``limit``: при переполнении он сбрасывается.
+    """
+
+    __slots__ = ("decimal_sep", "limit", "_cache")
+
+    def __init__(self, decimal_sep=u",", limit=20000):
+        self.decimal_sep = decimal_sep
+        self.limit = limit
+        self._cache = {}
+
+    def get(self, value):
+        key = (value.__class__, value)
+        hit = self._cache.get(key)
+        if hit is None:
+            number = as_number(value, self.decimal_sep)
+            if number is not None:
+                number = vor_rules.snap(vor_rules.round_n(number, 7))
+                hit = (vor_rules.number_token(number, self.decimal_sep), number)
+            else:
+                hit = (u"{0}".format(value).strip(), None)
+            if len(self._cache) >= self.limit:
+                self._cache.clear()
+            self._cache[key] = hit
+        return hit
+
+
+class _Group(object):
+    __slots__ = ("name", "stage", "bucket", "sums", "has", "nonzero", "tokens")
+
+    def __init__(self, name, stage, bucket, width):
+        self.name = name
+        self.stage = stage
+        self.bucket = bucket
+        self.sums = [0.0] * width
+        self.has = [False] * width
+        self.nonzero = [False] * width
+        # колонка -> TokenSet; создаётся при первом непустом значении
+        self.tokens = [None] * width
+
+
+def _add_token(group, col, token, number=None):
+    if not token:
+        return
+    tokens = group.tokens[col]
+    if tokens is None:
+        tokens = group.tokens[col] = TokenSet()
+    tokens.add(token, number)
+
+
+# ---- основной алгоритм ----
+class Layout(object):
+    """Колонки таблицы (после вставки New_Count) и обработка строки по ним.
+
+    Общая часть для обработки в памяти (``make_subtotals``) и потоковой
+    (``vor_external``): фильтр и ключ строки, агрегация в группу, запись
+    «Итого».
+    """
+
+    def __init__(self, headers, decimal_sep=u","):
+        headers = list(headers)
+        missing = [name for name in (REQ_TYPE, REQ_DEMOLISHED, REQ_CREATED) if find_header(headers, name) < 0]
+        if missing:
+            raise VorError(u"Не найдены обязательные колонки: {0}".format(u", ".join(missing)))
+
+        # New_Count : Double — перед Volume : Double, иначе в конец
+        col_count = find_header(headers, COL_NEW_COUNT)
+        self.inserted = col_count < 0
+        if self.inserted:
+            col_count = find_header(headers, COL_VOLUME)
+            if col_count < 0:
+                col_count = len(headers)
+            headers.insert(col_count, COL_NEW_COUNT)
+        self.headers = headers
+        self.width = width = len(headers)
+        self.decimal_sep = decimal_sep
+        self.col_count = col_count
+        self.col_type = find_header(headers, REQ_TYPE)
+        self.col_dem = find_header(headers, REQ_DEMOLISHED)
+        self.col_cr = find_header(headers, REQ_CREATED)
+        self.buckets = vor_rules.BUCKETS
+        self.metric_cols = dict((rule.metric_key, find_header(headers, rule.metric)) for rule in self.buckets.rules)
+
+        is_sum = [norm_header(h) in _SUM_KEYS for h in headers]
+        protected = [is_protected_header(h) for h in headers]
+        self.is_double = [is_double_header(h) for h in headers]
+        self.sum_cols = [c for c in range(width) if is_sum[c] and not protected[c]]
+        self.text_cols = [c for c in range(width) if not is_sum[c] and not protected[c]]
+        self.visible = column_visibility(headers)
+        self.token_cache = TokenCache(decimal_sep)
+
+    def expand(self, source):
+        """Копия строки входа шириной ``width`` (с пустой ячейкой New_Count, если её вставили)."""
+
+        values = list(source)
+        if self.inserted:
+            values.insert(self.col_count, None)
+        if len(values) < self.width:
+            values.extend([None] * (self.width - len(values)))
+        return values
+
+    def prepare(self, source):
+        """(стадия, ключ имени, корзина, «Итого», значения) или None — строка не в ВОР.
+
+        Значения — ``expand(source)``; в строках данных New_Count = 1. Для
+        «Итого» ключ разобран из подписи.
+        """
+
+        selected = self.select(source)
+        return self.key(selected) if selected is not None else None
+
+    def select(self, source):
+        """Фильтр ``prepare``: (значения, имя типа, стадия, «Итого») или None."""
+
+        values = self.expand(source)
+        type_value = values[self.col_type]
+        type_text = u"{0}".format(type_value if type_value is not None else u"").strip()
+        if vor_rules.is_itogo(type_text):
+            return values, type_text, 0, True
+        if not type_text:
+            return None
+        stage = vor_rules.stage_code(values[self.col_dem], values[self.col_cr])
+        if not stage:
+            return None
+        values[self.col_count] = 1
+        return values, type_text, stage, False
+
+    def key(self, selected):
+        """Ключ ``prepare`` для результата ``select``: имя, корзина; у «Итого» — из подписи."""
+
+        values, type_text, stage, itogo = selected
+        if itogo:
+            name, stage, bucket = parse_itogo(type_text)
+            return stage or vor_rules.STAGE_OTHER, name.strip().lower(), bucket, True, values
+        name_key = type_text.lower()
+        bucket = 0
+        rule = self.buckets.rule_for(name_key)
+        if rule is not None:
+            col = self.metric_cols[rule.metric_key]
+            if col >= 0:
+                bucket = rule.bucket(as_number(values[col], self.decimal_sep))
+        return stage, name_key, bucket, False, values
+
+    def new_group(self, values, stage, bucket):
+        return _Group(values[self.col_type], stage, bucket, self.width)
+
+    def aggregate(self, group, values):
+        """Добавляет строку данных в группу: суммы и уникальные токены."""
+
+        decimal_sep = self.decimal_sep
+        for c in self.sum_cols:
+            number = as_number(values[c], decimal_sep)
+            if number is None:
+                continue
+            group.sums[c] += number
+            group.has[c] = True
+            if not vor_rules.TREAT_ZERO_AS_EMPTY or abs(number) > 5e-12:
+                group.nonzero[c] = True
+        token_cache = self.token_cache
+        for c in self.text_cols:
+            value = values[c]
+            if value is None or u"{0}".format(value) == u"":
+                continue
+            token, number = token_cache.get(value)
+            _add_token(group, c, token, number)
+
+    def itogo_row(self, group, values=None):
+        """Строка «Итого» группы: новая или ``values`` существующей, обновлённые на месте."""
+
+        row = VorRow(values if values is not None else [None] * self.width, itogo=True)
+        row_values = row.values
+        formats = row.formats
+        col_count = self.col_count
+        for c in self.sum_cols:
+            value = vor_rules.total_value(group.sums[c], group.has[c], group.nonzero[c], c == col_count)
+            row_values[c] = value
+            formats[c] = vor_rules.number_format(value, c == col_count) if value is not None else None
+        for c in self.text_cols:
+            tokens = group.tokens[c]
+            if not tokens:
+                row_values[c] = None
+                formats[c] = None
+                continue
+            number = tokens.single_number() if self.is_double[c] else None
+            if number is not None:
+                row_values[c] = number
+                formats[c] = vor_rules.number_format(number)
+            else:
+                row_values[c] = tokens.join()
+                formats[c] = FMT_TEXT
+        row_values[self.col_type] = vor_rules.itogo_caption(group.name, group.stage, group.bucket)
+        formats[self.col_type] = FMT_TEXT
+        return row
+
+
+def sort_key(entry):
+    """Порядок Stage → Name → Bucket для результата ``Layout.prepare``."""
+
+    return entry[0], entry[1], entry[2]
+
+
+def make_subtotals(headers, rows, decimal_sep=u","):
+    """Обрабатывает таблицу и возвращает ``VorTable``.
+
+    ``rows`` — списки значений по колонкам ``headers``; исходные списки не
+    изменяются. Новые «Итого» вставляются над первой строкой данных своей
+    группы.
+
+    Повторный запуск по уже обработанному листу: существующие «Итого»
+    индексируются по ключу (имя, стадия, корзина) за тот же проход, что и
+    фильтр, — подпись разбирается один раз на строку, а не ищется по листу
+    для каждой группы (``FindItogoRowByKey``/``FindFirstRowOfGroup``).
+    Найденная строка обновляется на месте (колонки ``new_*`` сохраняются) и
+    остаётся над своей группой; вставляются только недостающие группы. Лист
+    уже упорядочен, поэтому сортировка (timsort) проходит его линейно.
+    """
+
+    layout = Layout(headers, decimal_sep)
+
+    # 1) копии строк, New_Count = 1, фильтр пустых типов и пар стадий
+    prepared = []
+    itogo_index = {}
+    selected = 0
+    for source in rows:
+        entry = layout.prepare(source)
+        if entry is None:
+            continue
+        stage, name_key, bucket, itogo, values = entry
+        if itogo:
+            itogo_index.setdefault((name_key, stage, bucket), values)
+        else:
+            selected += 1
+        prepared.append(entry)
+
+    # 2) сортировка Stage → Name → Bucket (устойчивая, как Range.Sort)
+    prepared.sort(key=sort_key)
+    return build_table(layout, prepared, itogo_index, selected)
+
+
+def build_table(layout, prepared, itogo_index, selected):
+    """Шаги 3–4 ``make_subtotals``: агрегация отсортированных строк, «Итого», структура.
+
+    ``prepared`` — результаты ``Layout.prepare`` в порядке ``sort_key``,
+    ``itogo_index`` — существующие «Итого» по ключу (имя, стадия, корзина).
+    """
+
+    # 3) агрегация: словарь по ключу группы вместо FindGroupIndex
+    groups = OrderedDict()
+    for stage, name_key, bucket, itogo, values in prepared:
+        if itogo:
+            continue
+        key = (name_key, stage, bucket)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = layout.new_group(values, stage, bucket)
+        layout.aggregate(group, values)
+
+    # 4) «Итого»: существующие — по ключу группы, новые — над первой строкой группы
+    itogo_rows = {}
+    updated = 0
+    for key, group in groups.items():
+        values = itogo_index.get(key)
+        if values is not None:
+            updated += 1
+        itogo_rows[key] = layout.itogo_row(group, values)
+
+    out_rows = []
+    placed = set()
+    for stage, name_key, bucket, itogo, values in prepared:
+        key = (name_key, stage, bucket)
+        if itogo:
+            if key in itogo_rows and itogo_index.get(key) is values:
+                # обновлённая строка уже выведена над группой, если стояла под данными
+                if key not in placed:
+                    out_rows.append(itogo_rows[key])
+                    placed.add(key)
+            else:
+                out_rows.append(VorRow(values, itogo=True))
+            continue
+        if key not in placed:
+            out_rows.append(itogo_rows[key])
+            placed.add(key)
+        out_rows.append(VorRow(values))
+
+    _build_outline(out_rows, itogo_rows)
+    return VorTable(layout.headers, out_rows, layout.visible, selected, len(groups), layout.inserted, updated)
+
+
+def _build_outline(out_rows, itogo_rows):
+    """Уровень 1 для строк данных под своим «Итого» (SummaryRow = xlAbove).
+
+    Строки отсортированы, и «Итого» стоит над первой строкой своей группы,
+    поэтому группа — это строки данных от её «Итого» до следующего «Итого»
+    (проверки имени/стадии/корзины макроса здесь всегда выполняются).
+    """
+
+    group_rows = set(id(row) for row in itogo_rows.values())
+    level = 0
+    for row in out_rows:
+        if row.itogo:
+            level = 1 if id(row) in group_rows else 0
+        else:
+            row.level = level
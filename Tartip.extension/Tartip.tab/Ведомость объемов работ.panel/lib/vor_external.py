@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""ВОР во внешней памяти: выгрузки ИМОКС, которые не помещаются в память.
+
+Конвейер (результат совпадает с ``vor_engine.make_subtotals``):
+
+1. строки читаются потоком из XLSX (``vor_xlsx.iter_sheet_rows``) или CSV,
+   фильтруются и получают ключ (стадия, имя, корзина) — ``vor_engine.Layout``;
+2. по ``run_rows`` строк прогон сортируется и выгружается во временный
+   JSONL (``tartip.records.RecordStore``);
+3. прогоны сливаются (``heapq.merge``) в порядке Stage → Name → Bucket →
+   номер строки, то есть так же устойчиво, как сортировка в памяти;
+4. группы идут подряд: строки группы копятся в буфере (свыше ``run_rows`` —
+   тоже на диск), затем пишутся «Итого» и строки данных — сразу в выходной
+   XLSX/CSV.
+
+В памяти одновременно не больше ``run_rows`` строк выгрузки плюс
+накопители групп (суммы и уникальные токены).
+
+Запуск вне Revit (общий пакет ``tartip`` — в ``PYTHONPATH``)::
+
+    python -m lib.vor_external export.xlsx vor.xlsx --run-rows 200000
+    python -m lib.vor_external export.csv vor.csv --workers 16
+
+С ``--workers`` агрегация выполняется в пуле процессов (``vor_parallel``);
+выгрузка тогда держится в памяти.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import csv
+import heapq
+import io
+import itertools
+import os
+import sys
+import time
+
+from tartip import records, xlsx_writer
+
+from . import config, vor_engine, vor_xlsx
+
+# Строк на листе XLSX (включая заголовок)
+XLSX_MAX_ROWS = 1048576
+
+# CPython 2: модуль csv работает только с байтовыми строками
+_CSV_BYTES = bytes is str and sys.platform != "cli"
+
+# Строка прогона: ключ сортировки, номер строки во входе (устойчивость), признак «Итого», значения
+RunEntry = records.record_type("RunEntry", ("stage", "name_key", "bucket", "seq", "itogo", "values"))
+
+
+class ExternalResult(object):
+    """Итог обработки: те же счётчики, что у ``VorTable``, плюс сведения о прогонах."""
+
+    def __init__(self, layout):
+        self.headers = layout.headers
+        self.visible = layout.visible
+        self.new_count_inserted = layout.inserted
+        self.selected = 0
+        self.groups = 0
+        self.updated = 0
+        self.rows_written = 0
+        self.runs = 0
+        self.spilled = 0
+        # [(ключ группы, значения «Итого»), ...] — если собираются (``keep_totals``)
+        self.totals = None
+
+
+# ---- чтение ----
+def _sniff_delimiter(line):
+    counts = [(line.count(sep), sep) for sep in (u";", u"\t", u",")]
+    return max(counts)[1] if max(counts)[0] else u";"
+
+
+def iter_csv_rows(path, delimiter=None):
+    """Строки CSV (UTF-8, с BOM или без); пустые ячейки — None.
+
+    Разделитель по умолчанию определяется по первой строке: «;», Tab или «,».
+    """
+
+    with io.open(path, "r", encoding="utf-8-sig", newline="") as stream:
+        first = stream.readline()
+        delimiter = delimiter or _sniff_delimiter(first)
+        lines = itertools.chain([first], stream)
+        if _CSV_BYTES:
+            reader = csv.reader((line.encode("utf-8") for line in lines), delimiter=str(delimiter))
+            for cells in reader:
+                yield [cell.decode("utf-8") if cell else None for cell in cells]
+        else:
+            for cells in csv.reader(lines, delimiter=str(delimiter)):
+                yield [cell if cell else None for cell in cells]
+
+
+def iter_table_rows(path, sheet_name=None, delimiter=None):
+    """Строки выгрузки по расширению файла: ``.csv``/``.txt`` — CSV, иначе XLSX."""
+
+    if is_csv(path):
+        return iter_csv_rows(path, delimiter)
+    return vor_xlsx.iter_sheet_rows(path, sheet_name)
+
+
+# ---- внешняя сортировка ----
+def entry_key(entry):
+    return entry.stage, entry.name_key, entry.bucket
+
+
+def _close_run(buffer, spill):
+    buffer.sort(key=entry_key)
+    run = records.RecordStore(RunEntry, spill_limit=0)
+    run.extend(buffer)
+    if spill:
+        run.spill()
+    return run
+
+
+def _write_runs(layout, rows, run_rows, result):
+    """Отсортированные прогоны; последний остаётся в памяти.
+
+    Возвращает также число строк выхода: строки ВОР + недостающие «Итого».
+    """
+
+    runs = []
+    buffer = []
+    data_keys = set()
+    itogo_keys = set()
+    seq = 0
+    for source in rows:
+        entry = layout.prepare(source)
+        if entry is None:
+            continue
+        stage, name_key, bucket, itogo, values = entry
+        if itogo:
+            itogo_keys.add((stage, name_key, bucket))
+        else:
+            data_keys.add((stage, name_key, bucket))
+            result.selected += 1
+        buffer.append(RunEntry(stage, name_key, bucket, seq, itogo, values))
+        seq += 1
+        if len(buffer) >= run_rows:
+            runs.append(_close_run(buffer, spill=True))
+            buffer = []
+    if buffer or not runs:
+        runs.append(_close_run(buffer, spill=False))
+    result.runs = len(runs)
+    result.spilled = sum(run.spilled for run in runs)
+    return runs, seq + len(data_keys - itogo_keys)
+
+
+def _merged(runs):
+    """Слияние прогонов по (ключ, номер строки); номер уникален — до записей сравнение не доходит."""
+
+    streams = [((entry.stage, entry.name_key, entry.bucket, entry.seq, entry) for entry in run) for run in runs]
+    for item in heapq.merge(*streams):
+        yield item[4]
+
+
+def group_rows(layout, key, entries, buffer_rows, result):
+    """Строки ВОР одной группы ключа: «Итого» (новая или обновлённая) и строки данных.
+
+    ``entries`` — записи ``RunEntry`` ключа в порядке входа; копятся в
+    буфере (свыше ``buffer_rows`` — на диске, 0 — без ограничения).
+    """
+
+    stage, _, bucket = key
+    pending = records.RecordStore(RunEntry, spill_limit=buffer_rows)
+    group = None
+    existing = None
+    try:
+        for entry in entries:
+            if entry.itogo:
+                if existing is None:
+                    existing = entry
+            else:
+                if group is None:
+                    group = layout.new_group(entry.values, stage, bucket)
+                layout.aggregate(group, entry.values)
+            pending.append(entry)
+
+        if group is None:
+            # «Итого» без строк данных (группа исчезла) — остаётся как есть
+            for entry in pending:
+                yield vor_engine.VorRow(entry.values, itogo=True)
+            return
+
+        result.groups += 1
+        if existing is not None:
+            result.updated += 1
+        row = layout.itogo_row(group, existing.values if existing is not None else None)
+        if result.totals is not None:
+            result.totals.append((key, row.values))
+        yield row
+        level = 1
+        for entry in pending:
+            if entry.itogo:
+                if entry.seq == existing.seq:
+                    continue
+                level = 0
+                yield vor_engine.VorRow(entry.values, itogo=True)
+                continue
+            row = vor_engine.VorRow(entry.values)
+            row.level = level
+            yield row
+    finally:
+        pending.close()
+
+
+def _iter_output(layout, entries, buffer_rows, result):
+    """Строки ВОР (``vor_engine.VorRow``) в порядке вывода, группа за группой."""
+
+    for key, key_entries in itertools.groupby(entries, key=entry_key):
+        for row in group_rows(layout, key, key_entries, buffer_rows, result):
+            yield row
+
+
+# ---- запись ----
+def csv_text(value, decimal_sep):
+    """Текст ячейки CSV: числа — с ``decimal_sep``, целые без «.0», None — пусто."""
+
+    if value is None:
+        return u""
+    if isinstance(value, float):
+        text = repr(value)
+        if text.endswith(u".0"):
+            text = text[:-2]
+        return text.replace(u".", decimal_sep)
+    return u"{0}".format(value)
+
+
+def write_csv(path, headers, rows, decimal_sep, delimiter):
+    """CSV (UTF-8 с BOM) из заголовков и строк ``vor_engine.VorRow``."""
+
+    if _CSV_BYTES:
+        stream = io.open(path, "wb")
+        stream.write(b"\xef\xbb\xbf")
+        writer = csv.writer(stream, delimiter=str(delimiter), lineterminator="\r\n")
+
+        def _write(cells):
+            writer.writerow([cell.encode("utf-8") for cell in cells])
+    else:
+        stream = io.open(path, "w", encoding="utf-8-sig", newline="")
+        writer = csv.writer(stream, delimiter=str(delimiter), lineterminator="\r\n")
+        _write = writer.writerow
+    try:
+        _write(headers)
+        for row in rows:
+            _write([csv_text(value, decimal_sep) for value in row.values])
+    finally:
+        stream.close()
+
+
+def _counted(rows, result):
+    for row in rows:
+        result.rows_written += 1
+        yield row
+
+
+def is_csv(path):
+    return os.path.splitext(path)[1].lower() in (u".csv", u".txt")
+
+
+def check_xlsx_size(target, total):
+    """VorError, если ``total`` строк ВОР не поместится на лист XLSX ``target``."""
+
+    if not is_csv(target) and total + 1 > XLSX_MAX_ROWS:
+        raise vor_engine.VorError(
+            u"ВОР из {0} строк не помещается на лист XLSX ({1}); сохраните в CSV".format(total, XLSX_MAX_ROWS))
+
+
+def write_output(target, layout, rows, result, decimal_sep=None, delimiter=None):
+    """Пишет строки ВОР в ``target``: CSV по расширению ``.csv``/``.txt``, иначе XLSX."""
+
+    rows = _counted(rows, result)
+    if is_csv(target):
+        write_csv(target, layout.headers, rows, decimal_sep or config.VOR_DECIMAL_SEP,
+                   delimiter or config.VOR_CSV_DELIMITER)
+    else:
+        with xlsx_writer.XlsxWriter(target, title=u"ВОР") as book:
+            vor_xlsx.write_sheet(book, layout.headers, rows, layout.visible)
+
+
+def subtotal_file(source, target, run_rows=None, decimal_sep=None, sheet_name=None, delimiter=None,
+                  keep_totals=False):
+    """Обрабатывает выгрузку ``source`` и пишет ВОР в ``target`` (XLSX или CSV).
+
+    ``run_rows`` — бюджет памяти в строках выгрузки (по умолчанию
+    ``config.VOR_RUN_ROWS``). ``keep_totals`` — сохранить строки «Итого» групп
+    в ``result.totals``. Возвращает ``ExternalResult``.
+    """
+
+    run_rows = int(run_rows or config.VOR_RUN_ROWS)
+    decimal_sep = decimal_sep or config.VOR_DECIMAL_SEP
+    rows = iter_table_rows(source, sheet_name, delimiter)
+    headers = next(rows, None)
+    if not headers:
+        raise vor_engine.VorError(u"Выгрузка пуста: нет строки заголовков")
+    layout = vor_engine.Layout([u"{0}".format(h) if h is not None else u"" for h in headers], decimal_sep)
+    result = ExternalResult(layout)
+    if keep_totals:
+        result.totals = []
+
+    runs, total = _write_runs(layout, rows, run_rows, result)
+    try:
+        check_xlsx_size(target, total)
+        write_output(target, layout, _iter_output(layout, _merged(runs), run_rows, result), result,
+                     decimal_sep, delimiter)
+    finally:
+        for run in runs:
+            run.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u"ВОР по выгрузке ИМОКС во внешней памяти")
+    parser.add_argument("source", help=u"выгрузка XLSX или CSV")
+    parser.add_argument("target", help=u"результат XLSX или CSV")
+    parser.add_argument("--run-rows", type=int, default=config.VOR_RUN_ROWS,
+                        help=u"строк выгрузки в памяти (по умолчанию %(default)s)")
+    parser.add_argument("--sheet", default=None, help=u"лист XLSX (по умолчанию первый)")
+    parser.add_argument("--decimal-sep", default=config.VOR_DECIMAL_SEP)
+    parser.add_argument("--workers", type=int, default=0,
+                        help=u"процессов агрегации (0 — внешняя память в одном процессе)")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    try:
+        if args.workers:
+            from . import vor_parallel
+            result = vor_parallel.subtotal_file(args.source, args.target, args.workers, args.decimal_sep, args.sheet)
+        else:
+            result = subtotal_file(args.source, args.target, args.run_rows, args.decimal_sep, args.sheet)
+    except vor_engine.VorError as exc:
+        print(u"{0}".format(exc), file=sys.stderr)
+        return 2
+    print(u"Отобрано строк: {0}; групп: {1} (обновлено {2}); строк записано: {3}; "
+          u"прогонов: {4} (на диске {5} строк); {6:.1f} с".format(
+              result.selected, result.groups, result.updated, result.rows_written,
+              result.runs, result.spilled, time.time() - started))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
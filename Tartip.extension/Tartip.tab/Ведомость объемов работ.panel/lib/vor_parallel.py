@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Параллельная агрегация ВОР: разбиение строк по имени типа между процессами.
+
+Группы ВОР (имя, стадия, корзина) независимы. Строки выгрузки делятся на
+``workers`` частей по CRC32 ключа имени (у «Итого» — имени из подписи), так
+что каждая группа целиком попадает в одну часть. Часть обрабатывается в
+отдельном процессе тем же кодом, что и в одном процессе
+(``vor_engine.Layout``, ``vor_external.group_rows``); группы частей
+сливаются по ключу Stage → Name → Bucket. Номер строки во входе сохраняется,
+порядок строк внутри группы и порядок сложения — те же, поэтому результат
+совпадает с однопроцессным байт в байт.
+
+Обратно из процесса передаются только строки «Итого» и пары (номер строки,
+уровень структуры); строки данных главный процесс восстанавливает из
+входа сам (``Layout.expand`` + New_Count = 1).
+
+Чтение выгрузки и запись результата остаются в главном процессе, поэтому
+ускорение меньше числа ядер: параллелится фильтр, сортировка и агрегация.
+На одном ядре процессы только добавляют сериализацию. Замер 1 процесса
+против N и сверка с ``vor_external`` — ``python -m lib.vor_bench parallel``.
+
+Память не ограничена ``run_rows``, как в ``vor_external``. Главный процесс
+держит все строки выгрузки до конца записи; часть передаётся исполнителю
+сериализованной целиком; исполнитель держит свою часть и её записи. На
+100 000 строк (CSV) пик главного процесса — около 130 МБ против 97 МБ у
+``vor_external``. Выгрузки, которые не помещаются в память, — только через
+``vor_external`` (без ``--workers``).
+
+В IronPython (pyRevit) ``multiprocessing`` не используется, а если пул
+процессов не создаётся, части обрабатываются последовательно в текущем
+процессе; результат тот же.
+"""
+from __future__ import absolute_import
+
+import heapq
+import itertools
+import sys
+import zlib
+
+if sys.platform == "cli":
+    # в IronPython пакет может импортироваться, но Pool() не работает
+    multiprocessing = None
+else:
+    try:
+        import multiprocessing
+    except ImportError:
+        multiprocessing = None
+
+from . import config, vor_engine, vor_external, vor_rules
+
+
+def default_workers():
+    if multiprocessing is None:
+        return 1
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def _process_pool(workers):
+    """Пул процессов или None, если ``multiprocessing`` недоступен или пул не создаётся."""
+
+    if multiprocessing is None:
+        return None
+    try:
+        return multiprocessing.Pool(workers)
+    except Exception:
+        return None
+
+
+def partition_of(type_value, count):
+    """Номер части строки по значению колонки типа; группа не делится между частями."""
+
+    text = u"{0}".format(type_value if type_value is not None else u"").strip()
+    if vor_rules.is_itogo(text):
+        text = vor_engine.parse_itogo(text)[0]
+    return (zlib.crc32(text.strip().lower().encode("utf-8")) & 0xffffffff) % count
+
+
+def _process_partition(task):
+    """Обработка части в процессе-исполнителе.
+
+    Возвращает группы ``[(ключ, строки), ...]`` в порядке ключа и счётчики
+    (отобрано, групп, обновлено). Строка — ``(значения, форматы)`` для
+    «Итого» группы или ``(номер строки входа, уровень)`` для остальных.
+    """
+
+    headers, decimal_sep, rows = task
+    layout = vor_engine.Layout(headers, decimal_sep)
+    result = vor_external.ExternalResult(layout)
+    entries = []
+    for seq, source in rows:
+        entry = layout.prepare(source)
+        if entry is None:
+            continue
+        stage, name_key, bucket, itogo, values = entry
+        if not itogo:
+            result.selected += 1
+        entries.append(vor_external.RunEntry(stage, name_key, bucket, seq, itogo, values))
+    entries.sort(key=vor_external.entry_key)
+
+    blocks = []
+    for key, key_entries in itertools.groupby(entries, key=vor_external.entry_key):
+        key_entries = list(key_entries)
+        # group_rows выдаёт строки в порядке key_entries; обновлённое «Итого» (первое) — уже сводной строкой
+        rows_out = []
+        source = iter(key_entries)
+        updated = False
+        for row in vor_external.group_rows(layout, key, key_entries, 0, result):
+            if row.formats[layout.col_type] is not None:
+                rows_out.append((row.values, row.formats))
+                updated = True
+                continue
+            entry = next(source)
+            if updated and entry.itogo:
+                updated = False
+                entry = next(source)
+            rows_out.append((entry.seq, row.level))
+        blocks.append((key, rows_out))
+    return blocks, (result.selected, result.groups, result.updated)
+
+
+def _merged_rows(layout, source_rows, partials):
+    """Строки ВОР из групп всех частей в порядке ключа (ключи частей не пересекаются)."""
+
+    col_type = layout.col_type
+    col_count = layout.col_count
+    for _, rows in heapq.merge(*partials):
+        for first, second in rows:
+            if isinstance(first, list):
+                row = vor_engine.VorRow(first, itogo=True)
+                row.formats = second
+                yield row
+                continue
+            values = layout.expand(source_rows[first])
+            itogo = vor_rules.is_itogo(u"{0}".format(values[col_type] if values[col_type] is not None else u""))
+            if not itogo:
+                values[col_count] = 1
+            row = vor_engine.VorRow(values, itogo)
+            row.level = second
+            yield row
+
+
+def subtotal_file(source, target, workers=None, decimal_sep=None, sheet_name=None, delimiter=None):
+    """Как ``vor_external.subtotal_file``, но агрегация — в ``workers`` процессах.
+
+    Выгрузка держится в памяти целиком (граница памяти — в описании модуля);
+    для выгрузок больше памяти — ``vor_external``.
+    """
+
+    workers = max(1, int(workers or default_workers()))
+    decimal_sep = decimal_sep or config.VOR_DECIMAL_SEP
+    rows = vor_external.iter_table_rows(source, sheet_name, delimiter)
+    headers = next(rows, None)
+    if not headers:
+        raise vor_engine.VorError(u"Выгрузка пуста: нет строки заголовков")
+    headers = [u"{0}".format(h) if h is not None else u"" for h in headers]
+    layout = vor_engine.Layout(headers, decimal_sep)
+    col_type = vor_engine.find_header(headers, vor_engine.REQ_TYPE)
+
+    source_rows = list(rows)
+    parts = [[] for _ in range(workers)]
+    for seq, values in enumerate(source_rows):
+        type_value = values[col_type] if col_type < len(values) else None
+        parts[partition_of(type_value, workers)].append((seq, values))
+    tasks = [(headers, decimal_sep, part) for part in parts if part]
+
+    pool = _process_pool(min(workers, len(tasks))) if workers > 1 and len(tasks) > 1 else None
+    if pool is None:
+        outputs = [_process_partition(task) for task in tasks]
+    else:
+        try:
+            outputs = pool.map(_process_partition, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    result = vor_external.ExternalResult(layout)
+    result.runs = len(tasks)
+    for _, (selected, groups, updated) in outputs:
+        result.selected += selected
+        result.groups += groups
+        result.updated += updated
+    total = sum(len(rows_out) for blocks, _ in outputs for _, rows_out in blocks)
+    vor_external.check_xlsx_size(target, total)
+    vor_external.write_output(target, layout, _merged_rows(layout, source_rows, [blocks for blocks, _ in outputs]),
+                              result, decimal_sep, delimiter)
+    return result
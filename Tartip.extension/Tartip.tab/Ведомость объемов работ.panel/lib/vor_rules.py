@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""Правила ВОР: стадии, корзины площади, подписи «Итого», округление и форматы.
+
+Повторяют макрос ``MakeSubtotals.bas`` (см. ``ВОР/DATA_SCHEMAS.md``), чтобы
+ВОР из модели и ВОР из выгрузки ИМОКС совпадали до символа.
+
+Корзины задаются таблицей ``BUCKET_RULES``; первая строка — корзины площади
+спец-типа из макроса (§6), другие типы и метрики добавляются строками
+таблицы без изменения кода.
+"""
+from __future__ import absolute_import
+
+import bisect
+import math
+import re
+
+# Эпсилон для сравнения с целым и с границами корзин.
+EPS = 5e-7
+# Нули считать «пустыми» в итогах суммируемых колонок (кроме New_Count).
+TREAT_ZERO_AS_EMPTY = True
+# Деление по площади в макросе включается только для этого типа.
+SPECIAL_TYPE = u"(потолок)_жилье_натяжной.отм.3м_толщ=5мм"
+
+STAGE_DEMOLISH = 1
+STAGE_NEW = 2
+STAGE_OTHER = 99
+
+# Допустимые пары (стадия сноса, стадия возведения) -> код стадии
+STAGE_PAIRS = {
+    (u"демонтаж", u"существующие"): STAGE_DEMOLISH,
+    (u"none", u"новая конструкция"): STAGE_NEW,
+}
+STAGE_NAMES = {STAGE_DEMOLISH: u"Демонтаж", STAGE_NEW: u"Новая конструкция"}
+
+# Корзины: (имя типа, колонка-метрика, границы по возрастанию, метки корзин).
+# Имя сравнивается без учёта регистра и пробелов по краям; с префиксом «re:» —
+# регулярное выражение на всё имя. Меток на одну больше, чем границ; значение
+# в пределах EPS от границы — без корзины. Применяется первое подходящее правило.
+BUCKET_RULES = (
+    (SPECIAL_TYPE, u"Area : Double", (10.0, 50.0), (u" (до 10м2)", u" (от 10 до 50м2)", u" (от 50м2)")),
+)
+
+ITOGO_PREFIX = u"Итого:"
+
+SUM_COLS = (
+    u"New_Count : Double",
+    u"Volume : Double",
+    u"Area : Double",
+    u"Length : Double",
+    u"Perimeter : Double",
+    u"Unconnected Height : Double",
+)
+KEEP_COLS = (
+    u"ID",
+    u"Type Name : String",
+    u"Category : String",
+    u"New_Count : Double",
+    u"Volume : Double",
+    u"Area : Double",
+    u"Length : Double",
+    u"Width : Double",
+    u"Phase Demolished : String",
+    u"Phase Created : String",
+    u"Thickness : Double",
+    u"Perimeter : Double",
+    u"Unconnected Height : Double",
+    u"Height : Double",
+)
+
+FMT_INT = u"0"
+FMT_DECIMAL = u"0.#######"
+
+_SPACES_RE = re.compile(u"[ \t\u00A0]+")
+_COLON_RE = re.compile(u" ?: ?")
+_GESN_FRAGMENT_RE = re.compile(u"([^;\\[\\]]+?)\\s*\\[([^\\]]*)\\]")
+
+
+def clean_text(value):
+    """Текст для сравнения стадий: NBSP -> пробел, trim, нижний регистр."""
+
+    if value is None:
+        return u""
+    return u"{0}".format(value).replace(u"\u00A0", u" ").strip().lower()
+
+
+def norm_header(text):
+    """NormHeader: пробелы/табы/NBSP сжаты, двоеточие как « : », нижний регистр."""
+
+    text = _SPACES_RE.sub(u" ", u"{0}".format(text or u"")).strip()
+    return _COLON_RE.sub(u" : ", text).lower()
+
+
+def stage_code(demolished, created):
+    """1 — (Демонтаж, Существующие), 2 — (None, Новая конструкция), иначе 0."""
+
+    return STAGE_PAIRS.get((clean_text(demolished), clean_text(created)), 0)
+
+
+class BucketRule(object):
+    """Строка ``BUCKET_RULES``: шаблон имени, метрика и корзины ``first``..``first + len(labels) - 1``.
+
+    Номера корзин сквозные по всей таблице, чтобы подпись «Итого» и порядок
+    сортировки определялись одним номером.
+    """
+
+    __slots__ = ("pattern", "metric", "metric_key", "first", "labels", "_edges")
+
+    def __init__(self, pattern, metric, bounds, labels, first):
+        bounds = [float(bound) for bound in bounds]
+        if bounds != sorted(bounds) or len(labels) != len(bounds) + 1:
+            raise ValueError(u"Корзины {0}: границы не по возрастанию или меток не {1}".format(
+                pattern, len(bounds) + 1))
+        if pattern.startswith(u"re:"):
+            self.pattern = re.compile(u"(?:{0})\\Z".format(pattern[3:].strip()), re.IGNORECASE | re.UNICODE)
+        else:
+            self.pattern = re.compile(re.escape(pattern.strip().lower()) + u"\\Z", re.UNICODE)
+        self.metric = metric
+        self.metric_key = norm_header(metric)
+        self.first = first
+        self.labels = tuple(labels)
+        # Края интервалов: [b1 - EPS, b1 + EPS, b2 - EPS, ...]; корзины — между парами
+        self._edges = []
+        for bound in bounds:
+            self._edges.extend((bound - EPS, bound + EPS))
+
+    def matches(self, name_key):
+        return self.pattern.match(name_key) is not None
+
+    def bucket(self, value):
+        """Номер корзины для значения метрики; 0 — нет значения или оно на границе (±EPS)."""
+
+        if value is None:
+            return 0
+        edges = self._edges
+        pos = bisect.bisect_right(edges, value)
+        # нечётная позиция — внутри [b - EPS, b + EPS); на самом b + EPS — тоже граница
+        if pos & 1 or (pos and value == edges[pos - 1]):
+            return 0
+        return self.first + pos // 2
+
+
+class BucketTable(object):
+    """Правила корзин, скомпилированные один раз; правило типа кешируется по ключу имени."""
+
+    def __init__(self, rows):
+        self.rules = []
+        self.labels = {}
+        first = 1
+        for pattern, metric, bounds, labels in rows:
+            rule = BucketRule(pattern, metric, bounds, labels, first)
+            self.rules.append(rule)
+            for offset, label in enumerate(rule.labels):
+                self.labels[first + offset] = label
+            first += len(rule.labels)
+        self._by_name = {}
+
+    def rule_for(self, name_key):
+        """Правило для ``lower(trim(имя типа))`` или None."""
+
+        try:
+            return self._by_name[name_key]
+        except KeyError:
+            pass
+        found = None
+        for rule in self.rules:
+            if rule.matches(name_key):
+                found = rule
+                break
+        self._by_name[name_key] = found
+        return found
+
+    def label(self, bucket):
+        return self.labels.get(bucket, u"")
+
+    def parse_label(self, name, caption):
+        """Номер корзины по метке в подписи «Итого» типа ``name``; 0 — метки нет."""
+
+        rule = self.rule_for((name or u"").strip().lower())
+        if rule is None:
+            return 0
+        lower = (caption or u"").lower()
+        found, length = 0, 0
+        for offset, label in enumerate(rule.labels):
+            label = label.strip().lower()
+            if label and label in lower and len(label) > length:
+                found, length = rule.first + offset, len(label)
+        return found
+
+
+BUCKETS = BucketTable(BUCKET_RULES)
+
+
+def bucket_for(type_name, metrics):
+    """Корзина элемента модели; ``metrics`` — {заголовок колонки-метрики: значение}."""
+
+    rule = BUCKETS.rule_for((type_name or u"").strip().lower())
+    if rule is None:
+        return 0
+    for header, value in metrics.items():
+        if norm_header(header) == rule.metric_key:
+            return rule.bucket(value)
+    return 0
+
+
+def bucket_label(bucket):
+    return BUCKETS.label(bucket)
+
+
+def itogo_caption(name, stage, bucket):
+    """«Итого: <имя> [Демонтаж|Новая конструкция]<метка корзины>»."""
+
+    tag = STAGE_NAMES.get(stage)
+    return u"{0} {1}{2}{3}".format(
+        ITOGO_PREFIX, name, u" [{0}]".format(tag) if tag else u"", bucket_label(bucket))
+
+
+def is_itogo(text):
+    return (text or u"").strip().startswith(ITOGO_PREFIX)
+
+
+def round_n(value, digits=7):
+    """Округление как WorksheetFunction.Round: половина — от нуля."""
+
+    scale = 10.0 ** digits
+    result = math.floor(abs(value) * scale + 0.5) / scale
+    result = -result if value < 0 else result
+    return 0.0 if abs(result) < 5e-12 else result
+
+
+def snap(value, eps=EPS):
+    """Прилипание к целому: |x - round(x)| <= eps -> round(x)."""
+
+    whole = round_n(value, 0)
+    return whole if abs(value - whole) <= eps else value
+
+
+def is_integerish(value, eps=EPS):
+    return abs(value - round_n(value, 0)) <= eps
+
+
+def number_format(value, is_count=False):
+    """Формат итога: целые и New_Count — «0», дробные — «0.#######»."""
+
+    return FMT_INT if is_count or is_integerish(value) else FMT_DECIMAL
+
+
+def total_value(total, has_number, has_nonzero, is_count=False):
+    """Значение суммируемой колонки в «Итого» или None (ячейка пустая)."""
+
+    if not has_number:
+        return None
+    if is_count:
+        return snap(round_n(total, 7))
+    if TREAT_ZERO_AS_EMPTY and not has_nonzero:
+        return None
+    rounded = round_n(total, 7)
+    value = rounded if abs(total - rounded) > 5e-12 else total
+    return snap(value)
+
+
+def number_token(value, decimal_sep=u","):
+    """Текстовый токен числа: 7 знаков, прилипание, без хвостовых нулей."""
+
+    value = snap(round_n(value, 7))
+    if is_integerish(value):
+        return u"{0}".format(int(round_n(value, 0)))
+    text = u"{0:.7f}".format(value).rstrip(u"0").rstrip(u".")
+    return text.replace(u".", decimal_sep)
+
+
+def parse_gesn_text(text):
+    """Разбор строки параметра «шифр[объём]; ...» -> [(шифр, объём)].
+
+    Нужен только для моделей, обработанных до появления структурированного
+    результата (``tartip.gesn_storage``); объём допускает запятую и точку.
+    """
+
+    items = []
+    for code, raw in _GESN_FRAGMENT_RE.findall(text or u""):
+        code = code.strip()
+        if not code:
+            continue
+        try:
+            quantity = float(raw.strip().replace(u" ", u"").replace(u",", u"."))
+        except ValueError:
+            continue
+        items.append((code, quantity))
+    return items
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Чтение выгрузки ИМОКС из XLSX и запись готовой ВОР в новый XLSX.
+
+Макрос вставляет каждую строку «Итого» через ``Rows.Insert``, удаляет
+отфильтрованные строки по одной и задаёт формат каждой ячейки через COM.
+Здесь лист ВОР пишется в новую книгу за один проход (``tartip.xlsx_writer``):
+«Итого» над своими группами и жирные, строки данных с ``outlineLevel``,
+колонки вне whitelist скрыты, числа итогов — с форматами
+``SumNumberFormatForValue`` («0» / «0.#######»), текст — «@».
+
+Чтение листа потоковое (``iterparse``): в памяти только общие строки книги
+и текущая строка листа.
+"""
+from __future__ import absolute_import
+
+import zipfile
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+from tartip import xlsx_writer
+
+from . import vor_engine, vor_rules
+from .gesn_rules import column_index, get_sheet_entries, load_shared_strings, order_sheets
+
+_NS = u"{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_ROW = _NS + u"row"
+_CELL = _NS + u"c"
+_VALUE = _NS + u"v"
+_INLINE = _NS + u"is"
+_DIGITS = u"0123456789"
+
+# Формат ячейки «Итого» -> стиль xlsx_writer (строка «Итого» жирная целиком)
+ITOGO_STYLES = {
+    vor_rules.FMT_INT: "bold_int",
+    vor_rules.FMT_DECIMAL: "bold_decimal",
+    vor_engine.FMT_TEXT: "bold_text",
+}
+ITOGO_DEFAULT_STYLE = "header"
+
+
+def _cell_value(cell, strings):
+    kind = cell.get("t")
+    if kind == "inlineStr":
+        node = cell.find(_INLINE)
+        return u"".join(node.itertext()) if node is not None else None
+    node = cell.find(_VALUE)
+    if node is None or node.text is None:
+        return None
+    raw = node.text
+    if kind == "s":
+        try:
+            return strings[int(raw)]
+        except (ValueError, IndexError):
+            return raw
+    if kind in (None, "n"):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def iter_sheet_rows(path, sheet_name=None):
+    """Строки листа XLSX как списки значений; числовые ячейки — float.
+
+    ``sheet_name`` — предпочтительный лист (иначе первый).
+    """
+
+    with zipfile.ZipFile(path, "r") as zf:
+        entries, available = get_sheet_entries(zf)
+        if not entries:
+            raise vor_engine.VorError(u"В книге нет листов. Найдены имена: {0}".format(u", ".join(available)))
+        _, sheet_path = order_sheets(entries, sheet_name)[0]
+        strings = load_shared_strings(zf)
+        # индекс колонки по буквам ссылки: регулярное выражение — один раз на колонку, а не на ячейку
+        columns = {}
+        with zf.open(sheet_path) as data:
+            for _, element in ElementTree.iterparse(data):
+                if element.tag != _ROW:
+                    continue
+                cells = []
+                for cell in element.iter(_CELL):
+                    ref = cell.get("r", "A1")
+                    letters = ref.rstrip(_DIGITS)
+                    index = columns.get(letters)
+                    if index is None:
+                        index = columns[letters] = column_index(ref)
+                    while len(cells) <= index:
+                        cells.append(None)
+                    cells[index] = _cell_value(cell, strings)
+                element.clear()
+                yield cells
+
+
+def read_table(path, sheet_name=None):
+    """(заголовки, строки данных) выгрузки; заголовки — первая строка листа."""
+
+    rows = iter_sheet_rows(path, sheet_name)
+    headers = next(rows, None)
+    if not headers:
+        raise vor_engine.VorError(u"Лист пуст: нет строки заголовков")
+    headers = [u"{0}".format(value) if value is not None else u"" for value in headers]
+    return headers, list(rows)
+
+
+def itogo_styles(row):
+    return [ITOGO_STYLES.get(fmt, ITOGO_DEFAULT_STYLE) for fmt in row.formats]
+
+
+def write_sheet(book, headers, rows, visible, sheet_name=u"ВОР"):
+    """Пишет лист ВОР в открытую книгу ``xlsx_writer.XlsxWriter``.
+
+    ``rows`` — итерируемое ``vor_engine.VorRow`` в порядке вывода; читается
+    один раз, поэтому может быть генератором.
+    """
+
+    hidden = [index for index, show in enumerate(visible) if not show]
+    sheet = book.add_sheet(
+        sheet_name, [(header, "text") for header in headers],
+        autofilter=False, hidden_columns=hidden, outline_level=1, summary_above=True)
+    for row in rows:
+        if row.itogo:
+            sheet.write_row(row.values, styles=itogo_styles(row), level=row.level)
+        else:
+            sheet.write_row(row.values, level=row.level)
+    return sheet
+
+
+def write_table(path, table, sheet_name=u"ВОР"):
+    """Сохраняет ``vor_engine.VorTable`` новой книгой XLSX."""
+
+    with xlsx_writer.XlsxWriter(path, title=sheet_name) as book:
+        write_sheet(book, table.headers, table.rows, table.visible, sheet_name)
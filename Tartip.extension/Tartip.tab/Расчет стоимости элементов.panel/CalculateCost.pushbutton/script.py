@@ -10,6 +10,8 @@ from System.Windows import (Application, Window, WindowStyle, ResizeMode, Thickn
 from System.Windows.Controls import (Border, StackPanel, TextBlock, Orientation, Separator,
                                      RadioButton, CheckBox, Button)
 
+from tartip import shared_params, transactions, worksharing, write_plan
+
 doc = revit.doc
 out = script.get_output()
 
@@ -25,6 +27,9 @@ P_COST_F_I  = u"ACBD_Ф_СтоимостьЭлемента"
 P_LAB_N_I   = u"ACBD_Н_ТрудозатратыЭлемента"
 P_LAB_F_I   = u"ACBD_Ф_ТрудозатратыЭлемента"
 
+TYPE_PARAMS = (P_UNIT_T, P_RATE_CN_T, P_RATE_CF_T, P_RATE_LN_T, P_RATE_LF_T)
+INST_PARAMS = (P_COST_N_I, P_COST_F_I, P_LAB_N_I, P_LAB_F_I)
+
 # --------- helpers ---------
 try:
     text_type = unicode
@@ -79,7 +84,7 @@ def _fmt_labor(v):
     except:
         return _t(v) or u""
 
-def _lp(holder, name):
+def _lp_by_name(holder, name):
     if not holder: return None
     try:
         p = holder.LookupParameter(name)
@@ -93,6 +98,13 @@ def _lp(holder, name):
     except: pass
     return None
 
+# Параметры ACBD, разрешённые по GUID один раз на документ (заполняется в _main)
+_PARAMS = None
+
+def _lp(holder, name):
+    if _PARAMS is None: return _lp_by_name(holder, name)
+    return _PARAMS.get(holder, name)
+
 def _eltype(el):
     try: return doc.GetElement(el.GetTypeId())
     except: return None
@@ -129,22 +141,52 @@ def _is_currency(p):
         return getattr(p.Definition, "ParameterType", None) == DB.ParameterType.Currency
     except: return False
 
+# Варианты записи числа: 0 — p.Set(float), далее — SetValueString с разными форматами
+_FMT_CURRENCY = (
+    _fmt_money,
+    lambda v: u"{:.2f}".format(v).replace(u".", u","),
+    lambda v: u"{:,.2f}".format(v).replace(u",", u" ").replace(u".", u","),
+    lambda v: u"{:.2f}".format(v),
+)
+_FMT_PLAIN = (
+    lambda v: u"{:,.2f}".format(v).replace(u",", u" ").replace(u".", u","),
+    lambda v: u"{:.2f}".format(v),
+)
+
+# Выученные за запуск стратегии: (определение, валюта?) -> номер варианта
+_SETTER_CACHE = {}
+_CURRENCY_CACHE = {}
+
+def _param_key(p):
+    try: return p.Id.IntegerValue
+    except: return _t(getattr(p.Definition, "Name", None))
+
+def _set_with(p, strategy, v, fmts):
+    if strategy == 0:
+        return p.Set(v)
+    return p.SetValueString(fmts[strategy - 1](v))
+
 def _try_set_number(p, value):
-    try:
-        if p.Set(float(value)): return True
-    except: pass
-    variants = (
-        _fmt_money(value),
-        u"{:.2f}".format(float(value)).replace(u".", u","),
-        u"{:,.2f}".format(float(value)).replace(u",", u" ").replace(u".", u","),
-        u"{:.2f}".format(float(value)),
-    ) if _is_currency(p) else (
-        u"{:,.2f}".format(float(value)).replace(u",", u" ").replace(u".", u","),
-        u"{:.2f}".format(float(value)),
-    )
-    for s in variants:
+    v = float(value)
+    key = _param_key(p)
+    currency = _CURRENCY_CACHE.get(key)
+    if currency is None:
+        currency = _CURRENCY_CACHE[key] = _is_currency(p)
+    fmts = _FMT_CURRENCY if currency else _FMT_PLAIN
+
+    # сначала — вариант, который уже срабатывал для этого определения
+    learned = _SETTER_CACHE.get((key, currency))
+    if learned is not None:
+        try:
+            if _set_with(p, learned, v, fmts): return True
+        except: pass
+
+    for strategy in range(len(fmts) + 1):
+        if strategy == learned: continue
         try:
-            if p.SetValueString(s): return True
+            if _set_with(p, strategy, v, fmts):
+                _SETTER_CACHE[(key, currency)] = strategy
+                return True
         except: pass
     return False
 
@@ -279,39 +321,46 @@ def _qty(el, unit_text):
         return 1.0
     return None
 
-# --------- расчёт одного элемента ---------
+# --------- расчёт одного элемента (только чтение модели) ---------
 def _calc_element(el):
+    """Возвращает (id, (cost_n, cost_f, lab_n, lab_f), записи плана) или None."""
     et = _eltype(el)
     unit_text = _get_str_from(et, P_UNIT_T)
     if not unit_text or not _t(unit_text).strip():
-        return False, None, None, None, None
+        return None
 
     q = _qty(el, unit_text)
     if q is None:
-        return False, None, None, None, None
+        return None
 
     r_cn = _get_num_from(et, P_RATE_CN_T)
     r_cf = _get_num_from(et, P_RATE_CF_T)
     r_ln = _get_num_from(et, P_RATE_LN_T)
     r_lf = _get_num_from(et, P_RATE_LF_T)
 
-    ok_any = False
+    eid = el.Id.IntegerValue
+    ops = []
     cost_n = cost_f = lab_n = lab_f = None
 
     if r_cn is not None:
         cost_n = (r_cn or 0.0) * (q or 0.0)
-        ok_any |= _set_inst_number(el, P_COST_N_I, cost_n)
+        ops.append(write_plan.WriteOp(eid, P_COST_N_I, cost_n))
     if r_cf is not None:
         cost_f = (r_cf or 0.0) * (q or 0.0)
-        ok_any |= _set_inst_number(el, P_COST_F_I, cost_f)
+        ops.append(write_plan.WriteOp(eid, P_COST_F_I, cost_f))
     if r_ln is not None:
         lab_n = (r_ln or 0.0) * (q or 0.0)
-        ok_any |= _set_inst_number(el, P_LAB_N_I, lab_n)
+        ops.append(write_plan.WriteOp(eid, P_LAB_N_I, lab_n))
     if r_lf is not None:
         lab_f = (r_lf or 0.0) * (q or 0.0)
-        ok_any |= _set_inst_number(el, P_LAB_F_I, lab_f)
+        ops.append(write_plan.WriteOp(eid, P_LAB_F_I, lab_f))
+
+    if not ops:
+        return None
+    return eid, (cost_n, cost_f, lab_n, lab_f), ops
 
-    return ok_any, cost_n, cost_f, lab_n, lab_f
+def _write_op(el, op):
+    return _set_inst_number(el, op.param_name, op.value)
 
 # --------- одно окно "Стоимость объекта" с сноской ---------
 COST_TAG   = "ACBD_COST_WINDOW"
@@ -549,6 +598,16 @@ class _ScopeDialog(object):
             pass
         stack.Children.Add(self._recon)
 
+        self._dry_run = CheckBox()
+        self._dry_run.Content = u"Только расчёт, без записи в модель"
+        self._dry_run.Margin = Thickness(0, 6, 0, 0)
+        self._dry_run.IsChecked = False
+        try:
+            self._dry_run.Foreground = Brushes.White
+        except Exception:
+            pass
+        stack.Children.Add(self._dry_run)
+
         buttons = StackPanel()
         buttons.Orientation = Orientation.Horizontal
         buttons.HorizontalAlignment = HorizontalAlignment.Right
@@ -575,7 +634,8 @@ class _ScopeDialog(object):
     def _on_ok(self, sender, args):
         scope = u"Видимые элементы" if self._scope_visible.IsChecked is True else u"Вся модель"
         recon = (self._recon.IsChecked is True)
-        self._result = (scope, recon)
+        dry_run = (self._dry_run.IsChecked is True)
+        self._result = (scope, recon, dry_run)
         try:
             self._window.DialogResult = True
         except Exception:  # noqa: WPS466
@@ -609,7 +669,15 @@ def _select_scope(default_visible=True):
 # --------- запуск: выбор области + расчёт ---------
 
 def _main():
-    choice, reconstruction_mode = _select_scope(default_visible=True)
+    global _PARAMS
+    choice, reconstruction_mode, dry_run = _select_scope(default_visible=True)
+
+    _PARAMS = shared_params.ParameterIndex(doc, TYPE_PARAMS + INST_PARAMS,
+                                           fold=_fold_name, fallback=_lp_by_name)
+    missing = [] if dry_run else _PARAMS.missing_bindings(INST_PARAMS)
+    if missing and not forms.alert(shared_params.format_missing(missing), title=u"ACBD",
+                                   sub_msg=u"Продолжить расчёт?", yes=True, no=True):
+        return
     scope_text = choice + (u"; реконструкция" if reconstruction_mode else u"")
 
     elements = _collect_visible(revit.active_view) if choice == u"Видимые элементы" else _collect_all()
@@ -617,24 +685,57 @@ def _main():
         allowed_stages = {ST_DEMOL, ST_NEW}
         elements = [el for el in elements if _stage_bucket(el) in allowed_stages]
 
+    # 1) расчёт: модель только читается, транзакция не открыта
+    calc = transactions.run_with_progress(elements, _calc_element,
+                                          u"ACBD: расчёт стоимости и трудозатрат")
+    if calc.cancelled:
+        forms.alert(u"Расчёт прерван пользователем. Модель не изменялась.", title=u"ACBD")
+        return
+    for el, error in calc.failed:
+        out.print_html(u"<p>Ошибка расчёта {0}: {1}</p>".format(_h(el.Id.IntegerValue), _h(error)))
+
+    computed = {}
+    ops = []
+    for res in calc.results:
+        if res is None: continue
+        eid, values, el_ops = res
+        computed[eid] = values
+        ops.extend(el_ops)
+    plan = write_plan.freeze(ops)
+
+    # 2) запись плана (в режиме «только расчёт» пропускается)
+    _SETTER_CACHE.clear()
+    _CURRENCY_CACHE.clear()
+    if dry_run:
+        counted = list(computed.keys())
+        scope_text += u"; без записи в модель"
+    else:
+        # в модели с совместной работой занимаем элементы заранее, занятые другими — исключаем
+        checkout = worksharing.checkout(doc, [op.element_id for op in plan])
+        if checkout.excluded:
+            plan = write_plan.exclude(plan, [eid for eid, _ in checkout.excluded])
+            scope_text += u"; исключено (совместная работа): {0}".format(len(checkout.excluded))
+        run = write_plan.apply_plan(doc, plan, _write_op, u"ACBD: расчёт стоимости и трудозатрат")
+        if run.cancelled:
+            forms.alert(u"Запись прервана пользователем. Изменения модели отменены.", title=u"ACBD")
+            return
+        counted = [eid for eid, written, _ in run.results if written]
+        for (eid, _), error in run.failed:
+            out.print_html(u"<p>Ошибка записи {0}: {1}</p>".format(eid, _h(error)))
+        worksharing.print_excluded(out, checkout)
+
     total_n = 0.0
     total_f = 0.0
     total_ln = 0.0
     total_lf = 0.0
-    ok_count = 0
-    skipped_count = 0
-
-    with revit.Transaction(u"ACBD: расчёт стоимости и трудозатрат"):
-        for el in elements:
-            ok, cN, cF, lN, lF = _calc_element(el)
-            if ok:
-                ok_count += 1
-                if cN is not None: total_n += float(cN)
-                if cF is not None: total_f += float(cF)
-                if lN is not None: total_ln += float(lN)
-                if lF is not None: total_lf += float(lF)
-            else:
-                skipped_count += 1
+    for eid in counted:
+        cN, cF, lN, lF = computed[eid]
+        if cN is not None: total_n += float(cN)
+        if cF is not None: total_f += float(cF)
+        if lN is not None: total_ln += float(lN)
+        if lF is not None: total_lf += float(lF)
+    ok_count = len(counted)
+    skipped_count = len(elements) - ok_count
 
     _update_cost_window(total_n, total_f, total_ln, total_lf,
                         len(elements), ok_count, skipped_count, scope_text)
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
-import re, os, datetime, zipfile
+import re, os, datetime
 from pyrevit import revit, DB, forms, script
 from System.Collections.Generic import List as CsList
 from System.Windows import Window, WindowStyle, ResizeMode, Thickness, HorizontalAlignment, SizeToContent
 from System.Windows.Controls import StackPanel, TextBlock, RadioButton, CheckBox, Button, Orientation
 
+from tartip import background, cube, gesn_storage, html_report, records, results_window, shared_params, transactions, xlsx_writer
+
 doc = revit.doc
 out = script.get_output()
 
@@ -87,7 +89,7 @@ def _fmt_num(v, nd=3):
     except:
         return _t(v) or u""
 
-def _lp(holder, name):
+def _lp_by_name(holder, name):
     if not holder: return None
     try:
         p = holder.LookupParameter(name)
@@ -101,6 +103,13 @@ def _lp(holder, name):
     except: pass
     return None
 
+# Параметры ACBD, разрешённые по GUID один раз на документ (заполняется при запуске)
+_PARAMS = None
+
+def _lp(holder, name):
+    if _PARAMS is None: return _lp_by_name(holder, name)
+    return _PARAMS.get(holder, name)
+
 def _eltype(el):
     try: return doc.GetElement(el.GetTypeId())
     except: return None
@@ -160,42 +169,6 @@ def _get_num_from(holder, name):
 
 def _inst_param(el, name): return _lp(el, name)
 
-def _is_currency(p):
-    try:
-        dt = p.Definition.GetDataType()
-        if dt and dt.Equals(DB.SpecTypeId.Currency): return True
-    except: pass
-    try:
-        return getattr(p.Definition,"ParameterType",None) == DB.ParameterType.Currency
-    except: return False
-
-def _try_set_number(p, value):
-    try:
-        if p.Set(float(value)): return True
-    except: pass
-    if _is_currency(p):
-        variants = (
-            _fmt_money(value),
-            u"{:.2f}".format(float(value)).replace(u".", u","),
-            u"{:,.2f}".format(float(value)).replace(u",", u" ").replace(u".", u","),
-            u"{:.2f}".format(float(value)),
-        )
-    else:
-        variants = (
-            u"{:.3f}".format(float(value)).replace(u".", u","),
-            u"{:.3f}".format(float(value)),
-        )
-    for s in variants:
-        try:
-            if p.SetValueString(s): return True
-        except: pass
-    return False
-
-def _set_inst_number(el, name, value):
-    p = _inst_param(el, name)
-    if not p or getattr(p, "IsReadOnly", False): return False
-    return _try_set_number(p, value)
-
 # ---- сбор элементов ----
 ALLOWED = CsList[DB.BuiltInCategory]([
     DB.BuiltInCategory.OST_Walls,
@@ -300,8 +273,74 @@ def _stage_bucket(el):
     if u"существ" in crl:                                  return ST_EXIST
     return ST_OTHER
 
+# ---- измерения куба агрегатов ----
+CUBE_DIMS     = ("stage", "type", "category", "level", "workset", "gesn")
+CUBE_MEASURES = ("N", "F", "LN", "LF")
+REPORT_TOP_N  = 50    # сколько самых дорогих элементов показывать в группе окна вывода; остальные — в окне/файле/XLSX
+P_GESN_I      = (u"ACBD_ГЭСН", u"Шифр ГЭСН")
+NO_VALUE      = u"(не задано)"
+
+_name_cache = {}
+
+def _cached_name(eid):
+    # имена уровней и рабочих наборов: по одному запросу на id
+    key = eid.IntegerValue
+    name = _name_cache.get(key)
+    if name is None:
+        try: name = _t(doc.GetElement(eid).Name) or NO_VALUE
+        except: name = NO_VALUE
+        _name_cache[key] = name
+    return name
+
+def _level_name(el):
+    try:
+        lid = el.LevelId
+        if lid and lid != DB.ElementId.InvalidElementId: return _cached_name(lid)
+    except: pass
+    for bip in (DB.BuiltInParameter.FAMILY_LEVEL_PARAM, DB.BuiltInParameter.SCHEDULE_LEVEL_PARAM,
+                DB.BuiltInParameter.WALL_BASE_CONSTRAINT):
+        try:
+            p = el.get_Parameter(bip)
+            if p and p.AsElementId() != DB.ElementId.InvalidElementId: return _cached_name(p.AsElementId())
+        except: pass
+    return NO_VALUE
+
+_ws_cache = {}
+
+def _workset_name(el):
+    if not doc.IsWorkshared: return NO_VALUE
+    try: wid = el.WorksetId
+    except: return NO_VALUE
+    key = wid.IntegerValue
+    name = _ws_cache.get(key)
+    if name is None:
+        try: name = _t(doc.GetWorksetTable().GetWorkset(wid).Name) or NO_VALUE
+        except: name = NO_VALUE
+        _ws_cache[key] = name
+    return name
+
+def _gesn_code(el):
+    # структурированный результат AssignGesn — без разбора строки
+    stored = gesn_storage.read(el)
+    if stored is not None and stored.items:
+        return u"; ".join(item.code for item in stored.items)
+    for name in P_GESN_I:
+        txt = _get_str_from(el, name)
+        if txt and txt.strip():
+            # «08-02-001-01[12,5]; ...» -> «08-02-001-01; ...»
+            return re.sub(u"\\[[^\\]]*\\]", u"", txt).strip()
+    return NO_VALUE
+
+# ---- записи результата ----
+CalcItem = records.record_type("CalcItem", (
+    "id", "stage", "tname", "cat", "unit", "qty",
+    "rcn", "rcf", "rln", "rlf", "cn", "cf", "ln", "lf"))
+SkipItem = records.record_type("SkipItem", ("id", "cat", "tname", "reason"))
+# сколько рассчитанных записей держать в памяти до выгрузки во временный JSONL
+RESULT_SPILL_LIMIT = records.DEFAULT_SPILL_LIMIT
+
 # ---- расчёт одного элемента ----
-def _calc_element(el, buckets_calc, buckets_skip, totals):
+def _calc_element(el, calc_items, buckets_skip, totals, agg):
     et     = _eltype(el)
     tname  = _type_name(el) or u"(без имени типа)"
     cat    = _t(getattr(getattr(el,"Category",None),"Name",u"(нет категории)"))
@@ -311,14 +350,14 @@ def _calc_element(el, buckets_calc, buckets_skip, totals):
     unit_text = _get_str_from(et, P_UNIT_T)
     if not unit_text or not _t(unit_text).strip():
         buckets_skip.setdefault(stage, {}).setdefault(tname, []).append(
-            dict(id=eid, cat=cat, tname=tname, reason=u"ЕИ пуста в типе")
+            SkipItem(eid, cat, tname, u"ЕИ пуста в типе")
         )
         return False
 
     q    = _qty(el, unit_text)
     if q is None:
         buckets_skip.setdefault(stage, {}).setdefault(tname, []).append(
-            dict(id=eid, cat=cat, tname=tname, reason=u"ЕИ '{}' не распознана".format(unit_text))
+            SkipItem(eid, cat, tname, u"ЕИ '{}' не распознана".format(unit_text))
         )
         return False
 
@@ -333,42 +372,48 @@ def _calc_element(el, buckets_calc, buckets_skip, totals):
     if r_cn is not None:
         cost_n = (r_cn or 0.0) * (q or 0.0)
         has_rate = True
-        totals["N"] += float(cost_n)
     if r_cf is not None:
         cost_f = (r_cf or 0.0) * (q or 0.0)
         has_rate = True
-        totals["F"] += float(cost_f)
     if r_ln is not None:
         lab_n = (r_ln or 0.0) * (q or 0.0)
         has_rate = True
-        totals["LN"] += float(lab_n)
     if r_lf is not None:
         lab_f = (r_lf or 0.0) * (q or 0.0)
         has_rate = True
-        totals["LF"] += float(lab_f)
 
     if not has_rate:
         buckets_skip.setdefault(stage, {}).setdefault(tname, []).append(
-            dict(id=eid, cat=cat, tname=tname, reason=u"Нет ставок в типе")
+            SkipItem(eid, cat, tname, u"Нет ставок в типе")
         )
         return False
 
-    # положим в рассчитанные
-    bucket = buckets_calc.setdefault(stage, {}).setdefault(tname, dict(
-        sumN=0.0, sumF=0.0, sumLN=0.0, sumLF=0.0, count=0, items=[]
-    ))
-    if cost_n is not None: bucket["sumN"]  += float(cost_n)
-    if cost_f is not None: bucket["sumF"]  += float(cost_f)
-    if lab_n  is not None: bucket["sumLN"] += float(lab_n)
-    if lab_f  is not None: bucket["sumLF"] += float(lab_f)
-    bucket["count"] += 1
-    bucket["items"].append(dict(
-        id=eid, cat=cat, tname=tname, unit=unit_text, qty=q,
-        rcn=r_cn, rcf=r_cf, rln=r_ln, rlf=r_lf,
-        cn=cost_n, cf=cost_f, ln=lab_n, lf=lab_f
-    ))
+    # измерения читаются до учёта: исключение здесь не оставит элемент в итогах наполовину
+    dims = (stage, tname, cat, _level_name(el), _workset_name(el), _gesn_code(el))
+
+    # положим в рассчитанные: запись — в хранилище, суммы — в итоги и куб;
+    # в топ куба — только номер записи, иначе кучи держали бы записи и выгрузка не освобождала память
+    pos = len(calc_items)
+    calc_items.append(CalcItem(eid, stage, tname, cat, unit_text, q,
+                               r_cn, r_cf, r_ln, r_lf, cost_n, cost_f, lab_n, lab_f))
+    for key, value in (("N", cost_n), ("F", cost_f), ("LN", lab_n), ("LF", lab_f)):
+        if value is not None: totals[key] += float(value)
+    agg.add(dims, (cost_n, cost_f, lab_n, lab_f),
+            score=float(cost_n or 0.0) + float(cost_f or 0.0), payload=pos)
     return True
 
+def _skip_failed(el, error, buckets_skip):
+    # исключение в _calc_element — элемент в нерассчитанных, причина — текст ошибки
+    try: stage = _stage_bucket(el)
+    except: stage = ST_OTHER
+    try: tname = _type_name(el) or u"(без имени типа)"
+    except: tname = u"(без имени типа)"
+    cat = _t(getattr(getattr(el,"Category",None),"Name",u"(нет категории)"))
+    eid = getattr(getattr(el,"Id",None),"IntegerValue",None)
+    buckets_skip.setdefault(stage, {}).setdefault(tname, []).append(
+        SkipItem(eid, cat, tname, u"Ошибка расчёта: {}".format(error))
+    )
+
 # ---- HTML рендер (панель вывода) ----
 def _h(s):
     if s is None: return u""
@@ -393,7 +438,36 @@ def _table(headers, rows, align=None, safe=None):
         trs.append(u"<tr>{}</tr>".format(u"".join(tds)))
     return u"<table class='acbd'><thead><tr>{}</tr></thead><tbody>{}</tbody></table>".format(u"".join(th), u"".join(trs))
 
-def _render_report(calc_map, skip_map, totals, processed, okcnt):
+SLICES = (
+    (u"По категориям",        "category", u"Категория"),
+    (u"По уровням",           "level",    u"Уровень"),
+    (u"По рабочим наборам",   "workset",  u"Рабочий набор"),
+    (u"По шифрам ГЭСН",       "gesn",     u"Шифр ГЭСН"),
+)
+
+def _slice_table(agg, dim, caption):
+    # срез куба по одному измерению, по убыванию Н+Ф
+    pivot = agg.pivot((dim,))
+    keys = sorted(pivot.keys(), key=lambda k: -(pivot[k][1][0] + pivot[k][1][1]))
+    rows = []
+    for key in keys:
+        count, sums = pivot[key]
+        rows.append([_h(key[0]), count, _fmt_money(sums[0]), _fmt_money(sums[1]),
+                     _fmt_num(sums[2]), _fmt_num(sums[3])])
+    return _table([caption, u"Кол-во", u"Н стоимость", u"Ф стоимость", u"Н труд.", u"Ф труд."],
+                  rows, align=["left","right","right","right","right","right"])
+
+def _top_items(agg, calc_items, dims):
+    # топ куба — номера записей; сами записи читаются из хранилища одним проходом
+    top = agg.top(dims)
+    wanted = set(pos for positions in top.values() for pos in positions)
+    found = {}
+    for pos, item in enumerate(calc_items):
+        if pos in wanted: found[pos] = item
+    return dict((key, [found[pos] for pos in positions]) for key, positions in top.items())
+
+def _render_report(agg, calc_items, skip_map, totals, processed, okcnt, report_file=None, details=True):
+    """HTML отчёта по кубу ``agg``; без ``details`` — только итоги (и ссылка на файл ``report_file``)."""
     try: out.clear()
     except: pass
 
@@ -429,35 +503,44 @@ def _render_report(calc_map, skip_map, totals, processed, okcnt):
     html.append(u'<p class="muted">Обработано элементов: {} &nbsp;&nbsp; С расчётом: {} &nbsp;&nbsp; Пропущено: {}</p>'
                 .format(processed, okcnt, processed - okcnt))
 
-    # ===== Рассчитанные
+    if report_file:
+        html.append(u'<p><b>Подробный отчёт:</b> <a href="file:///{}" class="mono">{}</a></p>'.format(
+            _h(report_file.replace(u"\\", u"/")), _h(report_file)))
+    if not details:
+        html.append(u"</div></div>")
+        return u"".join(html)
+
+    # ===== Рассчитанные: заголовки — из свёртки куба, элементы — топ по Н+Ф
     html.append(u"<h1>Итоги по стадиям и типам — рассчитанные</h1>")
-    if not calc_map:
+    if not len(agg):
         html.append(u"<p><i>Нет рассчитанных элементов.</i></p>")
     else:
+        by_type = agg.pivot(("stage", "type"))
+        top = _top_items(agg, calc_items, ("stage", "type"))
         for stage in (ST_EXIST, ST_DEMOL, ST_NEW, ST_OTHER):
-            stage_types = calc_map.get(stage)
-            if not stage_types: continue
+            tnames = [k[1] for k in by_type if k[0] == stage]
+            if not tnames: continue
             html.append(u'<details open><summary>{}</summary>'.format(_h(stage)))
             # типы — по имени А→Я
-            for tname in sorted(stage_types.keys(), key=lambda s: _fold(s)):
-                data = stage_types[tname]
-                # заголовок по типу
+            for tname in sorted(tnames, key=lambda s: _fold(s)):
+                count, sums = by_type[(stage, tname)]
                 head = u"{}  —  x{}  |  Н: {}  |  Ф: {}".format(
-                    _h(tname), data["count"], _fmt_money(data["sumN"]), _fmt_money(data["sumF"])
+                    _h(tname), count, _fmt_money(sums[0]), _fmt_money(sums[1])
                 )
                 html.append(u'<details><summary>{}</summary>'.format(head))
-                # элементы — по суммарной стоимости (Н+Ф) убыв.
-                items = sorted(list(data["items"]),
-                               key=lambda it: (float(it["cn"] or 0.0)+float(it["cf"] or 0.0)),
-                               reverse=True)
+                items = top.get((stage, tname)) or []
+                if count > len(items):
+                    html.append(u'<p class="muted">Показаны {} самых дорогих из {}; все элементы группы — '
+                                u'в подробностях «в окне результатов» или «в отдельном HTML-файле» '
+                                u'и в XLSX.</p>'.format(len(items), count))
                 rows = []
                 for it in items:
-                    link = out.linkify(DB.ElementId(it["id"]), u"{}".format(it["id"]))
+                    link = out.linkify(DB.ElementId(it.id), u"{}".format(it.id))
                     rows.append([
-                        link, _h(it["cat"]), _h(it["unit"]),
-                        _fmt_num(it["qty"]), _fmt_money(it["rcn"] or 0.0), _fmt_money(it["rcf"] or 0.0),
-                        _fmt_money(it["cn"] or 0.0), _fmt_money(it["cf"] or 0.0),
-                        _fmt_num(it["ln"] or 0.0), _fmt_num(it["lf"] or 0.0)
+                        link, _h(it.cat), _h(it.unit),
+                        _fmt_num(it.qty), _fmt_money(it.rcn or 0.0), _fmt_money(it.rcf or 0.0),
+                        _fmt_money(it.cn or 0.0), _fmt_money(it.cf or 0.0),
+                        _fmt_num(it.ln or 0.0), _fmt_num(it.lf or 0.0)
                     ])
                 html.append(_table(
                     [u"ID", u"Категория", u"ЕИ", u"Кол-во", u"Н цена/ед", u"Ф цена/ед",
@@ -467,6 +550,13 @@ def _render_report(calc_map, skip_map, totals, processed, okcnt):
                 html.append(u'</details>')
             html.append(u'</details>')
 
+        # ===== Срезы по остальным измерениям куба
+        html.append(u"<h1>Срезы — рассчитанные</h1>")
+        for title, dim, caption in SLICES:
+            html.append(u'<details><summary>{}</summary>'.format(_h(title)))
+            html.append(_slice_table(agg, dim, caption))
+            html.append(u'</details>')
+
     # ===== Нерассчитанные
     html.append(u"<h1>Итоги по стадиям и типам — нерассчитанные</h1>")
     if not skip_map:
@@ -481,8 +571,8 @@ def _render_report(calc_map, skip_map, totals, processed, okcnt):
                 html.append(u'<details><summary>{} — x{}</summary>'.format(_h(tname), len(items)))
                 rows=[]
                 for it in items:
-                    link = out.linkify(DB.ElementId(it["id"]), u"{}".format(it["id"])) if it.get("id") else u""
-                    rows.append([link, _h(it.get("cat") or u""), _h(it.get("reason") or u"")])
+                    link = out.linkify(DB.ElementId(it.id), u"{}".format(it.id)) if it.id else u""
+                    rows.append([link, _h(it.cat or u""), _h(it.reason or u"")])
                 html.append(_table([u"ID", u"Категория", u"Причина"], rows,
                                    align=["right","left","left"], safe=[0]))
                 html.append(u'</details>')
@@ -491,123 +581,89 @@ def _render_report(calc_map, skip_map, totals, processed, okcnt):
     html.append(u"</div></div>")
     return u"".join(html)
 
-# ---- XLSX (минимальный OpenXML, на случай проверки) ----
-def _xlsx_cell(v, is_text=False):
-    if v is None or v == "": return u'<c/>'
-    if is_text:
-        return u'<c t="inlineStr"><is><t>{}</t></is></c>'.format(_h(v))
-    try:
-        return u'<c><v>{:.6f}</v></c>'.format(float(v))
-    except:
-        return u'<c t="inlineStr"><is><t>{}</t></is></c>'.format(_h(v))
-
-def _xlsx_sheet_xml(headers, rows, text_cols=None):
-    text_cols = set(text_cols or [])
-    lines = [u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>',
-             u'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>']
-    lines.append(u'<row r="1">')
-    for h in headers: lines.append(_xlsx_cell(h, True))
-    lines.append(u'</row>')
-    r=2
-    for row in rows:
-        lines.append(u'<row r="{}">'.format(r))
-        for c,val in enumerate(row):
-            lines.append(_xlsx_cell(val, is_text=(c in text_cols)))
-        lines.append(u'</row>'); r+=1
-    lines.append(u'</sheetData></worksheet>')
-    return u"".join(lines)
-
-def _xlsx_build(filepath, calc_map, skip_map, totals):
-    # лист 1 — Summary totals
-    sum_headers = [u"Метрика", u"Значение"]
-    sum_rows = [
-        [u"Нормативная стоимость (ГЭСН)", _fmt_money(totals["N"])],
-        [u"Опытная стоимость",            _fmt_money(totals["F"])],
-        [u"Нормативные трудозатраты",     _fmt_num(totals["LN"])],
-        [u"Опытные трудозатраты",         _fmt_num(totals["LF"])],
+# ---- отчёт в отдельном HTML-файле ----
+REPORT_COLUMNS = [
+    html_report.Column(u"ID", "id", False),
+    html_report.Column(u"Результат", "text", True),
+    html_report.Column(u"Стадия", "text", True),
+    html_report.Column(u"Тип", "text", True),
+    html_report.Column(u"Категория", "text", True),
+    html_report.Column(u"ЕИ", "text", False),
+    html_report.Column(u"Кол-во", "num", False),
+    html_report.Column(u"Н стоимость", "money", False),
+    html_report.Column(u"Ф стоимость", "money", False),
+    html_report.Column(u"Н труд.", "num", False),
+    html_report.Column(u"Ф труд.", "num", False),
+    html_report.Column(u"Причина", "text", True),
+]
+
+def _report_rows(calc_items, skip_map):
+    for it in calc_items:
+        yield (it.id, u"Рассчитан", it.stage, it.tname, it.cat, it.unit, it.qty,
+               it.cn, it.cf, it.ln, it.lf, None)
+    for stage, types in skip_map.items():
+        for tname, items in types.items():
+            for it in items:
+                yield (it.id, u"Не рассчитан", stage, tname, it.cat, None, None,
+                       None, None, None, None, it.reason)
+
+def _write_report_file(path, calc_items, skip_map, totals):
+    headline = [
+        (u"Нормативная оценка стоимости (ГЭСН)", _fmt_money(totals["N"])),
+        (u"Опытная оценка стоимости",            _fmt_money(totals["F"])),
+        (u"Нормативная оценка трудозатрат",      _fmt_num(totals["LN"])),
+        (u"Опытная оценка трудозатрат",          _fmt_num(totals["LF"])),
     ]
-    # лист 2 — Details (по элементам рассчитанным)
-    det_headers = [u"ID", u"Стадия", u"Тип", u"Категория", u"ЕИ", u"Кол-во", u"Н цена/ед", u"Ф цена/ед",
-                   u"Н стоимость", u"Ф стоимость", u"Н труд.", u"Ф труд."]
-    det_rows=[]
-    for stage in calc_map:
-        for tname, data in calc_map[stage].items():
-            for it in data["items"]:
-                det_rows.append([it["id"], stage, tname, it["cat"], it["unit"], it["qty"],
-                                 it["rcn"], it["rcf"], it["cn"], it["cf"], it["ln"], it["lf"]])
-    summary_xml = _xlsx_sheet_xml(sum_headers, sum_rows, text_cols=set([0]))
-    details_xml = _xlsx_sheet_xml(det_headers, det_rows, text_cols=set([1,2,3,4]))
-
-    # упаковка
-    now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    content_types = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
-  <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
-  <Default Extension="xml"  ContentType="application/xml"/>
-  <Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
-  <Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
-  <Override PartName="/xl/worksheets/sheet2.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
-  <Override PartName="/docProps/core.xml" ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>
-  <Override PartName="/docProps/app.xml"  ContentType="application/vnd.openxmlformats-officedocument.extended-properties+xml"/>
-</Types>'''
-    rels_root = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
-  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
-  <Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="docProps/core.xml"/>
-  <Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/extended-properties" Target="docProps/app.xml"/>
-</Relationships>'''
-    wb_rels = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
-  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
-  <Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet2.xml"/>
-</Relationships>'''
-    workbook = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"
-          xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
-  <sheets>
-    <sheet name="Summary" sheetId="1" r:id="rId1"/>
-    <sheet name="Details" sheetId="2" r:id="rId2"/>
-  </sheets>
-</workbook>'''
-    core = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties"
-                   xmlns:dc="http://purl.org/dc/elements/1.1/"
-                   xmlns:dcterms="http://purl.org/dc/terms/"
-                   xmlns:dcmitype="http://purl.org/dc/dcmitype/"
-                   xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-  <dc:title>ACBD Calculation Export</dc:title>
-  <dc:creator>pyRevit</dc:creator>
-  <cp:lastModifiedBy>pyRevit</cp:lastModifiedBy>
-  <dcterms:created xsi:type="dcterms:W3CDTF">%(now)s</dcterms:created>
-  <dcterms:modified xsi:type="dcterms:W3CDTF">%(now)s</dcterms:modified>
-</cp:coreProperties>''' % {"now": now}
-    app = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties"
-            xmlns:vt="http://schemas.openxmlformats.org/officeDocument/docPropsVTypes">
-  <Application>pyRevit</Application>
-  <DocSecurity>0</DocSecurity>
-  <ScaleCrop>false</ScaleCrop>
-  <Company></Company>
-  <LinksUpToDate>false</LinksUpToDate>
-  <SharedDoc>false</SharedDoc>
-  <HyperlinksChanged>false</HyperlinksChanged>
-  <AppVersion>16.0000</AppVersion>
-</Properties>'''
-
-    z = zipfile.ZipFile(filepath, "w", zipfile.ZIP_DEFLATED)
+    html_report.write_report(path, u"ACBD: диагностика расчёта — {}".format(_t(doc.Title)),
+                             headline, REPORT_COLUMNS, _report_rows(calc_items, skip_map))
+    try: os.startfile(path)
+    except: pass
+
+# ---- XLSX (потоковая запись, tartip.xlsx_writer) ----
+def _xlsx_snapshot(calc_items, totals):
+    """Снимок данных для фоновой выгрузки: копия итогов и хранилище записей.
+
+    После расчёта хранилище только читается; фоновая задача удерживает его
+    (``retain``) и освобождает по завершении, чтобы временный файл не
+    удалился раньше времени.
+    """
+    return dict(totals), calc_items.retain()
+
+def _xlsx_rows(calc_items):
+    for it in calc_items:
+        yield (it.id, it.stage, it.tname, it.cat, it.unit, it.qty,
+               it.rcn, it.rcf, it.cn, it.cf, it.ln, it.lf)
+
+def _xlsx_build(filepath, snapshot):
+    totals, calc_items = snapshot
     try:
-        z.writestr("[Content_Types].xml",        content_types.encode("utf-8"))
-        z.writestr("_rels/.rels",                 rels_root.encode("utf-8"))
-        z.writestr("docProps/core.xml",          core.encode("utf-8"))
-        z.writestr("docProps/app.xml",           app.encode("utf-8"))
-        z.writestr("xl/workbook.xml",            workbook.encode("utf-8"))
-        z.writestr("xl/_rels/workbook.xml.rels", wb_rels.encode("utf-8"))
-        z.writestr("xl/worksheets/sheet1.xml",   summary_xml.encode("utf-8"))
-        z.writestr("xl/worksheets/sheet2.xml",   details_xml.encode("utf-8"))
+        _xlsx_write(filepath, totals, calc_items)
     finally:
-        z.close()
+        calc_items.release()
+
+def _xlsx_write(filepath, totals, calc_items):
+    with xlsx_writer.XlsxWriter(filepath, title=u"ACBD Calculation Export") as book:
+        # лист 1 — Summary totals (числа с форматом, а не строки)
+        summary = book.add_sheet(u"Summary", [(u"Метрика", "text"), (u"Значение", "money")],
+                                 autofilter=False, widths=[36, 20])
+        summary.write_row([u"Нормативная стоимость (ГЭСН)", totals["N"]])
+        summary.write_row([u"Опытная стоимость",            totals["F"]])
+        summary.write_row([u"Нормативные трудозатраты",     totals["LN"]], styles=[None, "labor"])
+        summary.write_row([u"Опытные трудозатраты",         totals["LF"]], styles=[None, "labor"])
+
+        # лист 2 — Details (по элементам рассчитанным)
+        details = book.add_sheet(u"Details", [
+            (u"ID", "int"), (u"Стадия", "text"), (u"Тип", "text"), (u"Категория", "text"), (u"ЕИ", "text"),
+            (u"Кол-во", "qty"), (u"Н цена/ед", "money"), (u"Ф цена/ед", "money"),
+            (u"Н стоимость", "money"), (u"Ф стоимость", "money"), (u"Н труд.", "labor"), (u"Ф труд.", "labor"),
+        ], widths=[10, 22, 40, 20, 8, 12, 14, 14, 16, 16, 12, 12])
+        details.write_rows(_xlsx_rows(calc_items))
 
 # ---- Выбор области и режима ----
+DETAILS_OUTPUT = "output"   # вложенные таблицы в окне вывода pyRevit
+DETAILS_WINDOW = "window"   # окно результатов (DataGrid)
+DETAILS_FILE   = "file"     # отдельный HTML-файл
+
 class _ScopeDialog(object):
     def __init__(self, default_visible=False):
         self._result = None
@@ -648,6 +704,23 @@ class _ScopeDialog(object):
         self._recon.IsChecked = False
         stack.Children.Add(self._recon)
 
+        details_label = TextBlock()
+        details_label.Text = u"Подробности по элементам:"
+        details_label.Margin = Thickness(0, 12, 0, 4)
+        stack.Children.Add(details_label)
+
+        self._details = []
+        for key, caption in ((DETAILS_OUTPUT, u"в окне вывода"),
+                             (DETAILS_WINDOW, u"в окне результатов (для больших моделей)"),
+                             (DETAILS_FILE, u"в отдельном HTML-файле (для больших моделей)")):
+            rb = RadioButton()
+            rb.Content = caption
+            rb.GroupName = u"details"
+            rb.Margin = Thickness(0, 0, 0, 4)
+            rb.IsChecked = (key == DETAILS_OUTPUT)
+            stack.Children.Add(rb)
+            self._details.append((key, rb))
+
         buttons = StackPanel()
         buttons.Orientation = Orientation.Horizontal
         buttons.HorizontalAlignment = HorizontalAlignment.Right
@@ -676,7 +749,11 @@ class _ScopeDialog(object):
     def _on_ok(self, sender, args):
         scope = u"Видимые элементы" if self._scope_visible.IsChecked is True else u"Вся модель"
         recon = (self._recon.IsChecked is True)
-        self._result = (scope, recon)
+        details = DETAILS_OUTPUT
+        for key, rb in self._details:
+            if rb.IsChecked is True:
+                details = key
+        self._result = (scope, recon, details)
         try:
             self._window.DialogResult = True
         except Exception:
@@ -708,40 +785,65 @@ def _select_scope(default_visible=False):
 
 
 # ---- Запуск ----
-choice, reconstruction_mode = _select_scope(default_visible=False)
+choice, reconstruction_mode, details_mode = _select_scope(default_visible=False)
 elements = _collect_visible(revit.active_view) if choice == u"Видимые элементы" else _collect_all()
 if reconstruction_mode:
     allowed_stages = {ST_DEMOL, ST_NEW}
     elements = [el for el in elements if _stage_bucket(el) in allowed_stages]
 
+_PARAMS = shared_params.ParameterIndex(
+    doc, (P_UNIT_T, P_RATE_CN_T, P_RATE_CF_T, P_RATE_LN_T, P_RATE_LF_T),
+    fold=_fold, fallback=_lp_by_name)
+
 totals = dict(N=0.0, F=0.0, LN=0.0, LF=0.0)
-calc_map = {}   # stage -> type -> {sumN,sumF,sumLN,sumLF,count,items[]}
-skip_map = {}   # stage -> type -> [ {id,cat,tname,reason} ]
+calc_items = records.RecordStore(CalcItem, spill_limit=RESULT_SPILL_LIMIT)
+agg = cube.Cube(CUBE_DIMS, CUBE_MEASURES, top_n=REPORT_TOP_N)   # суммы и топ по всем срезам
+skip_map = {}   # stage -> type -> [SkipItem]
+
+# Диагностика только читает модель — транзакция не нужна
+run = transactions.run_with_progress(elements,
+                                     lambda el: _calc_element(el, calc_items, skip_map, totals, agg),
+                                     u"ACBD: диагностика расчёта")
+if run.cancelled:
+    forms.alert(u"Проверка прервана пользователем.", title=u"ACBD", exitscript=True)
+okcnt = sum(1 for ok in run.results if ok)
+for el, error in run.failed:
+    _skip_failed(el, error, skip_map)
+
+report_file = None
+if details_mode == DETAILS_FILE:
+    report_file = forms.save_file(file_ext="html",
+                                  default_name=u"ACBD_Check_{:%Y%m%d_%H%M}.html".format(datetime.datetime.now()),
+                                  title=u"Сохранить подробный отчёт HTML")
+    if report_file:
+        try:
+            _write_report_file(report_file, calc_items, skip_map, totals)
+        except Exception as e:
+            forms.alert(u"Не удалось записать HTML-отчёт: {}".format(e), title=u"ACBD")
+            report_file = None
 
-okcnt = 0
-with revit.Transaction(u"ACBD: пересчёт стоимости и трудозатрат"):
-    for el in elements:
-        if _calc_element(el, calc_map, skip_map, totals):
-            okcnt += 1
+report_html = _render_report(agg, calc_items, skip_map, totals, len(elements), okcnt, report_file=report_file,
+                             details=(details_mode == DETAILS_OUTPUT or
+                                      (details_mode == DETAILS_FILE and not report_file)))
 
-report_html = _render_report(calc_map, skip_map, totals, len(elements), okcnt)
+out.print_html(report_html)
+_scroll_output_to_top()
 
-# Предлагаем сохранить XLSX (опционально)
+# Предлагаем сохранить XLSX (опционально): файл пишется в фоне, отчёт уже на экране
 fname = u"ACBD_Calc_{:%Y%m%d_%H%M}.xlsx".format(datetime.datetime.now())
 save = forms.save_file(file_ext="xlsx", default_name=fname, title=u"Сохранить отчёт XLSX (по рассчитанным)")
-
-status_html = None
 if save:
-    try:
-        _xlsx_build(save, calc_map, skip_map, totals)
-        status_html = u'<p><b>XLSX сохранён:</b> <span class="mono">{}</span></p>'.format(_h(save))
-    except Exception as e:
-        status_html = u'<p><b>Ошибка записи XLSX:</b> {}</p>'.format(_h(e))
+    snapshot = _xlsx_snapshot(calc_items, totals)
+    background.run(lambda: _xlsx_build(save, snapshot), u"ACBD: выгрузка XLSX",
+                   u"XLSX сохранён: {}".format(save), result_path=save)
+    out.print_html(u'<p><b>XLSX формируется в фоне:</b> <span class="mono">{}</span> — '
+                   u'по готовности появится уведомление.</p>'.format(_h(save)))
 else:
-    status_html = u'<p><b>Сохранение XLSX отменено пользователем.</b></p>'
+    out.print_html(u'<p><b>Сохранение XLSX отменено пользователем.</b></p>')
 
-if status_html:
-    out.print_html(status_html)
+if details_mode == DETAILS_WINDOW:
+    results_window.show_results(u"ACBD: диагностика расчёта", REPORT_COLUMNS,
+                                _report_rows(calc_items, skip_map), uidoc=revit.uidoc)
 
-out.print_html(report_html)
-_scroll_output_to_top()
+# Временный файл хранилища удалится, когда его отпустит и фоновая выгрузка
+calc_items.release()
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Общие модули расширения Tartip, доступные всем кнопкам.
+
+Каталог ``lib`` расширения pyRevit добавляет в ``sys.path`` сам. Модули
+импортируются явно (``from tartip import transactions``): часть из них
+зависит от Revit API и не должна загружаться вне Revit.
+"""
+from __future__ import absolute_import
+
+__all__ = [
+    "background",
+    "cube",
+    "gesn_storage",
+    "html_report",
+    "records",
+    "results_window",
+    "shared_params",
+    "transactions",
+    "worksharing",
+    "write_plan",
+    "xlsx_writer",
+]
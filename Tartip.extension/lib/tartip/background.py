@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Фоновые задачи, не требующие Revit API (выгрузка файлов и т.п.).
+
+Задача выполняется в отдельном потоке и не держит Revit: отчёт показывается
+сразу, а о готовности файла пользователь узнаёт из всплывающего уведомления
+Windows (``forms.toast``), щелчок по которому открывает файл. Задача не
+должна обращаться к Revit API и к окнам — только к заранее снятому
+неизменяемому снимку данных.
+"""
+from __future__ import absolute_import
+
+import threading
+
+from pyrevit import forms
+
+
+def notify(title, message, click=None):
+    """Всплывающее уведомление; ошибки показа не прерывают задачу."""
+
+    try:
+        forms.toast(message, title=title, click=click)
+    except Exception:
+        pass
+
+
+def run(task, title, done_message, result_path=None):
+    """Запускает ``task()`` в фоновом потоке и сообщает о завершении.
+
+    ``result_path`` — файл, который откроется по щелчку на уведомлении.
+    """
+
+    def _worker():
+        try:
+            task()
+        except Exception as exc:
+            notify(title, u"Ошибка: {0}".format(exc))
+        else:
+            notify(title, done_message, click=result_path)
+
+    thread = threading.Thread(target=_worker, name=u"tartip-background")
+    thread.daemon = False
+    thread.start()
+    return thread
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Компактный куб агрегатов, заполняемый за один проход расчёта.
+
+Значения каждого измерения кодируются плотными целыми числами, комбинация
+кодов получает номер группы, а суммы мер хранятся в массивах ``array('d')``
+по номеру группы. Любой срез (по стадии и типу, по категории, уровню,
+рабочему набору, шифру ГЭСН и т.п.) строится свёрткой групп — без повторного
+обхода элементов и без обращения к Revit. Для каждой группы держится куча
+из ``top_n`` самых дорогих элементов, поэтому «топ» среза не требует полной
+сортировки.
+
+Модуль не зависит от Revit API.
+"""
+from __future__ import absolute_import
+
+import heapq
+import itertools
+from array import array
+from collections import OrderedDict
+
+
+class Cube(object):
+    """Куб: измерения ``dimensions``, суммируемые меры ``measures``."""
+
+    def __init__(self, dimensions, measures, top_n=0):
+        self.dimensions = tuple(dimensions)
+        self.measures = tuple(measures)
+        self.top_n = int(top_n or 0)
+        self._codes = [{} for _ in self.dimensions]     # значение -> код
+        self._values = [[] for _ in self.dimensions]    # код -> значение
+        self._groups = {}                               # кортеж кодов -> номер группы
+        self._keys = []                                 # номер группы -> кортеж кодов
+        self._counts = array("l")
+        self._sums = [array("d") for _ in self.measures]
+        self._top = []                                  # номер группы -> куча (score, seq, payload)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _encode(self, values):
+        codes = []
+        for index, value in enumerate(values):
+            mapping = self._codes[index]
+            code = mapping.get(value)
+            if code is None:
+                code = mapping[value] = len(self._values[index])
+                self._values[index].append(value)
+            codes.append(code)
+        return tuple(codes)
+
+    def _dim_index(self, name):
+        return self.dimensions.index(name)
+
+    def add(self, values, measures, score=None, payload=None):
+        """Добавляет элемент: значения измерений, значения мер (None = 0), вес для топа.
+
+        ``payload`` хранится в куче группы до конца работы куба — передавайте
+        ключ записи (номер, ID), а не саму запись.
+        """
+
+        key = self._encode(values)
+        gid = self._groups.get(key)
+        if gid is None:
+            gid = self._groups[key] = len(self._keys)
+            self._keys.append(key)
+            self._counts.append(0)
+            for column in self._sums:
+                column.append(0.0)
+            self._top.append([])
+        self._counts[gid] += 1
+        for column, value in zip(self._sums, measures):
+            if value is not None:
+                column[gid] += float(value)
+        if self.top_n and score is not None:
+            heap = self._top[gid]
+            item = (float(score), next(self._seq), payload)
+            if len(heap) < self.top_n:
+                heapq.heappush(heap, item)
+            elif item[0] > heap[0][0]:
+                heapq.heapreplace(heap, item)
+        return gid
+
+    def values(self, dimension):
+        """Все встреченные значения измерения в порядке появления."""
+
+        return list(self._values[self._dim_index(dimension)])
+
+    def pivot(self, dimensions):
+        """Свёртка по подмножеству измерений.
+
+        Возвращает OrderedDict: кортеж значений -> (количество, [суммы мер]),
+        в порядке первого появления.
+        """
+
+        indexes = [self._dim_index(name) for name in dimensions]
+        result = OrderedDict()
+        for gid, key in enumerate(self._keys):
+            values = tuple(self._values[i][key[i]] for i in indexes)
+            bucket = result.get(values)
+            if bucket is None:
+                bucket = result[values] = [0, [0.0] * len(self.measures)]
+            bucket[0] += self._counts[gid]
+            sums = bucket[1]
+            for m, column in enumerate(self._sums):
+                sums[m] += column[gid]
+        return OrderedDict((values, (count, sums)) for values, (count, sums) in result.items())
+
+    def top(self, dimensions, n=None):
+        """Топ элементов по весу для каждой группы свёртки: кортеж значений -> [payload].
+
+        Куча каждой мелкой группы уже хранит её топ, поэтому топ крупной
+        группы — это ``nlargest`` по объединению куч.
+        """
+
+        n = int(n or self.top_n)
+        indexes = [self._dim_index(name) for name in dimensions]
+        merged = OrderedDict()
+        for gid, key in enumerate(self._keys):
+            values = tuple(self._values[i][key[i]] for i in indexes)
+            merged.setdefault(values, []).extend(self._top[gid])
+        return OrderedDict(
+            (values, [payload for _, _, payload in heapq.nlargest(n, items)])
+            for values, items in merged.items()
+        )
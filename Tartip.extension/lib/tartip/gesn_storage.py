@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Структурированный результат подбора ГЭСН в расширенном хранилище Revit.
+
+Параметр ``ACBD_ГЭСН`` хранит результат строкой вида
+``08-02-001-01[12,345]; ...`` — для людей и спецификаций. Рядом, в
+``ExtensibleStorage`` элемента, лежит тот же результат в структурированном
+виде: шифры, объёмы для ГЭСН (объём, делённый на кратность), единицы,
+кратности, идентификаторы правил БД и отпечаток исходных данных. Потребители
+(ВОР, сметные расчёты) читают числа напрямую — без разбора строки с
+десятичной запятой.
+
+Списки в сущности параллельны: i-й шифр, i-й объём, i-я единица и т.д.
+"""
+from __future__ import absolute_import
+
+import hashlib
+from collections import OrderedDict, namedtuple
+
+import clr
+from pyrevit import DB
+from System import Double, Guid, Int32, String
+from System.Collections.Generic import IList, List as CsList
+
+ES = DB.ExtensibleStorage
+
+SCHEMA_GUID = Guid("6b0f4d52-9a4e-4c2e-8f1d-3a7c2e51b9a4")
+SCHEMA_NAME = "TartipGesnResult"
+SCHEMA_VERSION = 1
+
+F_VERSION = "Version"
+F_CODES = "Codes"
+F_QUANTITIES = "Quantities"
+F_UNITS = "Units"
+F_MULTIPLIERS = "Multipliers"
+F_RULE_IDS = "RuleIds"
+F_FINGERPRINT = "Fingerprint"
+
+# Один шифр результата: объём уже поделён на кратность единицы измерения ГЭСН.
+GesnItem = namedtuple("GesnItem", ["code", "quantity", "unit", "multiplier", "rule_id"])
+StoredResult = namedtuple("StoredResult", ["items", "fingerprint"])
+
+_schema = None
+
+
+def _set_number_spec(field_builder):
+    try:
+        field_builder.SetSpec(DB.SpecTypeId.Number)
+    except AttributeError:
+        # Revit до 2021: единицы через UnitType
+        field_builder.SetUnitType(DB.UnitType.UT_Number)
+
+
+def _general_unit():
+    try:
+        return DB.UnitTypeId.General
+    except AttributeError:
+        return DB.DisplayUnitType.DUT_GENERAL
+
+
+def get_schema(create=True):
+    """Схема результата; без ``create`` — None, если в сессии её ещё нет."""
+
+    global _schema
+    if _schema is not None and _schema.IsValidObject:
+        return _schema
+    schema = ES.Schema.Lookup(SCHEMA_GUID)
+    if schema is None:
+        if not create:
+            return None
+        builder = ES.SchemaBuilder(SCHEMA_GUID)
+        builder.SetSchemaName(SCHEMA_NAME)
+        builder.SetDocumentation(u"Результат подбора ГЭСН (Tartip)")
+        builder.SetReadAccessLevel(ES.AccessLevel.Public)
+        builder.SetWriteAccessLevel(ES.AccessLevel.Public)
+        builder.AddSimpleField(F_VERSION, clr.GetClrType(Int32))
+        builder.AddArrayField(F_CODES, clr.GetClrType(String))
+        _set_number_spec(builder.AddArrayField(F_QUANTITIES, clr.GetClrType(Double)))
+        builder.AddArrayField(F_UNITS, clr.GetClrType(String))
+        _set_number_spec(builder.AddArrayField(F_MULTIPLIERS, clr.GetClrType(Double)))
+        builder.AddArrayField(F_RULE_IDS, clr.GetClrType(String))
+        builder.AddSimpleField(F_FINGERPRINT, clr.GetClrType(String))
+        schema = builder.Finish()
+    _schema = schema
+    return schema
+
+
+def fingerprint(*values):
+    """Короткий отпечаток исходных данных: совпал — пересчитывать нечего."""
+
+    text = u"\x1f".join(u"{0}".format(value) for value in values)
+    return hashlib.md5(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _strings(values):
+    return CsList[String]([u"{0}".format(value if value is not None else u"") for value in values])
+
+
+def _doubles(values):
+    return CsList[Double]([float(value or 0.0) for value in values])
+
+
+def write(element, items, fingerprint_text=u""):
+    """Записывает результат в элемент (нужна открытая транзакция)."""
+
+    schema = get_schema()
+    unit = _general_unit()
+    items = list(items)
+    entity = ES.Entity(schema)
+    entity.Set[Int32](schema.GetField(F_VERSION), SCHEMA_VERSION)
+    entity.Set[IList[String]](schema.GetField(F_CODES), _strings(i.code for i in items))
+    entity.Set[IList[Double]](schema.GetField(F_QUANTITIES), _doubles(i.quantity for i in items), unit)
+    entity.Set[IList[String]](schema.GetField(F_UNITS), _strings(i.unit for i in items))
+    entity.Set[IList[Double]](schema.GetField(F_MULTIPLIERS), _doubles(i.multiplier for i in items), unit)
+    entity.Set[IList[String]](schema.GetField(F_RULE_IDS), _strings(i.rule_id for i in items))
+    entity.Set[String](schema.GetField(F_FINGERPRINT), fingerprint_text or u"")
+    element.SetEntity(entity)
+
+
+def clear(element):
+    """Удаляет результат из элемента (подбор не удался — старый результат неверен)."""
+
+    schema = get_schema(create=False)
+    if schema is None:
+        return
+    try:
+        if element.GetEntity(schema).IsValid():
+            element.DeleteEntity(schema)
+    except Exception:
+        pass
+
+
+def read(element):
+    """``StoredResult`` элемента или None, если результата нет."""
+
+    schema = get_schema(create=False)
+    if schema is None:
+        return None
+    try:
+        entity = element.GetEntity(schema)
+    except Exception:
+        return None
+    if entity is None or not entity.IsValid():
+        return None
+    unit = _general_unit()
+    codes = list(entity.Get[IList[String]](schema.GetField(F_CODES)))
+    quantities = list(entity.Get[IList[Double]](schema.GetField(F_QUANTITIES), unit))
+    units = list(entity.Get[IList[String]](schema.GetField(F_UNITS)))
+    multipliers = list(entity.Get[IList[Double]](schema.GetField(F_MULTIPLIERS), unit))
+    rule_ids = list(entity.Get[IList[String]](schema.GetField(F_RULE_IDS)))
+    items = [
+        GesnItem(code, quantity, unit_text, multiplier, rule_id)
+        for code, quantity, unit_text, multiplier, rule_id
+        in zip(codes, quantities, units, multipliers, rule_ids)
+    ]
+    return StoredResult(items, entity.Get[String](schema.GetField(F_FINGERPRINT)))
+
+
+def collect(doc):
+    """Элементы документа, в которых записан результат подбора."""
+
+    if get_schema(create=False) is None:
+        return []
+    return DB.FilteredElementCollector(doc) \
+        .WhereElementIsNotElementType() \
+        .WherePasses(ES.ExtensibleStorageFilter(SCHEMA_GUID)) \
+        .ToElements()
+
+
+def totals_by_code(doc, elements=None):
+    """Свод по модели: OrderedDict шифр -> [элементов, объём для ГЭСН, единица]."""
+
+    totals = OrderedDict()
+    for element in (collect(doc) if elements is None else elements):
+        result = read(element)
+        if result is None:
+            continue
+        for item in result.items:
+            bucket = totals.get(item.code)
+            if bucket is None:
+                bucket = totals[item.code] = [0, 0.0, item.unit]
+            bucket[0] += 1
+            bucket[1] += item.quantity
+    return totals
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Отчёт в отдельном HTML-файле для очень больших наборов строк.
+
+Окно вывода pyRevit (встроенный браузер) не справляется с десятками тысяч
+строк таблиц и ссылок на элементы. Здесь строки записываются в файл одним
+компактным JSON-массивом, а небольшой скрипт на странице рисует только
+видимые строки (виртуальная прокрутка), сортирует по щелчку на заголовке и
+фильтрует по выбранным колонкам и строке поиска. Строки пишутся в файл по
+одной, поэтому память не растёт вместе с отчётом.
+
+Модуль не зависит от Revit API.
+"""
+from __future__ import absolute_import
+
+import io
+import json
+from collections import namedtuple
+
+try:
+    text_type = unicode  # noqa: F821 - IronPython 2.7
+except NameError:
+    text_type = str
+
+# kind: "text" | "id" | "int" | "money" | "num"; filter — колонка попадает в фильтры
+Column = namedtuple("Column", ["caption", "kind", "filter"])
+
+_NUMERIC = ("id", "int", "money", "num")
+
+_CSS = u"""
+body{font-family:Segoe UI,Arial,sans-serif;font-size:13px;color:#1b1b1b;margin:12px;}
+h1{font-size:20px;margin:4px 0 10px;}
+table.head{border-collapse:collapse;margin:0 0 12px;}
+table.head td{border:1px solid #d0d0d0;padding:4px 8px;}
+table.head td.n{text-align:right;}
+.bar{margin:0 0 8px;}
+.bar select,.bar input{margin-right:8px;font-size:13px;}
+.muted{color:#666;}
+#grid{border:1px solid #d0d0d0;overflow-x:auto;}
+#hdr,.row{display:flex;white-space:nowrap;}
+#hdr{background:#f0f0f0;font-weight:600;border-bottom:1px solid #d0d0d0;}
+#hdr div{cursor:pointer;user-select:none;}
+#hdr div,.row div{flex:0 0 auto;overflow:hidden;text-overflow:ellipsis;padding:0 6px;box-sizing:border-box;}
+#view{position:relative;overflow-y:auto;height:70vh;}
+.row{position:absolute;left:0;right:0;border-bottom:1px solid #eee;}
+.row.odd{background:#fafafa;}
+.n{text-align:right;}
+"""
+
+_JS = u"""
+(function(){
+var C=COLUMNS,D=DATA,H=24,idx=[],sortCol=-1,sortDir=1;
+var view=document.getElementById('view'),body=document.getElementById('body'),
+    hdr=document.getElementById('hdr'),info=document.getElementById('info'),
+    bar=document.getElementById('filters'),search=document.getElementById('search');
+var W=[];
+for(var c=0,total=0;c<C.length;c++){W.push(C[c].k==='text'?Math.max(120,Math.min(360,C[c].c.length*9)):110);total+=W[c];}
+hdr.style.minWidth=view.style.minWidth=total+'px';
+function num(v,k){
+  if(v===null||v===undefined||v==='')return '';
+  if(k==='id'||k==='int')return String(v);
+  var d=(k==='money')?2:3;
+  return Number(v).toLocaleString('ru-RU',{minimumFractionDigits:d,maximumFractionDigits:d});
+}
+function esc(s){return String(s).replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');}
+var selects=[];
+for(c=0;c<C.length;c++){
+  if(!C[c].f)continue;
+  var seen={},vals=[];
+  for(var i=0;i<D.length;i++){var v=D[i][c];if(v!==null&&!seen[v]){seen[v]=1;vals.push(v);}}
+  vals.sort();
+  var s=document.createElement('select');s.setAttribute('data-col',c);
+  var h='<option value="">'+esc(C[c].c)+': все</option>';
+  for(i=0;i<vals.length;i++){h+='<option>'+esc(vals[i])+'</option>';}
+  s.innerHTML=h;s.onchange=apply;bar.appendChild(s);selects.push(s);
+}
+var cells='';
+for(c=0;c<C.length;c++){
+  cells+='<div data-col="'+c+'" style="width:'+W[c]+'px"'+(C[c].k==='text'?'':' class="n"')+'>'+esc(C[c].c)+'</div>';
+}
+hdr.innerHTML=cells;
+hdr.onclick=function(e){
+  var col=e.target.getAttribute('data-col');if(col===null)return;col=+col;
+  sortDir=(sortCol===col)?-sortDir:1;sortCol=col;sortIdx();draw(true);
+};
+function apply(){
+  var f=[],q=search.value.toLowerCase();
+  for(var j=0;j<selects.length;j++){if(selects[j].value!=='')f.push([+selects[j].getAttribute('data-col'),selects[j].value]);}
+  idx=[];
+  for(var i=0;i<D.length;i++){
+    var r=D[i],ok=true;
+    for(j=0;j<f.length&&ok;j++){if(String(r[f[j][0]])!==f[j][1])ok=false;}
+    if(ok&&q){ok=false;for(j=0;j<r.length;j++){if(r[j]!==null&&String(r[j]).toLowerCase().indexOf(q)>=0){ok=true;break;}}}
+    if(ok)idx.push(i);
+  }
+  sortIdx();draw(true);
+}
+function sortIdx(){
+  if(sortCol<0)return;
+  var col=sortCol,dir=sortDir,numeric=C[col].k!=='text';
+  idx.sort(function(a,b){
+    var x=D[a][col],y=D[b][col];
+    if(x===null||x==='')return (y===null||y==='')?a-b:1;
+    if(y===null||y==='')return -1;
+    if(numeric)return (x-y)*dir||a-b;
+    return (x<y?-1:x>y?1:a-b)*dir;
+  });
+}
+var last=-1;
+function draw(reset){
+  if(reset){view.scrollTop=0;last=-1;}
+  body.style.height=(idx.length*H)+'px';
+  var first=Math.max(0,Math.floor(view.scrollTop/H)-10);
+  if(first===last&&!reset)return;last=first;
+  var end=Math.min(idx.length,first+Math.ceil(view.clientHeight/H)+20),h='';
+  for(var i=first;i<end;i++){
+    var r=D[idx[i]];h+='<div class="row'+(i%2?' odd':'')+'" style="top:'+(i*H)+'px;height:'+H+'px;line-height:'+H+'px">';
+    for(var c=0;c<C.length;c++){
+      var k=C[c].k,v=r[c],t=(k==='text')?(v===null?'':esc(v)):num(v,k);
+      h+='<div style="width:'+W[c]+'px"'+(k==='text'?' title="'+t.replace(/"/g,'&quot;')+'"':' class="n"')+'>'+t+'</div>';
+    }
+    h+='</div>';
+  }
+  body.innerHTML=h;
+  info.textContent='Строк: '+idx.length+' из '+D.length;
+}
+view.onscroll=function(){draw(false);};
+var timer=null;
+search.oninput=function(){clearTimeout(timer);timer=setTimeout(apply,200);};
+window.onresize=function(){draw(false);};
+apply();
+})();
+"""
+
+
+def _t(value):
+    if value is None:
+        return u""
+    if isinstance(value, text_type):
+        return value
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return text_type(value)
+
+
+def _h(value):
+    return (_t(value).replace(u"&", u"&amp;").replace(u"<", u"&lt;")
+            .replace(u">", u"&gt;").replace(u'"', u"&quot;"))
+
+
+def _json(value):
+    # "</" внутри <script> закрыл бы тег — экранируем
+    return _t(json.dumps(value, ensure_ascii=False, separators=(",", ":"))).replace(u"</", u"<\\/")
+
+
+def _compact(value, kind):
+    if value is None or value == u"":
+        return None
+    if kind in _NUMERIC:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return _t(value)
+        if kind in ("id", "int"):
+            return int(number)
+        return round(number, 2 if kind == "money" else 4)
+    return _t(value)
+
+
+def write_report(path, title, headline, columns, rows):
+    """Записывает отчёт в ``path`` и возвращает число строк.
+
+    ``headline`` — пары (подпись, значение) для шапки, ``columns`` — список
+    ``Column``, ``rows`` — итерируемые строки значений в порядке колонок.
+    """
+
+    meta = [{"c": col.caption, "k": col.kind, "f": bool(col.filter)} for col in columns]
+    kinds = [col.kind for col in columns]
+    count = 0
+    with io.open(path, "w", encoding="utf-8") as fp:
+        fp.write(u"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{0}</title>"
+                 u"<style>{1}</style></head><body>".format(_h(title), _CSS))
+        fp.write(u"<h1>{0}</h1><table class='head'>".format(_h(title)))
+        for caption, value in headline:
+            fp.write(u"<tr><td>{0}</td><td class='n'>{1}</td></tr>".format(_h(caption), _h(value)))
+        fp.write(u"</table>")
+        fp.write(u"<div class='bar'><span id='filters'></span>"
+                 u"<input id='search' type='search' placeholder='Поиск'>"
+                 u"<span id='info' class='muted'></span></div>")
+        fp.write(u"<div id='grid'><div id='hdr'></div><div id='view'><div id='body'></div></div></div>")
+        fp.write(u"<script>var COLUMNS={0};var DATA=[".format(_json(meta)))
+        for row in rows:
+            if count:
+                fp.write(u",\n")
+            fp.write(_json([_compact(value, kind) for value, kind in zip(row, kinds)]))
+            count += 1
+        fp.write(u"];</script><script>{0}</script></body></html>".format(_JS))
+    return count
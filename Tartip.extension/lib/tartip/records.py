@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Компактные записи результатов расчёта и хранилище с выгрузкой на диск.
+
+Запись — класс с ``__slots__`` (без ``__dict__`` на каждый экземпляр), что
+заметно экономит память и время сборщика мусора в IronPython при сотнях
+тысяч элементов. Для совместимости с кодом, работавшим со словарями, запись
+поддерживает ``record.get(key)`` и ``record[key]``.
+
+``RecordStore`` — список записей, который при превышении ``spill_limit``
+выгружает накопленное во временный JSONL-файл и освобождает память. Обход
+хранилища возвращает записи в порядке добавления: сначала из файла, затем
+из памяти. Значения полей должны сериализоваться в JSON (числа, строки,
+None, списки); кортежи при чтении из файла становятся списками.
+
+Модуль не зависит от Revit API.
+"""
+from __future__ import absolute_import
+
+import io
+import json
+import os
+import tempfile
+import threading
+
+# Сколько записей держать в памяти до выгрузки во временный файл.
+DEFAULT_SPILL_LIMIT = 50000
+
+
+class Record(object):
+    """База записей: поля перечислены в ``__slots__`` наследника."""
+
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        defaults = self._defaults
+        for index, name in enumerate(self.__slots__):
+            if index < len(args):
+                value = args[index]
+            elif name in kwargs:
+                value = kwargs[name]
+            else:
+                value = defaults.get(name)
+                if isinstance(value, list):
+                    value = list(value)
+            setattr(self, name, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def to_list(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+    def __repr__(self):
+        return u"{0}({1})".format(type(self).__name__, u", ".join(
+            u"{0}={1!r}".format(name, getattr(self, name)) for name in self.__slots__))
+
+
+def record_type(name, fields, defaults=None):
+    """Создаёт класс записи с полями ``fields`` и значениями по умолчанию ``defaults``.
+
+    Поля, не перечисленные в ``defaults``, по умолчанию None. Значение-список
+    в ``defaults`` копируется для каждой записи.
+    """
+
+    return type(str(name), (Record,), {
+        "__slots__": tuple(str(field) for field in fields),
+        "_defaults": dict(defaults or {}),
+    })
+
+
+class RecordStore(object):
+    """Хранилище записей одного типа с выгрузкой в JSONL при переполнении.
+
+    Временный файл удаляется, когда хранилище освобождено всеми
+    владельцами: ``retain()`` перед передачей в фоновую задачу и
+    ``release()`` по её завершении; создатель хранилища вызывает
+    ``release()`` (или ``close()``), когда оно ему больше не нужно.
+    """
+
+    def __init__(self, record_cls, spill_limit=None):
+        self.record_cls = record_cls
+        self.spill_limit = int(DEFAULT_SPILL_LIMIT if spill_limit is None else spill_limit)
+        self._memory = []
+        self._path = None
+        self._spilled = 0
+        self._owners = 1
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._spilled + len(self._memory)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+    @property
+    def spilled(self):
+        """Сколько записей выгружено во временный файл."""
+
+        return self._spilled
+
+    def append(self, record):
+        self._memory.append(record)
+        if self.spill_limit and len(self._memory) >= self.spill_limit:
+            self.spill()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def spill(self):
+        """Выгружает записи из памяти во временный файл."""
+
+        if not self._memory:
+            return
+        if self._path is None:
+            handle, self._path = tempfile.mkstemp(prefix="tartip_", suffix=".jsonl")
+            os.close(handle)
+        with io.open(self._path, "a", encoding="utf-8") as stream:
+            for record in self._memory:
+                stream.write(u"{0}\n".format(json.dumps(record.to_list(), ensure_ascii=False)))
+        self._spilled += len(self._memory)
+        self._memory = []
+
+    def __iter__(self):
+        if self._spilled:
+            from_list = self.record_cls.from_list
+            with io.open(self._path, "r", encoding="utf-8") as stream:
+                for index, line in enumerate(stream):
+                    if index >= self._spilled:
+                        break
+                    yield from_list(json.loads(line))
+        for record in list(self._memory):
+            yield record
+
+    def retain(self):
+        with self._lock:
+            self._owners += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._owners -= 1
+            last = self._owners <= 0
+        if last:
+            self.close()
+
+    def close(self):
+        """Удаляет временный файл и очищает хранилище."""
+
+        self._memory = []
+        self._spilled = 0
+        path, self._path = self._path, None
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
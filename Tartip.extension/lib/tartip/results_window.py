@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Окно результатов: виртуализированный DataGrid вместо HTML-таблиц.
+
+Строки результата загружаются в ``System.Data.DataTable``; DataGrid рисует
+только видимые строки (виртуализация и переиспользование контейнеров, в том
+числе при группировке), сортирует по щелчку на заголовке и группирует по
+выбранной колонке. Кнопка «Выбрать в модели» выделяет в Revit элементы
+выбранных строк — вместо ссылки ``linkify`` в каждой строке отчёта.
+
+Колонки описываются так же, как для HTML-отчёта (``html_report.Column``):
+колонки с ``filter`` попадают в список группировки, колонка вида ``id``
+содержит ElementId.
+"""
+from __future__ import absolute_import
+
+import os
+
+import clr
+
+clr.AddReference("System.Data")
+
+from pyrevit import DB, forms  # noqa: E402
+from System import DBNull, Double, Int64, String, Array, Object  # noqa: E402
+from System.Collections.Generic import List as CsList  # noqa: E402
+from System.Data import DataTable  # noqa: E402
+from System.Windows import Setter, Style, TextAlignment  # noqa: E402
+from System.Windows.Controls import DataGridTextColumn, TextBlock  # noqa: E402
+from System.Windows.Data import Binding, CollectionViewSource, PropertyGroupDescription  # noqa: E402
+
+XAML_FILE = os.path.join(os.path.dirname(__file__), "ResultsWindow.xaml")
+
+_FORMATS = {"money": u"N2", "num": u"N3"}
+_NO_GROUPING = u"(без группировки)"
+
+
+def _clr_type(kind):
+    if kind in ("id", "int"):
+        return clr.GetClrType(Int64)
+    if kind in ("money", "num"):
+        return clr.GetClrType(Double)
+    return clr.GetClrType(String)
+
+
+def _cell(value, kind):
+    if value is None or value == u"":
+        return DBNull.Value
+    if kind in ("id", "int"):
+        try:
+            return Int64(int(value))
+        except (TypeError, ValueError):
+            return DBNull.Value
+    if kind in ("money", "num"):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return DBNull.Value
+    return u"{0}".format(value)
+
+
+def build_table(columns, rows):
+    """DataTable с колонками ``c0..cN`` нужных типов."""
+
+    table = DataTable()
+    kinds = [col.kind for col in columns]
+    for index, col in enumerate(columns):
+        table.Columns.Add(u"c{0}".format(index), _clr_type(col.kind))
+    table.BeginLoadData()
+    try:
+        for row in rows:
+            values = [_cell(value, kind) for value, kind in zip(row, kinds)]
+            table.Rows.Add(Array[Object](values))
+    finally:
+        table.EndLoadData()
+    return table
+
+
+def _right_aligned():
+    style = Style(clr.GetClrType(TextBlock))
+    style.Setters.Add(Setter(TextBlock.TextAlignmentProperty, TextAlignment.Right))
+    return style
+
+
+class ResultsWindow(forms.WPFWindow):
+    """Модальное окно с результатами выполнения."""
+
+    def __init__(self, title, columns, rows, uidoc=None):
+        forms.WPFWindow.__init__(self, XAML_FILE)
+        self.Title = title
+        self._uidoc = uidoc
+        self._columns = list(columns)
+        self._id_field = None
+
+        self._table = build_table(self._columns, rows)
+        numeric = _right_aligned()
+        for index, col in enumerate(self._columns):
+            field = u"c{0}".format(index)
+            if col.kind == "id" and self._id_field is None:
+                self._id_field = field
+            binding = Binding(field)
+            if col.kind in _FORMATS:
+                binding.StringFormat = _FORMATS[col.kind]
+            column = DataGridTextColumn()
+            column.Header = col.caption
+            column.Binding = binding
+            if col.kind != "text":
+                column.ElementStyle = numeric
+            self.ResultsGrid.Columns.Add(column)
+        self.ResultsGrid.ItemsSource = self._table.DefaultView
+
+        self._groups = [(_NO_GROUPING, None)]
+        for index, col in enumerate(self._columns):
+            if col.filter:
+                self._groups.append((col.caption, u"c{0}".format(index)))
+        for caption, _ in self._groups:
+            self.GroupCombo.Items.Add(caption)
+        self.GroupCombo.SelectedIndex = 0
+        self.GroupCombo.SelectionChanged += self._on_group
+        self.ResultsGrid.SelectionChanged += self._on_selection
+        self.SelectButton.Click += self._on_select_in_model
+        self.CloseButton.Click += self._on_close
+        self.SelectButton.IsEnabled = bool(uidoc is not None and self._id_field)
+        self._update_count()
+
+    def _update_count(self):
+        selected = self.ResultsGrid.SelectedItems.Count
+        text = u"Строк: {0}".format(self._table.Rows.Count)
+        if selected:
+            text += u"; выбрано: {0}".format(selected)
+        self.CountText.Text = text
+
+    def _on_group(self, sender, args):
+        view = CollectionViewSource.GetDefaultView(self.ResultsGrid.ItemsSource)
+        view.GroupDescriptions.Clear()
+        field = self._groups[self.GroupCombo.SelectedIndex][1]
+        if field:
+            view.GroupDescriptions.Add(PropertyGroupDescription(field))
+
+    def _on_selection(self, sender, args):
+        self._update_count()
+
+    def _selected_ids(self):
+        ids = []
+        for item in self.ResultsGrid.SelectedItems:
+            try:
+                value = item[self._id_field]
+            except Exception:
+                continue
+            if value is not None and value is not DBNull.Value:
+                ids.append(DB.ElementId(int(value)))
+        return ids
+
+    def _on_select_in_model(self, sender, args):
+        ids = self._selected_ids()
+        if not ids:
+            return
+        element_ids = CsList[DB.ElementId](ids)
+        self._uidoc.Selection.SetElementIds(element_ids)
+        try:
+            self._uidoc.ShowElements(element_ids)
+        except Exception:
+            pass
+        self.Close()
+
+    def _on_close(self, sender, args):
+        self.Close()
+
+
+def show_results(title, columns, rows, uidoc=None):
+    """Показывает окно результатов модально."""
+
+    ResultsWindow(title, columns, rows, uidoc=uidoc).ShowDialog()
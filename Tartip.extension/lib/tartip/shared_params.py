@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Доступ к параметрам по GUID общих параметров документа.
+
+Поиск по имени (``LookupParameter``) для каждого элемента медленный и
+неоднозначен. ``ParameterIndex`` один раз на документ сопоставляет имена с
+GUID элементов ``SharedParameterElement`` и собирает привязки параметров
+проекта; дальше параметры читаются через ``get_Parameter(Guid)``. Поиск по
+имени остаётся запасным вариантом — для параметров семейств, параметров
+проекта, которые не являются общими, и одноимённых общих параметров с
+другим GUID.
+"""
+from __future__ import absolute_import
+
+from pyrevit import DB
+
+
+def _default_fold(name):
+    try:
+        return (name or u"").replace(u"\u00A0", u" ").strip().lower()
+    except Exception:
+        return u""
+
+
+def _default_lookup(holder, name):
+    try:
+        return holder.LookupParameter(name)
+    except Exception:
+        return None
+
+
+def _element_name(element):
+    try:
+        return element.Name
+    except Exception:
+        try:
+            return element.GetDefinition().Name
+        except Exception:
+            return None
+
+
+class ParameterIndex(object):
+    """Имена параметров, разрешённые в GUID один раз на документ.
+
+    ``fold`` нормализует имена при сопоставлении (по умолчанию — регистр и
+    пробелы), ``fallback(holder, name)`` ищет параметр по имени, если общего
+    параметра с таким именем в документе нет или у элемента его нет ни под
+    одним из GUID.
+    """
+
+    def __init__(self, doc, names, fold=None, fallback=None):
+        self.fold = fold or _default_fold
+        self.fallback = fallback or _default_lookup
+        self.names = list(names)
+        wanted = dict((self.fold(name), name) for name in self.names)
+
+        # имя -> список GUID: в модели бывают одноимённые общие параметры
+        self.guids = {}
+        collector = DB.FilteredElementCollector(doc).OfClass(DB.SharedParameterElement)
+        for element in collector:
+            name = wanted.get(self.fold(_element_name(element)))
+            if name is None:
+                continue
+            try:
+                self.guids.setdefault(name, []).append(element.GuidValue)
+            except Exception:
+                pass
+
+        self.bound = set()
+        try:
+            iterator = doc.ParameterBindings.ForwardIterator()
+            while iterator.MoveNext():
+                name = wanted.get(self.fold(_element_name(iterator.Key)))
+                if name is not None:
+                    self.bound.add(name)
+        except Exception:
+            pass
+
+    def is_shared(self, name):
+        return bool(self.guids.get(name))
+
+    def missing_bindings(self, names=None):
+        """Имена, которые не привязаны к категориям проекта."""
+
+        return [name for name in (names or self.names) if name not in self.bound]
+
+    def get(self, holder, name):
+        """Параметр ``name`` элемента или типа; None, если не найден."""
+
+        if holder is None:
+            return None
+        guids = self.guids.get(name)
+        if not guids:
+            return self.fallback(holder, name)
+        for guid in guids:
+            try:
+                param = holder.get_Parameter(guid)
+            except Exception:
+                param = None
+            if param:
+                return param
+        # одноимённый параметр семейства или общий с другим GUID
+        return self.fallback(holder, name)
+
+    def get_writable(self, holder, names):
+        """Первый доступный для записи параметр из списка имён."""
+
+        for name in names:
+            param = self.get(holder, name)
+            if param and not param.IsReadOnly:
+                return param
+        return None
+
+
+def format_missing(names):
+    """Текст предупреждения о параметрах без привязки к проекту."""
+
+    return u"Параметры не добавлены в проект (нет привязки к категориям):\n{0}".format(
+        u"\n".join(u"  • {0}".format(name) for name in names)
+    )
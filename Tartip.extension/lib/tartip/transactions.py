@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Пакетное выполнение изменений модели: подтранзакции внутри TransactionGroup.
+
+Вместо одной большой транзакции элементы обрабатываются порциями по
+``chunk_size``: каждая порция фиксируется отдельной транзакцией, а в конце
+группа сливается (Assimilate) в одну запись истории отмены. Пользователь видит
+прогресс и может прервать выполнение — тогда вся группа откатывается.
+"""
+from __future__ import absolute_import
+
+from pyrevit import DB, forms
+
+# Сколько элементов фиксировать в одной подтранзакции.
+DEFAULT_CHUNK_SIZE = 500
+
+
+class SuppressWarningsPreprocessor(DB.IFailuresPreprocessor):
+    """Удаляет предупреждения Revit, чтобы они не прерывали пакетную запись."""
+
+    def __init__(self):
+        self.suppressed = 0
+
+    def PreprocessFailures(self, failuresAccessor):  # noqa: N802 - Revit API
+        try:
+            messages = list(failuresAccessor.GetFailureMessages())
+        except Exception:
+            messages = []
+        for message in messages:
+            try:
+                if message.GetSeverity() == DB.FailureSeverity.Warning:
+                    failuresAccessor.DeleteWarning(message)
+                    self.suppressed += 1
+            except Exception:
+                pass
+        return DB.FailureProcessingResult.Continue
+
+
+class ChunkedRun(object):
+    """Итог пакетного выполнения."""
+
+    def __init__(self):
+        # Результаты action() в порядке обработки (только для зафиксированных порций)
+        self.results = []
+        # (элемент, текст ошибки) — исключения action() и откатившиеся порции
+        self.failed = []
+        self.cancelled = False
+        self.chunks = 0
+        self.suppressed_warnings = 0
+
+    @property
+    def processed(self):
+        return len(self.results)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _start_transaction(doc, title, preprocessor):
+    t = DB.Transaction(doc, title)
+    options = t.GetFailureHandlingOptions()
+    options.SetFailuresPreprocessor(preprocessor)
+    options.SetClearAfterRollback(True)
+    t.SetFailureHandlingOptions(options)
+    t.Start()
+    return t
+
+
+def _progress_title(title):
+    return u"{0} ({{value}} из {{max_value}})".format(title)
+
+
+def run_chunked(doc, items, action, title, chunk_size=None, cancellable=True):
+    """Выполняет ``action(item)`` для всех элементов порциями.
+
+    Каждая порция — отдельная транзакция с подавлением предупреждений; все
+    порции собираются в одну TransactionGroup. Исключение в ``action`` не
+    откатывает порцию: элемент попадает в ``ChunkedRun.failed``. При отмене
+    пользователем группа откатывается целиком и ``cancelled`` = True.
+    """
+
+    items = list(items)
+    size = max(1, int(chunk_size or DEFAULT_CHUNK_SIZE))
+    total = len(items)
+    run = ChunkedRun()
+    preprocessor = SuppressWarningsPreprocessor()
+
+    group = DB.TransactionGroup(doc, title)
+    group.Start()
+    t = None
+    try:
+        done = 0
+        step = max(1, total // 100)
+        with forms.ProgressBar(title=_progress_title(title), cancellable=cancellable) as pb:
+            for chunk in _chunks(items, size):
+                t = _start_transaction(doc, title, preprocessor)
+                chunk_results = []
+                chunk_failed = []
+                for item in chunk:
+                    if pb.cancelled:
+                        run.cancelled = True
+                        break
+                    try:
+                        chunk_results.append(action(item))
+                    except Exception as exc:
+                        chunk_failed.append((item, u"{0}".format(exc)))
+                    done += 1
+                    if done % step == 0:
+                        pb.update_progress(done, total)
+
+                if run.cancelled:
+                    t.RollBack()
+                    break
+
+                status = t.Commit()
+                run.chunks += 1
+                if status == DB.TransactionStatus.Committed:
+                    run.results.extend(chunk_results)
+                    run.failed.extend(chunk_failed)
+                else:
+                    reason = u"Транзакция порции не зафиксирована: {0}".format(status)
+                    run.failed.extend((item, reason) for item in chunk)
+                pb.update_progress(done, total)
+
+        run.suppressed_warnings = preprocessor.suppressed
+        if run.cancelled:
+            group.RollBack()
+            run.results = []
+        else:
+            group.Assimilate()
+    except Exception:
+        if t is not None and t.GetStatus() == DB.TransactionStatus.Started:
+            t.RollBack()
+        if group.GetStatus() == DB.TransactionStatus.Started:
+            group.RollBack()
+        raise
+
+    return run
+
+
+def run_with_progress(items, action, title, cancellable=True):
+    """Выполняет ``action(item)`` без транзакции — для фаз, которые только читают модель.
+
+    Прогресс и отмена как в ``run_chunked``; при отмене ``cancelled`` = True,
+    а ``results`` содержит уже обработанную часть.
+    """
+
+    items = list(items)
+    total = len(items)
+    run = ChunkedRun()
+    step = max(1, total // 100)
+    with forms.ProgressBar(title=_progress_title(title), cancellable=cancellable) as pb:
+        for done, item in enumerate(items, 1):
+            if pb.cancelled:
+                run.cancelled = True
+                break
+            try:
+                run.results.append(action(item))
+            except Exception as exc:
+                run.failed.append((item, u"{0}".format(exc)))
+            if done % step == 0:
+                pb.update_progress(done, total)
+    return run
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Предварительное занятие элементов в модели с совместной работой.
+
+В файле хранилища запись в элемент, занятый другим пользователем или
+изменённый в центральной модели, завершается ошибкой — и так по одному
+вызову на элемент. ``checkout`` до начала записи занимает весь набор одним
+вызовом ``WorksharingUtils.CheckoutElements`` и возвращает элементы, которые
+редактировать нельзя, с причиной — их исключают из плана записи и выводят в
+отчёт.
+"""
+from __future__ import absolute_import
+
+from pyrevit import DB
+from System.Collections.Generic import List as CsList
+
+
+class CheckoutResult(object):
+    """Итог предварительного занятия элементов."""
+
+    def __init__(self, editable, excluded):
+        # id (int) элементов, доступных для записи
+        self.editable = editable
+        # (id, причина) элементов, исключённых из записи
+        self.excluded = excluded
+
+    def is_editable(self, element_id):
+        return element_id in self.editable
+
+
+def _element_id(item):
+    if isinstance(item, DB.ElementId):
+        return item.IntegerValue
+    try:
+        return item.Id.IntegerValue
+    except AttributeError:
+        return int(item)
+
+
+def _owner(doc, eid):
+    try:
+        return DB.WorksharingUtils.GetWorksharingTooltipInfo(doc, eid).Owner
+    except Exception:
+        return None
+
+
+def _h(text):
+    return (u"{0}".format(text).replace(u"&", u"&amp;")
+            .replace(u"<", u"&lt;").replace(u">", u"&gt;"))
+
+
+def _reason(doc, eid, attempted):
+    """Причина, по которой элемент не удалось занять; None — элемент доступен."""
+
+    try:
+        updates = DB.WorksharingUtils.GetModelUpdatesStatus(doc, eid)
+    except Exception:
+        updates = None
+    if updates == DB.ModelUpdatesStatus.DeletedInCentral:
+        return u"Удалён в центральной модели"
+    if updates == DB.ModelUpdatesStatus.UpdatedInCentral:
+        return u"Изменён в центральной модели — нужна синхронизация"
+
+    try:
+        status = DB.WorksharingUtils.GetCheckoutStatus(doc, eid)
+    except Exception:
+        return u"Не удалось определить статус занятости"
+    if status == DB.CheckoutStatus.OwnedByOtherUser:
+        owner = _owner(doc, eid)
+        return u"Занят пользователем {0}".format(owner) if owner else u"Занят другим пользователем"
+    if status == DB.CheckoutStatus.NotOwned and attempted:
+        return u"Не удалось занять элемент"
+    return None
+
+
+def checkout(doc, items):
+    """Занимает элементы (``Element``, ``ElementId`` или int) перед записью.
+
+    Вызывается вне транзакции. Для модели без совместной работы все элементы
+    считаются доступными.
+    """
+
+    ids = []
+    seen = set()
+    for item in items:
+        eid = _element_id(item)
+        if eid not in seen:
+            seen.add(eid)
+            ids.append(eid)
+
+    if not getattr(doc, "IsWorkshared", False) or not ids:
+        return CheckoutResult(set(ids), [])
+
+    requested = CsList[DB.ElementId]([DB.ElementId(eid) for eid in ids])
+    attempted = True
+    try:
+        checked_out = set(eid.IntegerValue for eid in
+                          DB.WorksharingUtils.CheckoutElements(doc, requested))
+    except Exception:
+        # хранилище недоступно — решение принимаем по статусу каждого элемента
+        attempted = False
+        checked_out = set()
+
+    editable = set()
+    excluded = []
+    for eid in ids:
+        if eid in checked_out:
+            editable.add(eid)
+            continue
+        reason = _reason(doc, DB.ElementId(eid), attempted)
+        if reason is None:
+            editable.add(eid)
+        else:
+            excluded.append((eid, reason))
+    return CheckoutResult(editable, excluded)
+
+
+def print_excluded(out, result, title=u"Исключены из записи (совместная работа)"):
+    """Выводит в окно pyRevit элементы, исключённые из записи."""
+
+    if not result.excluded:
+        return
+    rows = [u"<h3>{0}: {1}</h3>".format(title, len(result.excluded)),
+            u"<table class='acbd'><thead><tr><th>ID</th><th>Причина</th></tr></thead><tbody>"]
+    for eid, reason in result.excluded:
+        rows.append(u"<tr><td>{0}</td><td>{1}</td></tr>".format(
+            out.linkify(DB.ElementId(eid), u"{0}".format(eid)), _h(reason)))
+    rows.append(u"</tbody></table>")
+    out.print_html(u"".join(rows))
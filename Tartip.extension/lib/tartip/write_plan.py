@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""План записи параметров: расчёт отделён от изменения модели.
+
+Фаза расчёта читает модель без открытой транзакции и формирует неизменяемый
+план — кортеж записей ``WriteOp(element_id, param_name, value)``. Фаза записи
+применяет план плотным циклом через ``transactions.run_chunked``. Режим
+«только расчёт» (dry-run) просто не вызывает ``apply_plan``.
+"""
+from __future__ import absolute_import
+
+from collections import OrderedDict, namedtuple
+
+from pyrevit import DB
+
+from . import transactions
+
+WriteOp = namedtuple("WriteOp", ["element_id", "param_name", "value"])
+
+
+def freeze(ops):
+    """Фиксирует план: возвращает кортеж записей."""
+
+    return tuple(ops)
+
+
+def exclude(plan, element_ids):
+    """Возвращает план без записей для указанных элементов."""
+
+    skip = set(element_ids)
+    return tuple(op for op in plan if op.element_id not in skip)
+
+
+def group_by_element(plan):
+    """Группирует записи плана по элементу, сохраняя порядок появления."""
+
+    grouped = OrderedDict()
+    for op in plan:
+        grouped.setdefault(op.element_id, []).append(op)
+    return [(element_id, tuple(ops)) for element_id, ops in grouped.items()]
+
+
+def apply_plan(doc, plan, setter, title, chunk_size=None):
+    """Применяет план: ``setter(element, op)`` возвращает True при успешной записи.
+
+    Результат — ``ChunkedRun``, где ``results`` содержит кортежи
+    ``(element_id, записано, всего_в_плане)`` по каждому элементу.
+    """
+
+    def _apply(group):
+        element_id, ops = group
+        element = doc.GetElement(DB.ElementId(element_id))
+        written = 0
+        if element is not None:
+            for op in ops:
+                if setter(element, op):
+                    written += 1
+        return element_id, written, len(ops)
+
+    return transactions.run_chunked(doc, group_by_element(plan), _apply, title,
+                                    chunk_size=chunk_size)
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+"""Потоковая запись XLSX без сторонних библиотек.
+
+Строки листа пишутся сразу в элемент zip-архива (в IronPython 2.7, где
+``ZipFile.open(..., "w")`` нет, — во временный файл, который затем
+упаковывается), поэтому память не зависит от числа строк. Текст хранится
+один раз в ``sharedStrings.xml``; таблица общих строк ограничена
+(``SHARED_STRINGS_LIMIT``), сверх неё — уникальный по строкам текст (ID,
+комментарии) — пишется прямо в ячейку (``inlineStr``). Числа записываются
+числовыми ячейками со стилями из ``styles.xml`` (деньги, трудозатраты,
+количества). Поддерживаются
+несколько листов, автофильтр, закреплённая строка заголовка, скрытые колонки
+и структура строк (``outlineLevel``).
+
+Пример::
+
+    with XlsxWriter(path) as book:
+        sheet = book.add_sheet(u"Details", [(u"ID", "int"), (u"Сумма", "money")])
+        sheet.write_row([123, 4500.5])
+
+Если в блоке ``with`` возникло исключение, недописанный файл удаляется.
+
+Модуль не зависит от Revit API.
+"""
+from __future__ import absolute_import
+
+import datetime
+import io
+import math
+import os
+import re
+import tempfile
+import zipfile
+
+try:
+    text_type = unicode  # noqa: F821 - IronPython 2.7
+except NameError:
+    text_type = str
+
+try:
+    integer_types = (int, long)  # noqa: F821 - IronPython 2.7
+except NameError:
+    integer_types = (int,)
+
+# Стили ячеек: имя -> (numFmtId, код формата или None для встроенного, жирный)
+STYLES = [
+    ("text", 0, None, False),
+    ("header", 0, None, True),
+    ("money", 4, None, False),              # #,##0.00
+    ("labor", 164, u"#,##0.000", False),
+    ("qty", 165, u"0.###", False),
+    ("int", 1, None, False),                # 0
+    ("decimal", 166, u"0.#######", False),
+    ("bold_text", 49, None, True),          # @
+    ("bold_int", 1, None, True),
+    ("bold_decimal", 166, u"0.#######", True),
+]
+STYLE_INDEX = dict((name, index) for index, (name, _, _, _) in enumerate(STYLES))
+
+# Сколько строк копить перед записью в поток
+_FLUSH_ROWS = 1000
+
+# Сколько разных строк держать в sharedStrings.xml; остальные — inlineStr
+SHARED_STRINGS_LIMIT = 100000
+
+_INVALID_XML = re.compile(u"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_NS_MAIN = u"http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = u"http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_REL = u"http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_HEAD = u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+
+def _x(text):
+    text = _INVALID_XML.sub(u"", text)
+    return text.replace(u"&", u"&amp;").replace(u"<", u"&lt;").replace(u">", u"&gt;")
+
+
+def _t(value):
+    if isinstance(value, text_type):
+        return value
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return text_type(value)
+
+
+def column_letter(index):
+    """Буквенное имя колонки по индексу с нуля: 0 -> A, 26 -> AA."""
+
+    letters = u""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = u"ABCDEFGHIJKLMNOPQRSTUVWXYZ"[rem] + letters
+    return letters
+
+
+def _is_number(value):
+    return isinstance(value, integer_types + (float,)) and not isinstance(value, bool)
+
+
+class _EntryStream(object):
+    """Поток в элемент архива; без ``ZipFile.open("w")`` — через временный файл."""
+
+    def __init__(self, zf, arcname):
+        self._zf = zf
+        self._arcname = arcname
+        self._tmp = None
+        try:
+            self._fp = zf.open(arcname, "w", force_zip64=True)
+        except (TypeError, ValueError, RuntimeError):
+            handle, self._tmp = tempfile.mkstemp(suffix=".xml")
+            os.close(handle)
+            self._fp = io.open(self._tmp, "wb")
+
+    def write(self, text):
+        self._fp.write(text.encode("utf-8"))
+
+    def close(self):
+        self._fp.close()
+        if self._tmp:
+            try:
+                self._zf.write(self._tmp, self._arcname)
+            finally:
+                os.remove(self._tmp)
+
+    def abort(self):
+        """Закрывает поток без упаковки временного файла; ошибки не поднимаются."""
+
+        try:
+            self._fp.close()
+        except Exception:
+            pass
+        if self._tmp:
+            try:
+                os.remove(self._tmp)
+            except OSError:
+                pass
+
+
+class SheetWriter(object):
+    """Лист, строки которого пишутся по мере поступления."""
+
+    def __init__(self, book, index, name, columns, freeze_header, autofilter, widths,
+                 hidden_columns=None, outline_level=0, summary_above=False):
+        self.name = name
+        self.index = index
+        self.rows = 0
+        self._book = book
+        self._styles = [STYLE_INDEX.get(style or "text", 0) for _, style in columns]
+        self._ncols = len(columns)
+        self._letters = [column_letter(col) for col in range(self._ncols)]
+        self._autofilter = autofilter and bool(columns)
+        self._pending = []
+        self._stream = _EntryStream(book._zip, "xl/worksheets/sheet{0}.xml".format(index))
+
+        head = [_XML_HEAD, u'<worksheet xmlns="{0}" xmlns:r="{1}">'.format(_NS_MAIN, _NS_REL)]
+        if outline_level and summary_above:
+            head.append(u'<sheetPr><outlinePr summaryBelow="0"/></sheetPr>')
+        if freeze_header and columns:
+            head.append(u'<sheetViews><sheetView workbookViewId="0">'
+                        u'<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                        u'<selection pane="bottomLeft" activeCell="A2" sqref="A2"/>'
+                        u'</sheetView></sheetViews>')
+        if outline_level:
+            head.append(u'<sheetFormatPr defaultRowHeight="15" outlineLevelRow="{0}"/>'.format(int(outline_level)))
+        hidden = set(hidden_columns or ())
+        widths = list(widths or ())
+        cols = []
+        for col in range(max(len(widths), max(hidden) + 1 if hidden else 0)):
+            width = widths[col] if col < len(widths) else None
+            attrs = u""
+            if width:
+                attrs += u' width="{0}" customWidth="1"'.format(width)
+            if col in hidden:
+                attrs += u' hidden="1"' if width else u' width="9.140625" hidden="1"'
+            if attrs:
+                cols.append(u'<col min="{0}" max="{0}"{1}/>'.format(col + 1, attrs))
+        if cols:
+            head.append(u"<cols>{0}</cols>".format(u"".join(cols)))
+        head.append(u"<sheetData>")
+        self._stream.write(u"".join(head))
+        if columns:
+            self.write_row([caption for caption, _ in columns], styles=["header"] * self._ncols)
+
+    def write_row(self, values, styles=None, level=0, hidden=False):
+        """Добавляет строку; ``styles`` переопределяет стили колонок для этой строки.
+
+        ``level`` — уровень структуры строки (``outlineLevel``), ``hidden`` —
+        строка свёрнута.
+        """
+
+        self.rows += 1
+        row_no = self.rows
+        cells = []
+        for col, value in enumerate(values):
+            if value is None:
+                continue
+            if styles is not None and col < len(styles) and styles[col]:
+                style = STYLE_INDEX.get(styles[col], 0)
+            else:
+                style = self._styles[col] if col < self._ncols else 0
+            letter = self._letters[col] if col < self._ncols else column_letter(col)
+            ref = u"{0}{1}".format(letter, row_no)
+            s_attr = u' s="{0}"'.format(style) if style else u""
+            if _is_number(value):
+                if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+                    continue
+                number = text_type(value) if isinstance(value, integer_types) else repr(value)
+                cells.append(u'<c r="{0}"{1}><v>{2}</v></c>'.format(ref, s_attr, number))
+            else:
+                text = _t(value)
+                if not text:
+                    continue
+                index = self._book._shared(text)
+                if index is None:
+                    cells.append(u'<c r="{0}"{1} t="inlineStr"><is><t xml:space="preserve">{2}</t></is></c>'.format(
+                        ref, s_attr, _x(text)))
+                else:
+                    cells.append(u'<c r="{0}"{1} t="s"><v>{2}</v></c>'.format(ref, s_attr, index))
+        attrs = u""
+        if level:
+            attrs += u' outlineLevel="{0}"'.format(int(level))
+        if hidden:
+            attrs += u' hidden="1"'
+        self._pending.append(u'<row r="{0}"{1}>{2}</row>'.format(row_no, attrs, u"".join(cells)))
+        if len(self._pending) >= _FLUSH_ROWS:
+            self._flush()
+
+    def write_rows(self, rows):
+        for values in rows:
+            self.write_row(values)
+
+    def _flush(self):
+        if self._pending:
+            self._stream.write(u"".join(self._pending))
+            self._pending = []
+
+    @property
+    def filter_ref(self):
+        return u"A1:{0}{1}".format(column_letter(self._ncols - 1), max(self.rows, 1))
+
+    @property
+    def filter_ref_absolute(self):
+        return u"$A$1:${0}${1}".format(column_letter(self._ncols - 1), max(self.rows, 1))
+
+    def close(self):
+        if self._stream is None:
+            return
+        self._flush()
+        tail = [u"</sheetData>"]
+        if self._autofilter:
+            tail.append(u'<autoFilter ref="{0}"/>'.format(self.filter_ref))
+        tail.append(u"</worksheet>")
+        self._stream.write(u"".join(tail))
+        self._stream.close()
+        self._stream = None
+
+    def abort(self):
+        if self._stream is not None:
+            self._stream.abort()
+            self._stream = None
+
+
+class XlsxWriter(object):
+    """Книга XLSX; листы пишутся по очереди, общие части — при ``close``.
+
+    ``shared_limit`` — сколько разных строк хранить в ``sharedStrings.xml``.
+    """
+
+    def __init__(self, path, title=u"ACBD Export", shared_limit=SHARED_STRINGS_LIMIT):
+        self.title = title
+        self._path = path if isinstance(path, (text_type, str)) else None
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._sheets = []
+        self._current = None
+        self._strings = {}
+        self._string_list = []
+        self._shared_limit = shared_limit
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def _shared(self, text):
+        """Индекс строки в ``sharedStrings.xml``; None — таблица заполнена."""
+
+        index = self._strings.get(text)
+        if index is None:
+            if len(self._string_list) >= self._shared_limit:
+                return None
+            index = self._strings[text] = len(self._string_list)
+            self._string_list.append(text)
+        return index
+
+    def add_sheet(self, name, columns, freeze_header=True, autofilter=True, widths=None,
+                  hidden_columns=None, outline_level=0, summary_above=False):
+        """Начинает новый лист (предыдущий закрывается).
+
+        ``columns`` — пары (заголовок, стиль), стиль — имя из ``STYLES``.
+        ``hidden_columns`` — индексы скрытых колонок. ``outline_level`` —
+        наибольший уровень структуры строк, ``summary_above`` — итоговые
+        строки над деталями (``SummaryRow = xlAbove``).
+        """
+
+        if self._current is not None:
+            self._current.close()
+        name = re.sub(u"[\\[\\]:*?/\\\\]", u"_", _t(name))[:31] or u"Sheet{0}".format(len(self._sheets) + 1)
+        self._current = SheetWriter(self, len(self._sheets) + 1, name, columns,
+                                    freeze_header, autofilter, widths,
+                                    hidden_columns, outline_level, summary_above)
+        self._sheets.append(self._current)
+        return self._current
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        try:
+            self._write_parts()
+        finally:
+            self._zip.close()
+
+    def abort(self):
+        """Прерывает запись: закрывает открытый лист и архив, удаляет файл.
+
+        Ошибки закрытия не поднимаются, чтобы не заслонить исходное исключение.
+        """
+
+        if self._current is not None:
+            self._current.abort()
+            self._current = None
+        try:
+            self._zip.close()
+        except Exception:
+            pass
+        if self._path:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+
+    def _part(self, arcname, text):
+        self._zip.writestr(arcname, text.encode("utf-8"))
+
+    def _write_parts(self):
+        sheets = self._sheets
+        overrides = [
+            (u"/xl/workbook.xml", u"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"),
+            (u"/xl/styles.xml", u"application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"),
+            (u"/xl/sharedStrings.xml", u"application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"),
+            (u"/docProps/core.xml", u"application/vnd.openxmlformats-package.core-properties+xml"),
+            (u"/docProps/app.xml", u"application/vnd.openxmlformats-officedocument.extended-properties+xml"),
+        ]
+        overrides.extend(
+            (u"/xl/worksheets/sheet{0}.xml".format(sheet.index),
+             u"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml")
+            for sheet in sheets)
+        self._part("[Content_Types].xml", _XML_HEAD + u"".join(
+            [u'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">',
+             u'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>',
+             u'<Default Extension="xml" ContentType="application/xml"/>']
+            + [u'<Override PartName="{0}" ContentType="{1}"/>'.format(p, c) for p, c in overrides]
+            + [u"</Types>"]))
+
+        self._part("_rels/.rels", _XML_HEAD + (
+            u'<Relationships xmlns="{0}">'
+            u'<Relationship Id="rId1" Type="{1}/officeDocument" Target="xl/workbook.xml"/>'
+            u'<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="docProps/core.xml"/>'
+            u'<Relationship Id="rId3" Type="{1}/extended-properties" Target="docProps/app.xml"/>'
+            u"</Relationships>").format(_NS_PKG_REL, _NS_REL))
+
+        now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._part("docProps/core.xml", _XML_HEAD + (
+            u'<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+            u'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+            u'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+            u"<dc:title>{0}</dc:title><dc:creator>pyRevit</dc:creator><cp:lastModifiedBy>pyRevit</cp:lastModifiedBy>"
+            u'<dcterms:created xsi:type="dcterms:W3CDTF">{1}</dcterms:created>'
+            u'<dcterms:modified xsi:type="dcterms:W3CDTF">{1}</dcterms:modified>'
+            u"</cp:coreProperties>").format(_x(self.title), now))
+        self._part("docProps/app.xml", _XML_HEAD + (
+            u'<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+            u"<Application>pyRevit</Application></Properties>"))
+
+        workbook = [_XML_HEAD, u'<workbook xmlns="{0}" xmlns:r="{1}"><sheets>'.format(_NS_MAIN, _NS_REL)]
+        rels = [_XML_HEAD, u'<Relationships xmlns="{0}">'.format(_NS_PKG_REL)]
+        defined = []
+        for sheet in sheets:
+            workbook.append(u'<sheet name="{0}" sheetId="{1}" r:id="rId{1}"/>'.format(
+                _x(sheet.name).replace(u'"', u"&quot;"), sheet.index))
+            rels.append(u'<Relationship Id="rId{0}" Type="{1}/worksheet" Target="worksheets/sheet{0}.xml"/>'.format(
+                sheet.index, _NS_REL))
+            if sheet._autofilter:
+                defined.append(
+                    u'<definedName name="_xlnm._FilterDatabase" localSheetId="{0}" hidden="1">'
+                    u"'{1}'!{2}</definedName>".format(
+                        sheet.index - 1, _x(sheet.name).replace(u"'", u"''"), sheet.filter_ref_absolute))
+        workbook.append(u"</sheets>")
+        if defined:
+            workbook.append(u"<definedNames>{0}</definedNames>".format(u"".join(defined)))
+        workbook.append(u"</workbook>")
+        n = len(sheets) + 1
+        rels.append(u'<Relationship Id="rId{0}" Type="{1}/styles" Target="styles.xml"/>'.format(n, _NS_REL))
+        rels.append(u'<Relationship Id="rId{0}" Type="{1}/sharedStrings" Target="sharedStrings.xml"/>'.format(
+            n + 1, _NS_REL))
+        rels.append(u"</Relationships>")
+        self._part("xl/workbook.xml", u"".join(workbook))
+        self._part("xl/_rels/workbook.xml.rels", u"".join(rels))
+        self._part("xl/styles.xml", self._styles_xml())
+
+        stream = _EntryStream(self._zip, "xl/sharedStrings.xml")
+        try:
+            count = len(self._string_list)
+            stream.write(_XML_HEAD + u'<sst xmlns="{0}" count="{1}" uniqueCount="{1}">'.format(_NS_MAIN, count))
+            for start in range(0, count, _FLUSH_ROWS):
+                stream.write(u"".join(
+                    u'<si><t xml:space="preserve">{0}</t></si>'.format(_x(text))
+                    for text in self._string_list[start:start + _FLUSH_ROWS]))
+            stream.write(u"</sst>")
+        finally:
+            stream.close()
+
+    @staticmethod
+    def _styles_xml():
+        custom = sorted(set((fmt_id, code) for _, fmt_id, code, _ in STYLES if code))
+        xml = [_XML_HEAD, u'<styleSheet xmlns="{0}">'.format(_NS_MAIN)]
+        xml.append(u'<numFmts count="{0}">{1}</numFmts>'.format(len(custom), u"".join(
+            u'<numFmt numFmtId="{0}" formatCode="{1}"/>'.format(fmt_id, _x(code)) for fmt_id, code in custom)))
+        xml.append(u'<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+                   u'<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>')
+        xml.append(u'<fills count="2"><fill><patternFill patternType="none"/></fill>'
+                   u'<fill><patternFill patternType="gray125"/></fill></fills>')
+        xml.append(u'<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>')
+        xml.append(u'<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>')
+        xml.append(u'<cellXfs count="{0}">'.format(len(STYLES)))
+        for _, fmt_id, _, bold in STYLES:
+            xml.append(u'<xf numFmtId="{0}" fontId="{1}" fillId="0" borderId="0" xfId="0"{2}{3}/>'.format(
+                fmt_id, 1 if bold else 0,
+                u' applyNumberFormat="1"' if fmt_id else u"",
+                u' applyFont="1"' if bold else u""))
+        xml.append(u"</cellXfs>")
+        xml.append(u'<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>')
+        xml.append(u"</styleSheet>")
+        return u"".join(xml)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Проверки ``tartip.shared_params`` вне Revit.
+
+Документ и элементы Revit заменены простыми объектами с теми же
+атрибутами. Запуск из папки расширения::
+
+    python -m unittest discover -s tests
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import types
+import unittest
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+if LIB_DIR not in sys.path:
+    sys.path.insert(0, LIB_DIR)
+
+
+class _SharedParameterElement(object):
+    def __init__(self, name, guid):
+        self.Name = name
+        self.GuidValue = guid
+
+
+class _Collector(object):
+    def __init__(self, doc):
+        self.doc = doc
+
+    def OfClass(self, cls):
+        return iter(self.doc.shared)
+
+
+class _Bindings(object):
+    def ForwardIterator(self):
+        raise RuntimeError(u"нет привязок")
+
+
+class _Doc(object):
+    def __init__(self, shared):
+        self.shared = shared
+        self.ParameterBindings = _Bindings()
+
+
+class _Param(object):
+    IsReadOnly = False
+
+    def __init__(self, label):
+        self.label = label
+
+
+class _Holder(object):
+    """Элемент (тип): параметры по GUID и по имени."""
+
+    def __init__(self, by_guid=None, by_name=None):
+        self.by_guid = by_guid or {}
+        self.by_name = by_name or {}
+
+    def get_Parameter(self, guid):
+        return self.by_guid.get(guid)
+
+    def LookupParameter(self, name):
+        return self.by_name.get(name)
+
+
+def _import_shared_params():
+    try:
+        import pyrevit  # noqa: F401
+    except ImportError:
+        pyrevit = types.ModuleType("pyrevit")
+        pyrevit.DB = type("DB", (object,), {"FilteredElementCollector": _Collector,
+                                            "SharedParameterElement": _SharedParameterElement})
+        sys.modules["pyrevit"] = pyrevit
+    from tartip import shared_params
+    return shared_params
+
+
+shared_params = _import_shared_params()
+RATE = u"ACBD_Стоимость_за_ед"
+
+
+class ParameterIndexGetTest(unittest.TestCase):
+
+    def _index(self, shared):
+        return shared_params.ParameterIndex(_Doc(shared), [RATE])
+
+    def test_reads_by_guid(self):
+        index = self._index([_SharedParameterElement(RATE, "guid-a")])
+        holder = _Holder(by_guid={"guid-a": _Param("guid")}, by_name={RATE: _Param("name")})
+        self.assertEqual(index.get(holder, RATE).label, "guid")
+
+    def test_falls_back_to_name_without_shared_parameter(self):
+        index = self._index([])
+        holder = _Holder(by_name={RATE: _Param("name")})
+        self.assertEqual(index.get(holder, RATE).label, "name")
+
+    def test_falls_back_to_name_when_holder_lacks_guid(self):
+        # в документе есть общий параметр, а у типа — одноимённый параметр семейства
+        index = self._index([_SharedParameterElement(RATE, "guid-a"),
+                             _SharedParameterElement(u" acbd_стоимость_за_ед ", "guid-b")])
+        self.assertTrue(index.is_shared(RATE))
+        holder = _Holder(by_name={RATE: _Param("family")})
+        self.assertEqual(index.get(holder, RATE).label, "family")
+
+    def test_missing_everywhere(self):
+        index = self._index([_SharedParameterElement(RATE, "guid-a")])
+        self.assertIsNone(index.get(_Holder(), RATE))
+        self.assertIsNone(index.get(None, RATE))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Проверки ``tartip.xlsx_writer``: прерванная запись и таблица общих строк.
+
+Запуск из папки расширения::
+
+    python -m unittest discover -s tests
+"""
+from __future__ import absolute_import
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+from xml.etree import ElementTree
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+if LIB_DIR not in sys.path:
+    sys.path.insert(0, LIB_DIR)
+
+from tartip import xlsx_writer  # noqa: E402
+
+_NS = u"{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def _cells(path):
+    """[(тип ячейки, текст)] первого листа."""
+
+    with zipfile.ZipFile(path) as zf:
+        shared = [si.findtext(_NS + u"t")
+                  for si in ElementTree.fromstring(zf.read("xl/sharedStrings.xml")).iter(_NS + u"si")]
+        sheet = ElementTree.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+    result = []
+    for cell in sheet.iter(_NS + u"c"):
+        kind = cell.get("t")
+        if kind == "s":
+            result.append((kind, shared[int(cell.findtext(_NS + u"v"))]))
+        else:
+            result.append((kind, cell.find(_NS + u"is").findtext(_NS + u"t")))
+    return result
+
+
+class XlsxWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, u"book.xlsx")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_error_inside_with_propagates_and_removes_file(self):
+        with self.assertRaises(KeyError):
+            with xlsx_writer.XlsxWriter(self.path) as book:
+                sheet = book.add_sheet(u"Лист", [(u"ID", "int")])
+                sheet.write_row([1])
+                raise KeyError(u"исходная ошибка")
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_strings_over_limit_are_inline(self):
+        with xlsx_writer.XlsxWriter(self.path, shared_limit=2) as book:
+            sheet = book.add_sheet(u"Лист", [(u"Текст", "text")])
+            for text in (u"a", u"b", u"c & d", u"a"):
+                sheet.write_row([text])
+        self.assertEqual(_cells(self.path), [
+            ("s", u"Текст"), ("s", u"a"), ("inlineStr", u"b"), ("inlineStr", u"c & d"), ("s", u"a"),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()